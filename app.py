@@ -1,11 +1,15 @@
 from hivclinic import create_app
+from hivclinic.cli import benchmark
 from hivclinic.cli import icd10
+from hivclinic.cli import jobs
 from hivclinic.cli import patient_import
 
 
 app = create_app()
 icd10.register(app)
 patient_import.register(app)
+benchmark.register(app)
+jobs.register(app)
 
 if __name__ == "__main__":
     app.run()
@@ -3,6 +3,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_marshmallow import Marshmallow
+from redis import Redis
+from rq import Queue
 from hivclinic.helpers.custom_converters.date_convertor import DateConverter
 
 
@@ -36,6 +38,22 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     ma.init_app(app)
 
+    # task queue for report jobs, run by "flask jobs worker"
+    if app.config["FAKE_REDIS"]:
+        # only needed by the tests
+        from fakeredis import FakeStrictRedis
+
+        app.redis = FakeStrictRedis()
+
+    else:
+        app.redis = Redis.from_url(app.config["REDIS_URL"])
+
+    app.task_queue = Queue(
+        "hivclinic-tasks",
+        connection=app.redis,
+        is_async=app.config["RQ_ASYNC"],
+    )
+
     # add custom url converter
     app.url_map.converters["date"] = DateConverter
 
@@ -46,10 +64,22 @@ def create_app(config_class=Config):
     from hivclinic.models.investigation_model import InvestigationModel  # noqa
     from hivclinic.models.appointment_model import AppointmentModel  # noqa
     from hivclinic.models.icd10_model import ICD10Model  # noqa
+    from hivclinic.models.patient_summary_model import (  # noqa
+        PatientSummaryModel,
+    )
+    from hivclinic.models.statistics_rollup_model import (  # noqa
+        StatisticsRollupModel,
+    )
 
     # namespaces
     from hivclinic.namespaces import api  # noqa
 
     api.init_app(app)
 
+    # so the first icd10 search does not wait for the index
+    if app.config["ICD10_INDEX_WARM_UP"]:
+        from hivclinic.helpers.icd10_index.icd10_index import warmICD10Index
+
+        warmICD10Index(app)
+
     return app
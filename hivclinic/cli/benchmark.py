@@ -0,0 +1,601 @@
+import glob
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import func, text
+
+from hivclinic import db
+from hivclinic.helpers.data_dict_maker.data_dict_maker import (
+    SUMMARY_QUERY_ENGINES,
+    dataDictMaker,
+)
+from hivclinic.helpers.medication_classifier.medication_classifier import (
+    MEDICATION_CLASSIFIERS,
+)
+from hivclinic.helpers.patient_importer.hcis_importer import PARSER_BACKENDS
+from hivclinic.helpers.overview_statistics.overview_statistics import (
+    OVERVIEW_ENGINES,
+)
+from hivclinic.helpers.patient_summary.patient_summary import (
+    refreshPatientSummary,
+)
+from hivclinic.models.appointment_model import AppointmentModel
+from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.models.partner_model import PartnerModel
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.visit_model import VisitModel
+
+BATCH_SIZE = 5000
+
+INDEXED_MODELS = (
+    VisitModel,
+    InvestigationModel,
+    AppointmentModel,
+    PartnerModel,
+)
+
+ARV_REGIMENS = [
+    ["TENO-EM", "Efavirenz (600)"],
+    ["Teevir"],
+    ["Tenofovir", "Lamivudine", "Efavirenz (600)"],
+    ["Zilarvir [AZT(300)/3TC(150)]", "Nevirapine"],
+    ["GPO-VIR S30"],
+]
+
+IMPRESSIONS = [
+    "B20: Human immunodeficiency virus [HIV] disease",
+    "A159: Respiratory tuberculosis unspecified",
+    "A539: Syphilis, unspecified",
+    "B373: Candidiasis of vulva and vagina",
+    "J189: Pneumonia, unspecified",
+]
+
+# medication names as HCIS lists them
+MEDICATION_NAMES = [
+    "TEEVIR (TDF300+FTC200+EFV600) tab",
+    "TENO-EM (TDF300+FTC200) tab",
+    "(PEP) TENO-EM (TDF300+FTC200) tab",
+    "PrEP (TDF300+FTC200) tab",
+    "Efavirenz 600 mg tab",
+    "Efavirenz 200 mg tab",
+    "TENOFOVIR 300 mg tab",
+    "Lamivudine 150 mg tab",
+    "LAMIVIR 150 mg tab",
+    "Abacavir 300 mg tab",
+    "Raltegravir 400 mg tab",
+    "Zidovudine 300 mg cap",
+    "ZILARVIR (AZT300+3TC150) tab",
+    "Combivir tab",
+    "Nevirapine 200 mg tab",
+    "Lopinavir/Ritonavir 200/50 mg tab",
+    "GPO-VIR Z250 tab",
+    "GPO-VIR S30 tab",
+    "(PEP) Rilpivirine 25 mg tab",
+    "Rilpivirine 25 mg tab",
+    "TDF300+3TC300+EFV600 tab",
+    "Azithromycin 250 mg tab",
+    "Fluconazole 200 mg cap",
+    "Co-Trimoxazole 80/400 mg tab",
+    "Rifampicin 300 mg cap",
+    "Ethambutol 400 mg tab",
+    "Isoniazid 100 mg tab",
+    "Pyrazinamide 500 mg tab",
+    "Levofloxacin 500 mg tab",
+    "Benzathine Penicillin G 1.2 MU inj",
+    "Paracetamol 500 mg tab",
+    "Vitamin B complex tab",
+    "Chlorpheniramine 4 mg tab",
+    "Simvastatin 20 mg tab",
+    "Omeprazole 20 mg cap",
+]
+
+
+def insertInBatches(Model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(
+            Model.__table__.insert(), rows[start : start + BATCH_SIZE]  # noqa
+        )
+
+
+def seedSyntheticCohort(patients: int, seed: int = 0):
+    """Insert a synthetic cohort into the current session.
+
+    Every patient gets a handful of visits and investigations spread over
+    the last ten years, some with ARV prescriptions, CD4 and VL results,
+    and a few appointments around today.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+
+    patient_rows = []
+    visit_rows = []
+    investigation_rows = []
+    partner_rows = []
+    appointment_rows = []
+
+    for n in range(patients):
+        patient_id = uuid.uuid4()
+        register_date = today - timedelta(days=rng.randint(30, 3650))
+
+        patient_rows.append(
+            {
+                "id": patient_id,
+                "hn": f"BENCH-{seed}-{n}",
+                "clinicID": f"BENCH-{seed}-{n}",
+                "name": f"Synthetic Patient {n}",
+                "dateOfBirth": date(rng.randint(1950, 2005), 1, 1),
+                "sex": rng.choice(["Male", "Female"]),
+                "gender": rng.choice(["Male", "Female", "MSM", "TG"]),
+                "nationality": rng.choice(["ไทย", "ไทย", "ไทย", "พม่า"]),
+                "healthInsurance": rng.choice(
+                    ["ชำระเงินเอง", "สิทธิประกันสังคม", "บัตรทอง"]
+                ),
+                "riskBehaviors": [rng.choice(["MSM", "IVDU", "Hetero"])],
+            }
+        )
+
+        regimen = rng.choice(ARV_REGIMENS)
+        arv_start = rng.randint(0, 3)
+
+        for v in range(rng.randint(1, 12)):
+            visit_rows.append(
+                {
+                    "id": uuid.uuid4(),
+                    "patientID": patient_id,
+                    "date": register_date + timedelta(days=90 * v),
+                    "impression": rng.sample(IMPRESSIONS, rng.randint(0, 2)),
+                    "arvMedications": regimen if v >= arv_start else [],
+                    "imported": rng.random() < 0.5,
+                }
+            )
+
+        for i in range(rng.randint(1, 8)):
+            investigation_rows.append(
+                {
+                    "id": uuid.uuid4(),
+                    "patientID": patient_id,
+                    "date": register_date + timedelta(days=180 * i),
+                    "antiHIV": "Positive" if i == 0 else None,
+                    "absoluteCD4": (
+                        rng.uniform(20, 1200) if rng.random() < 0.5 else None
+                    ),
+                    "percentCD4": rng.uniform(1, 40),
+                    "viralLoad": (
+                        rng.choice([-1, 40, 500, 20000])
+                        if rng.random() < 0.5
+                        else None
+                    ),
+                    "imported": rng.random() < 0.5,
+                }
+            )
+
+        for _ in range(rng.randint(0, 2)):
+            partner_rows.append(
+                {
+                    "id": uuid.uuid4(),
+                    "patientID": patient_id,
+                    "sex": rng.choice(["Male", "Female"]),
+                }
+            )
+
+        for _ in range(rng.randint(0, 2)):
+            appointment_rows.append(
+                {
+                    "id": uuid.uuid4(),
+                    "patientID": patient_id,
+                    "date": today + timedelta(days=rng.randint(-60, 60)),
+                    "appointmentFor": "Follow-up",
+                }
+            )
+
+    insertInBatches(PatientModel, patient_rows)
+    insertInBatches(VisitModel, visit_rows)
+    insertInBatches(InvestigationModel, investigation_rows)
+    insertInBatches(PartnerModel, partner_rows)
+    insertInBatches(AppointmentModel, appointment_rows)
+
+    # let the planner see the new row counts
+    for Model in (PatientModel,) + INDEXED_MODELS:
+        db.session.execute(f"ANALYZE {Model.__tablename__}")
+
+    return {
+        "patients": len(patient_rows),
+        "visits": len(visit_rows),
+        "investigations": len(investigation_rows),
+        "partners": len(partner_rows),
+        "appointments": len(appointment_rows),
+    }
+
+
+@contextmanager
+def syntheticCohort(patients: int, seed: int = 0):
+    """Provide a synthetic cohort that is rolled back on exit.
+
+    db.session is bound to one outer transaction for the duration, so
+    code reading through db.session.bind (e.g. pd.read_sql) sees the
+    synthetic rows, while commits inside never reach the database.
+    """
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    session = db.session
+
+    db.session = db.create_scoped_session(
+        options={"bind": connection, "binds": {}}
+    )
+
+    try:
+        yield seedSyntheticCohort(patients, seed)
+
+    finally:
+        db.session.remove()
+        db.session = session
+
+        transaction.rollback()
+        connection.close()
+
+
+def timeIt(fnc, repeat: int):
+    """Run fnc repeat times, return the fastest time and the last result."""
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fnc()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+def peakMemory(fnc):
+    """Run fnc once, return the peak memory it allocated in bytes."""
+    tracemalloc.start()
+
+    try:
+        fnc()
+        _, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def indexBenchmarks(sample: int):
+    """Timed cases for the lookups served by the clinical indexes."""
+    client = current_app.test_client()
+
+    patientIDs = [
+        row.id
+        for row in db.session.query(PatientModel.id)
+        .filter(PatientModel.hn.like("BENCH-%"))
+        .order_by(func.random())
+        .limit(sample)
+    ]
+    imported = (
+        db.session.query(InvestigationModel.patientID, InvestigationModel.date)
+        .filter(InvestigationModel.imported == True)  # noqa
+        .order_by(func.random())
+        .limit(sample)
+        .all()
+    )
+    visit_day = date.today() - timedelta(days=365)
+    appointment_day = date.today()
+
+    def subcollections():
+        for patientID in patientIDs:
+            for subcollection in (
+                "visits",
+                "investigations",
+                "appointments",
+                "partners",
+            ):
+                client.get(f"/patient/{patientID}/{subcollection}")
+
+    # the lookups of patient_import
+    def importLookups():
+        for patientID, ix_date in imported:
+            InvestigationModel.query.filter(
+                InvestigationModel.imported == True  # noqa
+            ).filter(InvestigationModel.patientID == patientID).filter(
+                InvestigationModel.date == ix_date
+            ).first()
+
+    return {
+        "visit day list": lambda: client.get(f"/patient/visit/{visit_day}"),
+        # the query of /patient/appointment/<date>, whose response cannot
+        # be serialized yet as it holds the patient ids as UUID objects
+        "appointment day list": lambda: db.session.query(AppointmentModel)
+        .join(PatientModel)
+        .order_by(PatientModel.clinicID)
+        .filter(AppointmentModel.date == appointment_day)
+        .all(),
+        "subcollection lists": subcollections,
+        "import lookups": importLookups,
+        "summary refresh": lambda: refreshPatientSummary(patientIDs),
+        "data dict": lambda: dataDictMaker(useSummaryTable=False),
+    }
+
+
+class SavedPageWait(object):
+    """Stands in for WebDriverWait, a saved page has nothing to wait for."""
+
+    def until(self, method):
+        return True
+
+
+# the page source parsers, called as HCISImporter calls them
+HCIS_PAGE_PARSERS = {
+    "readHN": lambda parsers, page: parsers.readHN(page),
+    "praseHN": lambda parsers, page: parsers.praseHN(page),
+    "praseVisits": lambda parsers, page: parsers.praseVisits(page),
+    "praseMedication": lambda parsers, page: parsers.praseMedication(
+        page, SavedPageWait()
+    ),
+    "praseInvestigation": lambda parsers, page: parsers.praseInvestigation(
+        page, SavedPageWait()
+    ),
+    "praseDermographic": lambda parsers, page: parsers.praseDermographic(
+        page, "HN"
+    ),
+    "praseDermographicTab2": lambda parsers, page: (
+        parsers.praseDermographicTab2(page)
+    ),
+}
+
+
+def parseSavedPage(parsers, parser, page):
+    """Result of a parser on a page, or None if it does not parse it."""
+    try:
+        return ("ok", HCIS_PAGE_PARSERS[parser](parsers, page))
+
+    except Exception:
+        return None
+
+
+def medicationLists(lists: int, seed: int = 0):
+    """Synthetic visit medication lists of 0 to 8 HCIS medication names."""
+    rng = random.Random(seed)
+
+    return [
+        sorted(rng.sample(MEDICATION_NAMES, rng.randint(0, 8)))
+        for _ in range(lists)
+    ]
+
+
+def register(app):
+    @app.cli.group()
+    def benchmark():
+        """Benchmark related commands."""
+        pass
+
+    @benchmark.command()
+    @click.option("--patients", default=50000, help="Synthetic patients.")
+    @click.option("--repeat", default=3, help="Runs per engine.")
+    @click.option(
+        "--engine",
+        "engines",
+        multiple=True,
+        type=click.Choice(list(SUMMARY_QUERY_ENGINES)),
+        help="Engines to compare, all by default.",
+    )
+    def datadict(patients, repeat, engines):
+        """Compare data dict engines on a synthetic cohort
+
+        Every engine runs on the same cohort. Rows an engine builds
+        differently than the first one are counted, which should stay at
+        zero.
+        """
+        if current_app.config["PRODUCTION"]:
+            current_app.logger.error(
+                "This function only works in developent/testing mode only."
+            )
+            return
+
+        with syntheticCohort(patients) as counts:
+            click.echo(
+                "Seeded {patients} patients, {visits} visits, "
+                "{investigations} investigations, "
+                "{partners} partners.".format(**counts)
+            )
+
+            expected = None
+
+            for engine in engines or SUMMARY_QUERY_ENGINES:
+                seconds, df = timeIt(
+                    lambda: dataDictMaker(
+                        useSummaryTable=False, engine=engine
+                    ),
+                    repeat,
+                )
+                rows = set(map(tuple, df.astype(str).values))
+
+                if expected is None:
+                    expected = rows
+
+                click.echo(
+                    f"{engine:>10}: {seconds:.3f} s, {len(df.index)} rows, "
+                    f"{len(rows - expected)} mismatches"
+                )
+
+    @benchmark.command()
+    @click.option("--patients", default=50000, help="Synthetic patients.")
+    @click.option("--repeat", default=3, help="Runs per engine.")
+    @click.option(
+        "--engine",
+        "engines",
+        multiple=True,
+        type=click.Choice(list(OVERVIEW_ENGINES)),
+        help="Engines to compare, all by default.",
+    )
+    def overview(patients, repeat, engines):
+        """Compare overview statistics engines on a synthetic cohort"""
+        if current_app.config["PRODUCTION"]:
+            current_app.logger.error(
+                "This function only works in developent/testing mode only."
+            )
+            return
+
+        with syntheticCohort(patients) as counts:
+            click.echo(
+                "Seeded {patients} patients, {visits} visits, "
+                "{investigations} investigations, "
+                "{partners} partners.".format(**counts)
+            )
+
+            df = dataDictMaker(joinArrayBy=",", useSummaryTable=False)
+
+            for engine in engines or OVERVIEW_ENGINES:
+                # the legacy engine modifies the frame it is given
+                def run():
+                    return OVERVIEW_ENGINES[engine](df.copy(), ",")
+
+                seconds, _ = timeIt(run, repeat)
+                peak = peakMemory(run)
+
+                click.echo(
+                    f"{engine:>10}: {seconds:.3f} s, "
+                    f"peak {peak / 2 ** 20:.1f} MiB"
+                )
+
+    @benchmark.command()
+    @click.option("--patients", default=50000, help="Synthetic patients.")
+    @click.option("--repeat", default=3, help="Runs per case.")
+    @click.option("--sample", default=50, help="Patients per lookup case.")
+    def indexes(patients, repeat, sample):
+        """Time the indexed lookups with and without their indexes
+
+        The indexes are dropped inside the rolled back transaction of the
+        synthetic cohort, which locks the tables until the run ends.
+        """
+        if current_app.config["PRODUCTION"]:
+            current_app.logger.error(
+                "This function only works in developent/testing mode only."
+            )
+            return
+
+        with syntheticCohort(patients) as counts:
+            click.echo(
+                "Seeded {patients} patients, {visits} visits, "
+                "{investigations} investigations, {partners} partners, "
+                "{appointments} appointments.".format(**counts)
+            )
+
+            cases = indexBenchmarks(sample)
+            indexed = {
+                name: timeIt(fnc, repeat)[0] for name, fnc in cases.items()
+            }
+
+            for Model in INDEXED_MODELS:
+                for index in Model.__table__.indexes:
+                    db.session.execute(
+                        text(f'DROP INDEX IF EXISTS "{index.name}"')
+                    )
+
+                db.session.execute(f"ANALYZE {Model.__tablename__}")
+
+            for name, fnc in cases.items():
+                seconds, _ = timeIt(fnc, repeat)
+                click.echo(
+                    f"{name:>20}: {seconds:.4f} s -> {indexed[name]:.4f} s "
+                    f"({seconds / indexed[name]:.1f}x)"
+                )
+
+    @benchmark.command()
+    @click.option("--lists", default=100000, help="Medication lists.")
+    @click.option("--repeat", default=3, help="Runs per classifier.")
+    def medications(lists, repeat):
+        """Compare the medication classifiers on synthetic lists
+
+        Lists classified differently than by the legacy classifier are
+        counted, which should stay at zero.
+        """
+        medication_lists = medicationLists(lists)
+        expected = None
+
+        for name, fnc in MEDICATION_CLASSIFIERS.items():
+            seconds, results = timeIt(
+                lambda: [fnc(medications) for medications in medication_lists],
+                repeat,
+            )
+
+            if expected is None:
+                expected = results
+
+            mismatches = sum(
+                result != legacy for result, legacy in zip(results, expected)
+            )
+
+            click.echo(
+                f"{name:>10}: {seconds:.3f} s, "
+                f"{lists / seconds:.0f} lists/s, {mismatches} mismatches"
+            )
+
+    @benchmark.command()
+    @click.argument("pages_path")
+    @click.option("--repeat", default=3, help="Runs per backend.")
+    def hcisparsers(pages_path, repeat):
+        """Compare the HCIS page parser backends on saved pages
+
+        Every parser is run on every page saved in pages_path (.htm or
+        .html, e.g. driver.page_source written to a file), the pages a
+        parser fails on with both backends are left out. Pages parsed
+        differently by the backends are counted as mismatches.
+        """
+        page_paths = sorted(
+            glob.glob(os.path.join(pages_path, "*.htm"))
+            + glob.glob(os.path.join(pages_path, "*.html"))
+        )
+        pages = []
+
+        for page_path in page_paths:
+            with open(page_path, "r", encoding="utf-8") as file:
+                pages.append(file.read())
+
+        click.echo(f"Read {len(pages)} pages.")
+
+        for parser in HCIS_PAGE_PARSERS:
+            results = {
+                backend: [
+                    parseSavedPage(parsers, parser, page) for page in pages
+                ]
+                for backend, parsers in PARSER_BACKENDS.items()
+            }
+            parsed = [
+                page
+                for n, page in enumerate(pages)
+                if any(results[backend][n] for backend in results)
+            ]
+            mismatches = sum(
+                len(set(map(repr, page_results))) > 1
+                for page_results in zip(*results.values())
+                if any(page_results)
+            )
+
+            if not parsed:
+                click.echo(f"{parser:>22}: no pages")
+                continue
+
+            timings = []
+            for backend, parsers in PARSER_BACKENDS.items():
+                seconds, _ = timeIt(
+                    lambda: [
+                        parseSavedPage(parsers, parser, page)
+                        for page in parsed
+                    ],
+                    repeat,
+                )
+                timings.append(
+                    f"{backend} {seconds / len(parsed) * 1000:.2f} ms"
+                )
+
+            click.echo(
+                f"{parser:>22}: {len(parsed)} pages, "
+                f"{', '.join(timings)} per page, {mismatches} mismatches"
+            )
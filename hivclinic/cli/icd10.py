@@ -1,8 +1,17 @@
-from hivclinic.models.icd10_model import ICD10Model
-from hivclinic import db
-import json
+import time
+
+import click
 from flask import current_app
 
+from hivclinic import db
+from hivclinic.helpers.icd10_loader.icd10_loader import (
+    ICD10_FILE,
+    loadICD10,
+    readICD10File,
+    syncICD10,
+)
+from hivclinic.models.icd10_model import ICD10Model
+
 
 def register(app):
     @app.cli.group()
@@ -25,21 +34,40 @@ def register(app):
             )
 
     @icd10.command()
-    def init():
+    @click.option("--file", "path", default=ICD10_FILE, help="ICD10 JSON.")
+    def init(path):
         """ Init ICD10 database """
-        with open("./hivclinic/data/icd10.json") as file:
-            icd10_dict = json.load(file)
+        if bool(ICD10Model.query.first()):
+            current_app.logger.error("Table is not empty, abort ICD10 import.")
+            return
 
-        if not bool(ICD10Model.query.first()):
-            for icd10_entry in icd10_dict:
-                current_app.logger.info(
-                    "Importing ICD10 -- {}".format(icd10_entry["icd10"])
-                )
+        entries = readICD10File(path)
 
-                icd10 = ICD10Model(**icd10_entry)
-                db.session.add(icd10)
+        start = time.perf_counter()
+        inserted = loadICD10(entries)
+        db.session.commit()
+        elapsed = time.perf_counter() - start
 
-            db.session.commit()
+        current_app.logger.info(
+            "Imported {} ICD10 entries in {:.2f} s ({:.0f} rows/s).".format(
+                inserted, elapsed, len(entries) / elapsed
+            )
+        )
 
-        else:
-            current_app.logger.error("Table is not empty, abort ICD10 import.")
+    @icd10.command()
+    @click.option("--file", "path", default=ICD10_FILE, help="ICD10 JSON.")
+    def refresh(path):
+        """Sync ICD10 database to a newer code list"""
+        entries = readICD10File(path)
+
+        start = time.perf_counter()
+        changes = syncICD10(entries)
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+
+        current_app.logger.info(
+            "Synced {} ICD10 entries in {:.2f} s ({:.0f} rows/s): "
+            "{updated} updated, {inserted} inserted, {deleted} deleted.".format(
+                len(entries), elapsed, len(entries) / elapsed, **changes
+            )
+        )
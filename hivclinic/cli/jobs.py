@@ -0,0 +1,16 @@
+from flask import current_app
+from rq import Connection, Worker
+
+
+def register(app):
+    @app.cli.group()
+    def jobs():
+        """Report job related commands."""
+        pass
+
+    @jobs.command()
+    def worker():
+        """Run a worker for the report jobs"""
+        # jobs are run inside the app context of this command
+        with Connection(current_app.redis):
+            Worker([current_app.task_queue]).work()
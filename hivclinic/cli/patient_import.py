@@ -1,58 +1,26 @@
-import json
-import re
+import time
 
 import click
 import pandas as pd
 from flask import current_app
 
 from hivclinic import db
-from hivclinic.models.investigation_model import InvestigationModel
-from hivclinic.models.visit_model import VisitModel
+from hivclinic.helpers.patient_importer.batch_importer import (
+    PATIENT_BATCH_SIZE,
+    BatchImporter,
+    importViralLoads,
+)
+from hivclinic.helpers.patient_importer.jsonl_store import (
+    compactRecords,
+    readRecords,
+)
+from hivclinic.helpers.patient_summary.patient_summary import (
+    rebuildPatientSummary,
+)
+from hivclinic.helpers.statistics_rollup.statistics_rollup import (
+    refreshStatisticsRollup,
+)
 from hivclinic.models.patient_model import PatientModel
-from hivclinic.schemas.investigation_schema import InvestigationSchema
-from hivclinic.schemas.patient_schema import PatientSchema
-from hivclinic.schemas.visit_schema import VisitSchema
-
-
-ARV_MED_REGEX = [
-    ["Teevir", r"TEEVIR"],
-    ["TENO-EM", r"(?<!\(PEP\))TENO-EM"],
-    ["Efavirenz (600)", r"Efavirenz.600"],
-    ["Efavirenz (200/400mg)", r"Efavirenz.200"],
-    ["Tenofovir", r"TENOFOVIR"],
-    ["Lamivudine", r"Lamivudine"],
-    ["Abacavir", r"Abacavir"],
-    ["Raltegravir", r"Raltegravir"],
-    ["Zidovudine", r"Zidovudine|zidovudine"],
-    ["Zilarvir [AZT(300)/3TC(150)]", r"ZILARVIR|Zilavir"],
-    ["Combivir [AZT(300)/3TC(150)]", r"Combivir"],
-    ["Nevirapine", r"Nevirapine"],
-    ["Lopinavir", r"Lopinavir"],
-    ["GPO-VIR Z250", r"GPO-VIR.Z250"],
-    ["GPO-VIR S30", r"GPO-VIR.S30"],
-    ["Rilpivirine", r"(?<!\(PEP\))Rilpivirine"],
-    ["TDF300+FTC200", r"(?<!PrEP)\(TDF300\+FTC200\)"],
-    ["TDF300+3TC300+EFV600", r"TDF300\+3TC300\+EFV600"],
-    ["Lamivudine", r"LAMIVIR"],
-]
-
-OI_MED_REGEX = [
-    ["Azithromycin", r"Azithromycin"],
-    ["Fluconazole", r"Fluconazole"],
-    ["Bactrim", r"Co-Trimoxazole"],
-]
-
-TB_MED_REGEX = [
-    ["Rifampicin", r"Rifampicin"],
-    ["Ethambutol", r"Ethambutol"],
-    ["Isoniazid", r"(?:Isoniazid|i\.n\.h)"],
-    ["Pyrazinamide", r"Pyrazinamide"],
-    ["Kanamycin", r"Kanamycin"],
-    ["Gentamicin", r"Gentamicin"],
-    ["Ethionamide", r"Ethionamide"],
-    ["Cycloserine", r"Cycloserine"],
-    ["Levofloxacin", r"Levofloxacin"],
-]
 
 
 def register(app):
@@ -75,360 +43,85 @@ def register(app):
                 "This function only works in developent/testing mode only."
             )
 
-    def convertToDate(date_str: str):
-        date_str = date_str.split(" ")[0]
-
-        thai_date_regex = r"(\d+)\/(\d+)\/(\d+)"
-        match = re.search(thai_date_regex, date_str)
-
-        if match:
-            day, month, year = match.groups()
-            year = int(year)
-
-            if year >= 2100:
-                year = year - 543
-
-            date_str = f"{year}-{month}-{day}"
-
-        return date_str
-
-    def patch_patient(patient_data):
-        patient_data["dateOfBirth"] = convertToDate(
-            patient_data["dateOfBirth"]
-        )
-
-        patient_schema = PatientSchema(many=False, unknown="EXCLUDE")
-
-        patient = PatientModel.query.filter(
-            PatientModel.hn == patient_data["hn"]
-        ).first()
-
-        try:
-            if patient:
-                patient_data["id"] = patient.id
-                new_patient_model = patient_schema.load(
-                    patient_data, transient=True
-                )
-                new_patient_dict = patient_schema.dump(new_patient_model)
-                patient.update(**new_patient_dict)
-
-            else:
-                patient = patient_schema.load(patient_data)
-
-            patient.imported = True
-
-            return patient
-
-        except Exception as e:
-            current_app.logger.warn(
-                f"Unable to import patient HN {patient_data['hn']}"
-                f" with this error {e}, skipping."
-            )
-
-            raise e
-
-    def replace_vl(vl_string):
-        if "< " in vl_string:
-            return -1
-
-        elif "FAILED" in vl_string:
-            return None
-
-        else:
-            return int(vl_string)
+    @patient.command()
+    def summary():
+        """Rebuild patient summary table"""
+        rebuildPatientSummary()
+        db.session.commit()
 
-    def convert_hn(hn_string):
-        # convert 18-612802282 to 2282/61-28
-        regex_string = r"18-([\d]{2})([\d]{2})([\d]*)"
-        match = re.search(regex_string, hn_string)
+        current_app.logger.info("Patient summary table rebuilt.")
 
-        try:
-            hn = (
-                f"{match.group(3).lstrip('0')}/"
-                f"{match.group(1)}-{match.group(2)}"
-            )
-            return hn
+    @patient.command()
+    def rollup():
+        """Rebuild overview statistics rollup table"""
+        refreshStatisticsRollup()
+        db.session.commit()
 
-        except Exception:
-            return None
+        current_app.logger.info("Statistics rollup table rebuilt.")
 
     @patient.command()
     @click.argument("xlsx_path")
     def importvl(xlsx_path):
         """Import VL from xlsx file"""
-        cols = ["Requested Date", "HN", "VL Result"]
-
         excel_df = pd.read_excel(xlsx_path)
 
-        vl_df = excel_df[cols]
-        vl_df.loc[:, "VL Result"] = vl_df["VL Result"].apply(replace_vl)
-        vl_df.loc[:, "HN"] = vl_df["HN"].apply(convert_hn)
-        vl_df = vl_df.dropna(how="any")
-
-        vl_list = vl_df.values.tolist()
-
-        # add ix
-        for vl_item in vl_list:
-            vl_date, vl_hn, vl_result = vl_item
-
-            patient_id = (
-                db.session.query(PatientModel.id)
-                .filter(PatientModel.hn == vl_hn)
-                .first()
-            )
-
-            if patient_id is not None:
-                # find previous data
-                ix_model = (
-                    InvestigationModel.query.filter(
-                        InvestigationModel.imported == True  # noqa
-                    )
-                    .filter(InvestigationModel.patientID == patient_id)
-                    .filter(InvestigationModel.date == vl_date)
-                    .first()
-                )
-
-                if ix_model:
-                    ix_model.viralLoad = vl_result
-
-                else:
-                    ix_data = {
-                        "date": vl_date,
-                        "patientID": patient_id,
-                        "viralLoad": vl_result,
-                        "imported": True,
-                    }
-
-                    ix_model = InvestigationModel(**ix_data)
-
-                db.session.add(ix_model)
+        start = time.perf_counter()
+        counts, unmatched = importViralLoads(excel_df)
+        db.session.commit()
+        elapsed = time.perf_counter() - start
 
-            else:
-                # no patient found
-                current_app.logger.warn(
-                    f"Unable to import viral load result of "
-                    f"patient HN {vl_hn} "
-                    f"on {vl_date}"
-                    f" as the patient is not in the DB, skipping."
+        if unmatched:
+            # no patient found
+            current_app.logger.warn(
+                "Unable to import viral load results of {} HNs as the "
+                "patients are not in the DB, skipping: {}".format(
+                    len(unmatched), ", ".join(unmatched)
                 )
-                continue
+            )
 
-        db.session.commit()
+        current_app.logger.info(
+            "Imported {} of {} viral load results in {:.2f} s "
+            "({:.0f} rows/s): {} inserted, {} updated.".format(
+                sum(counts.values()),
+                len(excel_df),
+                elapsed,
+                len(excel_df) / elapsed,
+                counts["inserted"],
+                counts["updated"],
+            )
+        )
 
     @patient.command()
     @click.argument("json_path")
-    def importpatient(json_path):
-        """Import patient from json file"""
-        with open(json_path, "r") as file:
-            patients = json.load(file)
-
-        for patient in patients:
-            dermographic = patient.pop("dermographic")
-            ixs = patient.pop("ix")
-            visits_hcis = patient.pop("visits")
-            medications_hcis = patient.pop("med")
-
-            # add patient
-            patient_model = patch_patient(dermographic)
-            db.session.add(patient_model)
-            db.session.commit()
-
-            # add ix
-            ix_schema = InvestigationSchema(many=False)
-
-            for ix in ixs:
-                ix["date"] = convertToDate(ix["date"])
-
-                # find previous data
-                ix_model = (
-                    InvestigationModel.query.filter(
-                        InvestigationModel.imported == True  # noqa
-                    )
-                    .filter(InvestigationModel.patientID == patient_model.id)
-                    .filter(InvestigationModel.date == ix["date"])
-                    .first()
+    @click.option(
+        "--batch-size",
+        default=PATIENT_BATCH_SIZE,
+        help="Patients per transaction.",
+    )
+    def importpatient(json_path, batch_size):
+        """Import patient from json or json lines file"""
+        patients = readRecords(json_path)
+
+        totals = BatchImporter(batch_size).importRecords(patients)
+
+        for key, count in totals.items():
+            current_app.logger.info(
+                "{}: {} inserted, {} updated.".format(
+                    key.capitalize(), count["inserted"], count["updated"]
                 )
+            )
 
-                try:
-                    new_ix_model = ix_schema.load(ix)
-
-                    if ix_model:
-                        new_ix_dict = ix_schema.dump(new_ix_model)
-                        ix_model.update(**new_ix_dict)
-
-                    else:
-                        ix_model = new_ix_model
-                        ix_model.patientID = patient_model.id
-                        ix_model.imported = True
-
-                except Exception as e:
-                    current_app.logger.warn(
-                        f"Unable to import investigation of "
-                        f"patient HN {patient_model.hn} "
-                        f"on {ix['date']}"
-                        f" with this error {e}, skipping."
-                    )
-                    continue
-
-                # set imported status
-
-                db.session.add(ix_model)
-
-            # add visits
-            visit_schema = VisitSchema(many=False)
-
-            for item in medications_hcis:
-                date = item[0]
-                arvMedications = []
-                tbMedications = []
-                oiMedications = []
-                medications = item[1]
-                impression = []
-
-                # if medications were prescribed
-                if item[1]:
-                    all_medication_string = "::".join(item[1]).lower()
-
-                    for regex_item in ARV_MED_REGEX:
-                        if re.search(
-                            regex_item[1], all_medication_string, re.IGNORECASE
-                        ):
-                            arvMedications.append(regex_item[0])
-
-                    for regex_item in TB_MED_REGEX:
-                        if re.search(
-                            regex_item[1], all_medication_string, re.IGNORECASE
-                        ):
-                            tbMedications.append(regex_item[0])
-
-                    # add diagnosis
-                    arv_string = "::".join(arvMedications).lower() or ""
-                    tb_string = "::".join(tbMedications).lower() or ""
-
-                    if (
-                        ("teevir" in arv_string)
-                        or ("gpo-vir" in arv_string)
-                        or ("TDF300+3TC300+EFV600".lower() in arv_string)
-                        or (len(arvMedications) >= 3)
-                        or (
-                            len(arvMedications) >= 2
-                            and (
-                                ("teno-em" in arv_string)
-                                or ("zilarvir" in arv_string)
-                                or ("combivir" in arv_string)
-                            )
-                        )
-                    ):
-                        impression.append(
-                            "B20: Human immunodeficiency virus [HIV] disease"
-                        )
-
-                    if "isoniazid" in tb_string and len(tbMedications) == 1:
-                        impression.append(
-                            "R7611: Nonspecific reaction to tuberculin skin "
-                            + "test without active tuberculosis"
-                        )
-
-                    if len(tbMedications) >= 2:
-                        impression.append(
-                            "A159: Respiratory tuberculosis unspecified"
-                        )
-
-                # oi medications, must have HIV first
-                if "HIV".lower() in "::".join(impression).lower():
-                    for regex_item in OI_MED_REGEX:
-                        if re.search(
-                            regex_item[1], all_medication_string, re.IGNORECASE
-                        ):
-                            oiMedications.append(regex_item[0])
-
-                # add other STD dx
-                if "Benzathine Penicillin".lower() in all_medication_string:
-                    impression.append("A539: Syphilis, unspecified")
-
-                visit_entry = {
-                    "date": convertToDate(date),
-                    "arvMedications": sorted(arvMedications),
-                    "tbMedications": sorted(tbMedications),
-                    "oiMedications": sorted(oiMedications),
-                    "medications": sorted(medications),
-                    "impression": sorted(impression),
-                }
-
-                # find previous data
-                visit_model = (
-                    VisitModel.query.filter(
-                        VisitModel.imported == True  # noqa
-                    )
-                    .filter(VisitModel.patientID == patient_model.id)
-                    .filter(VisitModel.date == visit_entry["date"])
-                    .first()
-                )
-
-                try:
-                    new_visit_model = visit_schema.load(visit_entry)
-
-                    if visit_model:
-                        new_visit_dict = visit_schema.dump(new_visit_model)
-                        visit_model.update(**new_visit_dict)
-
-                    else:
-                        visit_model = new_visit_model
-                        visit_model.patientID = patient_model.id
-                        visit_model.imported = True
-
-                except Exception as e:
-                    current_app.logger.warn(
-                        f"Unable to import Ix of "
-                        f"patient HN {patient_model.hn} "
-                        f"on {ix['date']}"
-                        f" with this error {e}, skipping."
-                    )
-                    continue
-
-                db.session.add(visit_model)
-
-                # remove duplicate entries visits
-                try:
-                    visits_hcis.remove(date)
-
-                except ValueError:
-                    pass
-
-            for visit in visits_hcis:
-                visit_entry = {"date": convertToDate(visit)}
-
-                # find previous data
-                visit_model = (
-                    VisitModel.query.filter(
-                        VisitModel.imported == True  # noqa
-                    )
-                    .filter(VisitModel.patientID == patient_model.id)
-                    .filter(VisitModel.date == visit_entry["date"])
-                    .first()
-                )
-
-                try:
-                    new_visit_model = visit_schema.load(visit_entry)
-
-                    if visit_model:
-                        new_visit_dict = visit_schema.dump(new_visit_model)
-                        visit_model.update(**new_visit_dict)
-
-                    else:
-                        visit_model = new_visit_model
-                        visit_model.patientID = patient_model.id
-                        visit_model.imported = True
-
-                except Exception as e:
-                    current_app.logger.warn(
-                        f"Unable to import visit of "
-                        f"patient HN {patient_model.hn} "
-                        f"on {visit_entry['date']}"
-                        f" with this error {e}, skipping."
-                    )
-                    continue
-
-                db.session.add(visit_model)
-
-            db.session.commit()
+    @patient.command()
+    @click.argument("output")
+    @click.argument("json_paths", nargs=-1, required=True)
+    def compactjson(output, json_paths):
+        """Merge scraped json or json lines files into one json lines file
+
+        A patient scraped more than once keeps the record of the last file
+        listed.
+        """
+        hns = compactRecords(json_paths, output)
+
+        current_app.logger.info(
+            "Wrote {} patients to {}.".format(len(hns), output)
+        )
@@ -5,6 +5,7 @@ https://github.com/dubh3124/Flask-RestPlus-JWT-Mongoengine/blob/master/.env_bak
 
 import logging
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -42,6 +43,40 @@ class Config(object):
         self.OVERDUE_VL_MONTHS = int(os.getenv("OVERDUE_VL_MONTHS")) or 12
         self.OVERDUE_FU_MONTHS = int(os.getenv("OVERDUE_FU_MONTHS")) or 12
 
+        # "subquery" or "onepass", see data_dict_maker.summaryQuery
+        self.DATA_DICT_ENGINE = os.getenv("DATA_DICT_ENGINE") or "subquery"
+
+        # "vectorized" or "legacy", see overview_statistics.overviewStatistics
+        self.OVERVIEW_ENGINE = os.getenv("OVERVIEW_ENGINE") or "vectorized"
+
+        # cached data dict frames, 0 disables the cache
+        self.DATA_DICT_CACHE_SIZE = int(
+            os.getenv("DATA_DICT_CACHE_SIZE") or 16
+        )
+
+        # seconds the dashboard is cached for, 0 disables the cache
+        self.DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL") or 30)
+
+        # seconds between checks of the icd10 table for the search index
+        self.ICD10_INDEX_CHECK_SECONDS = int(
+            os.getenv("ICD10_INDEX_CHECK_SECONDS") or 300
+        )
+
+        # build the search index when the app starts
+        self.ICD10_INDEX_WARM_UP = True
+
+        # report jobs
+        self.REDIS_URL = os.getenv("REDIS_URL") or "redis://localhost:6379/0"
+        self.FAKE_REDIS = False
+        self.RQ_ASYNC = True
+        self.JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT") or 1800)
+        self.JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL") or 3600)
+
+        # exported files of the report jobs, shared by the API and workers
+        self.JOB_RESULT_FOLDER = os.getenv(
+            "JOB_RESULT_FOLDER"
+        ) or os.path.join(tempfile.gettempdir(), "hivclinic-jobs")
+
 
 class ProductionConfig(Config):
     def __init__(self):
@@ -85,6 +120,14 @@ class TestingConfig(Config):
         self.DEBUG = False
         self.TESTING = True
 
+        # run report jobs in-process on an in-memory redis,
+        # no worker or redis server needed
+        self.FAKE_REDIS = True
+        self.RQ_ASYNC = False
+
+        # the tests build the icd10 index they need
+        self.ICD10_INDEX_WARM_UP = False
+
         self.SQLALCHEMY_DATABASE_URI = os.getenv(
             "SQLALCHEMY_DATABASE_URI_TESTING"
         )
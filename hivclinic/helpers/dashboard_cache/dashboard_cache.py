@@ -0,0 +1,68 @@
+import threading
+import time
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.visit_model import VisitModel
+
+WATCHED_MODELS = (PatientModel, VisitModel, InvestigationModel)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def cachedDashboard(makeDashboard):
+    """Dashboard payload kept for DASHBOARD_CACHE_TTL seconds.
+
+    The cache is dropped when a session that wrote patients, visits or
+    investigations commits, and when the day changes.
+    """
+    ttl = current_app.config["DASHBOARD_CACHE_TTL"]
+
+    if ttl <= 0:
+        return makeDashboard()
+
+    today = date.today()
+
+    with _lock:
+        entry = _cache.get("dashboard")
+
+        if entry is not None and entry[0] == today and entry[1] > time.time():
+            return entry[2]
+
+    dashboard = makeDashboard()
+
+    with _lock:
+        _cache["dashboard"] = (today, time.time() + ttl, dashboard)
+
+    return dashboard
+
+
+def clearDashboardCache():
+    with _lock:
+        _cache.clear()
+
+
+@event.listens_for(Session, "before_flush")
+def markDashboardWrites(session, flush_context, instances):
+    if any(
+        isinstance(instance, WATCHED_MODELS)
+        for instance in (*session.new, *session.dirty, *session.deleted)
+    ):
+        session.info["dashboard_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def clearDashboardOnCommit(session):
+    if session.info.pop("dashboard_changed", False):
+        clearDashboardCache()
+
+
+@event.listens_for(Session, "after_rollback")
+def forgetDashboardWrites(session):
+    session.info.pop("dashboard_changed", None)
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import DateTime, cast, func, literal, union_all
+
+from hivclinic import db
+from hivclinic.helpers.data_dict_maker.data_dict_maker import dataDictMaker
+from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.models.partner_model import PartnerModel
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.patient_summary_model import PatientSummaryModel
+from hivclinic.models.visit_model import VisitModel
+
+WATCHED_MODELS = (
+    PatientModel,
+    VisitModel,
+    InvestigationModel,
+    PartnerModel,
+    PatientSummaryModel,
+)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def dataWatermark():
+    """Latest modified_on of every table the data dict reads.
+
+    modified_on moves on inserts and updates, and is indexed, so reading
+    it costs an index lookup per table. The API does not delete rows, and
+    a rebuild of the patient summary rewrites all of its rows. The date of
+    the database is part of the watermark too, as the ages are computed
+    from it.
+    """
+    watermark = union_all(
+        *[
+            db.session.query(
+                literal(Model.__tablename__), func.max(Model.modified_on)
+            ).statement
+            for Model in WATCHED_MODELS
+        ],
+        db.session.query(
+            literal("current_date"), cast(func.current_date(), DateTime)
+        ).statement,
+    )
+
+    return tuple(tuple(row) for row in db.session.execute(watermark))
+
+
+def cachedDataDictMaker(**kwargs):
+    """dataDictMaker with the results kept in an in-memory LRU cache.
+
+    Entries are keyed on the arguments and dropped as soon as the data
+    watermark moves. A copy is returned, so callers may modify it.
+    """
+    max_size = current_app.config["DATA_DICT_CACHE_SIZE"]
+
+    if max_size <= 0:
+        return dataDictMaker(**kwargs)
+
+    key = tuple(sorted(kwargs.items()))
+    watermark = dataWatermark()
+
+    with _lock:
+        entry = _cache.get(key)
+
+        if entry is not None and entry[0] == watermark:
+            _cache.move_to_end(key)
+
+            return entry[1].copy()
+
+    df = dataDictMaker(**kwargs)
+
+    with _lock:
+        _cache[key] = (watermark, df)
+        _cache.move_to_end(key)
+
+        while len(_cache) > max_size:
+            _cache.popitem(last=False)
+
+    return df.copy()
+
+
+def clearDataDictCache():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,206 @@
+import csv
+import io
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from hivclinic import db
+from hivclinic.helpers.data_dict_maker.data_dict_maker import dataDictQuery
+
+CHUNK_SIZE = 1000
+
+# file name and mimetype of each export format
+EXPORT_FORMATS = {
+    "xlsx": (
+        "data_dict.xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "csv": ("data_dict.csv", "text/csv"),
+    "parquet": ("data_dict.parquet", "application/octet-stream"),
+    "arrow": ("data_dict.arrows", "application/vnd.apache.arrow.stream"),
+}
+
+# formats with typed columns instead of spreadsheet text
+TYPED_FORMATS = ["parquet", "arrow"]
+
+# checked in order, DateTime before Date
+ARROW_TYPES = (
+    (Boolean, pa.bool_()),
+    (DateTime, pa.timestamp("us")),
+    (Date, pa.date32()),
+    (Integer, pa.int64()),
+    (Float, pa.float64()),
+)
+
+
+@contextmanager
+def openDataDictCursor(statement):
+    """Execute statement on a server-side cursor.
+
+    Rows are fetched from PostgreSQL in chunks instead of being loaded at
+    once, the connection is released when the block exits.
+    """
+    connection = db.engine.connect()
+
+    try:
+        yield connection.execution_options(stream_results=True).execute(
+            statement
+        )
+
+    finally:
+        connection.close()
+
+
+def iterDataDictCSV(statement, chunk_size: int = CHUNK_SIZE):
+    """Yield the data dict as CSV text, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # BOM, so Excel detects the Thai text as UTF-8
+    buffer.write("\ufeff")
+
+    with openDataDictCursor(statement) as result:
+        writer.writerow(result.keys())
+
+        while True:
+            rows = result.fetchmany(chunk_size)
+
+            if not rows:
+                break
+
+            writer.writerows(rows)
+
+            yield buffer.getvalue()
+
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    # header only when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def writeDataDictXLSX(statement, output, chunk_size: int = CHUNK_SIZE):
+    """Write the data dict into output as an xlsx workbook.
+
+    XlsxWriter's constant_memory mode flushes every finished row to a
+    temporary file, so memory stays flat regardless of the cohort size.
+    """
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("DataDict")
+
+    with openDataDictCursor(statement) as result:
+        worksheet.write_row(0, 0, result.keys())
+        row_number = 1
+
+        while True:
+            rows = result.fetchmany(chunk_size)
+
+            if not rows:
+                break
+
+            for row in rows:
+                worksheet.write_row(row_number, 0, row)
+                row_number = row_number + 1
+
+    workbook.close()
+
+
+def arrowType(sql_type):
+    """Map a SQLAlchemy column type to an Arrow type, text by default."""
+    if isinstance(sql_type, ARRAY):
+        return pa.list_(arrowType(sql_type.item_type))
+
+    for sql_class, arrow_type in ARROW_TYPES:
+        if isinstance(sql_type, sql_class):
+            return arrow_type
+
+    return pa.string()
+
+
+def arrowSchema(statement):
+    return pa.schema(
+        [
+            pa.field(column.name, arrowType(column.type))
+            for column in statement.columns
+        ]
+    )
+
+
+def iterRecordBatches(statement, schema, chunk_size: int = CHUNK_SIZE):
+    """Yield the rows of statement as Arrow record batches."""
+    with openDataDictCursor(statement) as result:
+        while True:
+            rows = result.fetchmany(chunk_size)
+
+            if not rows:
+                break
+
+            columns = zip(*rows)
+
+            yield pa.RecordBatch.from_arrays(
+                [
+                    pa.array(values, type=field.type)
+                    for values, field in zip(columns, schema)
+                ],
+                schema.names,
+            )
+
+
+def iterDataDictArrow(statement, chunk_size: int = CHUNK_SIZE):
+    """Yield the data dict in the Arrow IPC stream format."""
+    schema = arrowSchema(statement)
+    sink = io.BytesIO()
+    writer = pa.RecordBatchStreamWriter(sink, schema)
+
+    for batch in iterRecordBatches(statement, schema, chunk_size):
+        writer.write_batch(batch)
+
+        yield sink.getvalue()
+
+        sink.seek(0)
+        sink.truncate(0)
+
+    writer.close()
+
+    yield sink.getvalue()
+
+
+def writeDataDictParquet(statement, output, chunk_size: int = CHUNK_SIZE):
+    """Write the data dict into output as a Parquet file.
+
+    Every chunk becomes a row group, the file is only complete once the
+    footer is written on close.
+    """
+    schema = arrowSchema(statement)
+    writer = pq.ParquetWriter(output, schema)
+
+    for batch in iterRecordBatches(statement, schema, chunk_size):
+        writer.write_table(pa.Table.from_batches([batch]))
+
+    writer.close()
+
+
+def exportQuery(file_format: str):
+    return dataDictQuery(joinArrayBy=", ", typed=file_format in TYPED_FORMATS)
+
+
+def writeDataDict(statement, file_format: str, output):
+    """Write the data dict as a whole file into the binary output."""
+    if file_format == "csv":
+        for chunk in iterDataDictCSV(statement):
+            output.write(chunk.encode("utf-8"))
+
+    elif file_format == "arrow":
+        for chunk in iterDataDictArrow(statement):
+            output.write(chunk)
+
+    elif file_format == "parquet":
+        writeDataDictParquet(statement, output)
+
+    else:
+        writeDataDictXLSX(statement, output)
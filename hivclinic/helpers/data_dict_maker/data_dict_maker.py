@@ -2,13 +2,18 @@ from datetime import date
 
 import pandas as pd
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import Unicode, Float, and_, case, func, or_
-from sqlalchemy.sql.expression import cast
+from flask import current_app
+from sqlalchemy import Unicode, Float, Integer, and_, case, func, or_
+from sqlalchemy.sql.expression import cast, select, type_coerce
 
 from hivclinic import db
+from hivclinic.helpers.data_dict_maker.onepass_summary import (
+    onePassSummaryQuery,
+)
 from hivclinic.models.investigation_model import InvestigationModel
 from hivclinic.models.partner_model import PartnerModel
 from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.patient_summary_model import PatientSummaryModel
 from hivclinic.models.visit_model import VisitModel
 
 
@@ -22,21 +27,31 @@ def calculate_age_year(date_of_birth):
     return r.years
 
 
-def dataDictMaker(
-    dateFormat: str = None,
-    joinArrayBy: str = ",",
-    calculateAgeAsStr: bool = False,
-    convertUUID: bool = False,
-    startDate: date = date.min,
-    endDate: date = date.max,
-    asArray: bool = False,
+def patientSummaryQuery(
+    startDate: date = date.min, endDate: date = date.max, patientIDs=None
 ):
+    """Build a query with one row of clinical aggregates per patient.
+
+    The columns match PatientSummaryModel, so the query can either be
+    joined directly by dataDictMaker or used to refresh the persisted
+    summary table. Pass patientIDs to restrict every aggregate to those
+    patients only.
+    """
+
+    def inScope(Model):
+        criteria = Model.date.between(startDate, endDate)
+
+        if patientIDs is not None:
+            criteria = and_(criteria, Model.patientID.in_(patientIDs))
+
+        return criteria
+
     # find first visit
     subquery_firstVisit = (
         db.session.query(
             VisitModel.patientID, func.min(VisitModel.date).label("firstVisit")
         )
-        .filter(VisitModel.date.between(startDate, endDate))
+        .filter(inScope(VisitModel))
         .group_by(VisitModel.patientID)
         .subquery()
     )
@@ -47,7 +62,7 @@ def dataDictMaker(
             InvestigationModel.patientID,
             func.min(InvestigationModel.date).label("firstLab"),
         )
-        .filter(InvestigationModel.date.between(startDate, endDate))
+        .filter(inScope(InvestigationModel))
         .group_by(InvestigationModel.patientID)
         .subquery()
     )
@@ -86,7 +101,7 @@ def dataDictMaker(
         .filter(
             and_(
                 InvestigationModel.antiHIV.isnot(None),
-                InvestigationModel.date.between(startDate, endDate),
+                inScope(InvestigationModel),
             )
         )
         .group_by(InvestigationModel.patientID)
@@ -121,7 +136,7 @@ def dataDictMaker(
             and_(
                 InvestigationModel.antiHIV != "Negative",
                 ~InvestigationModel.antiHIV.contains("Incon"),
-                InvestigationModel.date.between(startDate, endDate),
+                inScope(InvestigationModel),
             )
         )
         .group_by(InvestigationModel.patientID)
@@ -129,15 +144,20 @@ def dataDictMaker(
     )
 
     # find number of partners
-    subquery_numberOfPartners = (
-        db.session.query(
-            PartnerModel.patientID,
-            func.count(PartnerModel.id).label("numberOfPartners"),
-        )
-        .group_by(PartnerModel.patientID)
-        .subquery()
+    query_numberOfPartners = db.session.query(
+        PartnerModel.patientID,
+        func.count(PartnerModel.id).label("numberOfPartners"),
     )
 
+    if patientIDs is not None:
+        query_numberOfPartners = query_numberOfPartners.filter(
+            PartnerModel.patientID.in_(patientIDs)
+        )
+
+    subquery_numberOfPartners = query_numberOfPartners.group_by(
+        PartnerModel.patientID
+    ).subquery()
+
     # find initial ARV
     subquery_arvInitiationDate = (
         db.session.query(
@@ -147,7 +167,7 @@ def dataDictMaker(
         .filter(
             and_(
                 func.array_length(VisitModel.arvMedications, 1) != 0,
-                VisitModel.date.between(startDate, endDate),
+                inScope(VisitModel),
             )
         )
         .group_by(VisitModel.patientID)
@@ -217,7 +237,7 @@ def dataDictMaker(
         .filter(
             and_(
                 func.array_length(VisitModel.arvMedications, 1) != 0,
-                VisitModel.date.between(startDate, endDate),
+                inScope(VisitModel),
             )
         )
         .group_by(VisitModel.patientID)
@@ -253,14 +273,14 @@ def dataDictMaker(
         .filter(
             and_(
                 InvestigationModel.viralLoad.isnot(None),
-                InvestigationModel.date.between(startDate, endDate),
+                inScope(InvestigationModel),
             )
         )
         .group_by(InvestigationModel.patientID)
         .subquery()
     )
 
-    subquery_lastVLResults_raw = (
+    subquery_lastVLResults = (
         db.session.query(
             subquery_lastVLLabDate.c.lastViralLoadDate,
             InvestigationModel.viralLoad.label("lastViralLoad"),
@@ -279,20 +299,6 @@ def dataDictMaker(
         .subquery()
     )
 
-    subquery_lastVLResults = db.session.query(
-        subquery_lastVLResults_raw.c.patientID,
-        subquery_lastVLResults_raw.c.lastViralLoadDate,
-        case(
-            [
-                (
-                    subquery_lastVLResults_raw.c.lastViralLoad == -1,
-                    "Undetectable",
-                )
-            ],
-            else_=cast(subquery_lastVLResults_raw.c.lastViralLoad, Unicode),
-        ).label("lastViralLoad"),
-    ).subquery()
-
     # find first CD4
     subquery_firstCD4LabDate = (
         db.session.query(
@@ -302,7 +308,7 @@ def dataDictMaker(
         .filter(
             and_(
                 InvestigationModel.absoluteCD4.isnot(None),
-                InvestigationModel.date.between(startDate, endDate),
+                inScope(InvestigationModel),
             )
         )
         .group_by(InvestigationModel.patientID)
@@ -340,7 +346,7 @@ def dataDictMaker(
         .filter(
             and_(
                 InvestigationModel.absoluteCD4.isnot(None),
-                InvestigationModel.date.between(startDate, endDate),
+                inScope(InvestigationModel),
             )
         )
         .group_by(InvestigationModel.patientID)
@@ -398,14 +404,14 @@ def dataDictMaker(
         .filter(
             and_(
                 subquery_firstPosAntiHIV.c.patientID.isnot(None),
-                subquery_initialARV.c.patientID.isnot(None),
+                subquery_initialARV.c.patientID == VisitModel.patientID,
                 or_(
                     VisitModel.date >= subquery_firstVisit.c.firstVisit,
                     VisitModel.date >= subquery_firstLab.c.firstLab,
                 ),
                 VisitModel.date <= subquery_initialARV.c.arvInitiationDate,
                 func.array_length(VisitModel.impression, 1) != 0,
-                VisitModel.date.between(startDate, endDate),
+                inScope(VisitModel),
             )
         )
         .group_by(VisitModel.patientID, "unnestDxBeforeARV")
@@ -432,7 +438,7 @@ def dataDictMaker(
         db.session.query(
             VisitModel.patientID, func.max(VisitModel.date).label("lastVisit")
         )
-        .filter(VisitModel.date.between(startDate, endDate))
+        .filter(inScope(VisitModel))
         .group_by(VisitModel.patientID)
         .subquery()
     )
@@ -442,7 +448,7 @@ def dataDictMaker(
             InvestigationModel.patientID,
             func.max(InvestigationModel.date).label("lastIx"),
         )
-        .filter(InvestigationModel.date.between(startDate, endDate))
+        .filter(inScope(InvestigationModel))
         .group_by(InvestigationModel.patientID)
         .subquery()
     )
@@ -465,67 +471,31 @@ def dataDictMaker(
         .subquery()
     )
 
-    # construct data_dict
-    data_dict = (
+    # construct summary
+    summary = (
         db.session.query(
-            cast(PatientModel.id, Unicode).label("System ID"),
-            PatientModel.clinicID.label("Clinic ID"),
-            PatientModel.hn.label("HN"),
-            PatientModel.governmentID.label("ID"),
-            PatientModel.napID.label("NAP"),
-            PatientModel.name.label("Name"),
-            func.to_char(PatientModel.dateOfBirth, "DD-MM-YYYY").label("Date of birth"),
-            cast(func.age(PatientModel.dateOfBirth), Unicode).label("Age"),
-            PatientModel.sex.label("Sex"),
-            PatientModel.gender.label("Gender"),
-            PatientModel.maritalStatus.label("Marital status"),
-            PatientModel.nationality.label("Nationality"),
-            PatientModel.address.label("Address"),
-            PatientModel.healthInsurance.label("Healthcare scheme"),
-            PatientModel.cares.label("PCU/SMC/Frequent clinic"),
-            func.array_to_string(PatientModel.phoneNumbers, joinArrayBy).label("Phone number"),
-            func.array_to_string(
-                PatientModel.relativePhoneNumbers, joinArrayBy
-            ).label("Relative's phone number"),
-            PatientModel.referralStatus.label("Referral status"),
-            PatientModel.referredFrom.label("Referred from"),
-            func.array_to_string(PatientModel.riskBehaviors, joinArrayBy).label("Risk behaviors"),
-            PatientModel.patientStatus.label("Patient status"),
-            PatientModel.referredOutTo.label("Referred out to"),
-            subquery_numberOfPartners.c.numberOfPartners.label("Number of partners"),
-            func.to_char(subquery_registerDate.c.registerDate, "DD-MM-YYYY").label("Register date"),
-            func.to_char(subquery_lastClinicVisit.c.lastClinicVisit, "DD-MM-YYYY").label("Last visit date"),
-            cast(
-                (
-                    subquery_lastClinicVisit.c.lastClinicVisit
-                    - subquery_registerDate.c.registerDate
-                )
-                / 30,
-                Float,
-            ).label("Retention period (months)"),
-            func.to_char(subquery_firstAntiHIVResult.c.firstAntiHIV, "DD-MM-YYYY").label("First anti-HIV testing date"),
-            subquery_firstAntiHIVResult.c.firstAntiHIVResult.label("First anti-HIV testing result"),
-            func.to_char(subquery_firstPosAntiHIV.c.firstPosAntiHIV, "DD-MM-YYYY").label("First anti-HIV positive date"),
-            func.to_char(subquery_initialARV.c.arvInitiationDate, "DD-MM-YYYY").label("ARV initiation date"),
-            func.array_to_string(
-                subquery_initialARV.c.initialARV, joinArrayBy
-            ).label("First ARV regimen"),
-            subquery_timeToStartARV.c.timeToStartARV.label("# of days to start ARV"),
-            func.to_char(subquery_currentARV.c.lastARVPrescriptionDate, "DD-MM-YYYY").label("Last ARV prescription date"),
-            func.array_to_string(
-                subquery_currentARV.c.currentARV, joinArrayBy
-            ).label("Last ARV regimen"),
-            func.to_char(subquery_lastVLResults.c.lastViralLoadDate, "DD-MM-YYYY").label("Last viral load date"),
-            subquery_lastVLResults.c.lastViralLoad.label("Last viral load result"),
-            func.to_char(subquery_firstCD4Results.c.firstCD4LabDate, "DD-MM-YYYY").label("First CD4 date"),
-            subquery_firstCD4Results.c.firstCD4Result.label("First CD4 result"),
-            subquery_firstCD4Results.c.firstPercentCD4Result.label("First %CD4 result"),
-            func.to_char(subquery_lastCD4Results.c.lastCD4LabDate, "DD-MM-YYYY").label("Last CD4 date"),
-            subquery_lastCD4Results.c.lastCD4Result.label("Last CD4 result"),
-            subquery_lastCD4Results.c.lastPercentCD4Result.label("Last %CD4 result"),
-            func.array_to_string(
-                subquery_DxBeforeARV.c.DxBeforeARV, joinArrayBy
-            ).label("Other diagnosis before ARV initiation")
+            PatientModel.id.label("patientID"),
+            subquery_numberOfPartners.c.numberOfPartners,
+            subquery_registerDate.c.registerDate,
+            subquery_lastClinicVisit.c.lastClinicVisit,
+            subquery_lastVisit.c.lastVisit.label("lastVisitDate"),
+            subquery_firstAntiHIVResult.c.firstAntiHIV,
+            subquery_firstAntiHIVResult.c.firstAntiHIVResult,
+            subquery_firstPosAntiHIV.c.firstPosAntiHIV,
+            subquery_initialARV.c.arvInitiationDate,
+            subquery_initialARV.c.initialARV,
+            subquery_timeToStartARV.c.timeToStartARV,
+            subquery_currentARV.c.lastARVPrescriptionDate,
+            subquery_currentARV.c.currentARV,
+            subquery_lastVLResults.c.lastViralLoadDate,
+            subquery_lastVLResults.c.lastViralLoad,
+            subquery_firstCD4Results.c.firstCD4LabDate,
+            subquery_firstCD4Results.c.firstCD4Result,
+            subquery_firstCD4Results.c.firstPercentCD4Result,
+            subquery_lastCD4Results.c.lastCD4LabDate,
+            subquery_lastCD4Results.c.lastCD4Result,
+            subquery_lastCD4Results.c.lastPercentCD4Result,
+            subquery_DxBeforeARV.c.DxBeforeARV,
         )
         .outerjoin(
             subquery_numberOfPartners,
@@ -539,6 +509,10 @@ def dataDictMaker(
             subquery_lastClinicVisit,
             subquery_lastClinicVisit.c.patientID == PatientModel.id,
         )
+        .outerjoin(
+            subquery_lastVisit,
+            subquery_lastVisit.c.patientID == PatientModel.id,
+        )
         .outerjoin(
             subquery_firstAntiHIVResult,
             subquery_firstAntiHIVResult.c.patientID == PatientModel.id,
@@ -575,28 +549,203 @@ def dataDictMaker(
             subquery_DxBeforeARV,
             subquery_DxBeforeARV.c.patientID == PatientModel.id,
         )
+    )
+
+    if patientIDs is not None:
+        summary = summary.filter(PatientModel.id.in_(patientIDs))
+
+    return summary
+
+
+SUMMARY_QUERY_ENGINES = {
+    "subquery": patientSummaryQuery,
+    "onepass": onePassSummaryQuery,
+}
+
+
+def summaryQuery(engine: str = None, **kwargs):
+    """Build the per-patient summary query with the given engine.
+
+    Defaults to the DATA_DICT_ENGINE setting, either "subquery" or
+    "onepass".
+    """
+    engine = engine or current_app.config["DATA_DICT_ENGINE"]
+
+    if engine not in SUMMARY_QUERY_ENGINES:
+        raise ValueError(f"Unknown data dict engine {engine}.")
+
+    return SUMMARY_QUERY_ENGINES[engine](**kwargs)
+
+
+def inDataDict(summary):
+    """Criteria of the patients listed in the data dict.
+
+    summary is the patient summary table or a subquery with its columns,
+    joined to the patient table.
+    """
+    return or_(
+        PatientModel.clinicID.isnot(None),
+        summary.c.firstPosAntiHIV.isnot(None),
+        summary.c.arvInitiationDate.isnot(None),
+        summary.c.lastARVPrescriptionDate.isnot(None),
+        summary.c.lastViralLoadDate.isnot(None),
+        summary.c.lastCD4LabDate.isnot(None),
+        summary.c.firstCD4LabDate.isnot(None),
+    )
+
+
+def dataDictQuery(
+    joinArrayBy: str = ",",
+    startDate: date = date.min,
+    endDate: date = date.max,
+    useSummaryTable: bool = True,
+    engine: str = None,
+    typed: bool = False,
+):
+    """Build the SELECT statement behind the data dict, one row per patient.
+
+    Dates and arrays are formatted as text for the spreadsheet, unless
+    typed is set. A typed data dict keeps dates, arrays, the age in
+    years and the viral load (-1 for undetectable) as they are stored.
+    """
+
+    def asDate(column):
+        return column if typed else func.to_char(column, "DD-MM-YYYY")
+
+    def asText(column):
+        return column if typed else func.array_to_string(column, joinArrayBy)
+
+    # the persisted summary covers the whole history only,
+    # date-ranged reports are aggregated on the fly
+    if useSummaryTable and startDate == date.min and endDate == date.max:
+        summary = PatientSummaryModel.__table__
+
+    else:
+        summary = summaryQuery(
+            engine=engine, startDate=startDate, endDate=endDate
+        ).subquery()
+
+        # give the on-the-fly summary the column types of the table
+        summary = select(
+            [
+                type_coerce(summary.c[column.name], column.type).label(
+                    column.name
+                )
+                for column in PatientSummaryModel.__table__.c
+                if column.name in summary.c
+            ]
+        ).alias()
+
+    if typed:
+        age = cast(
+            func.date_part("year", func.age(PatientModel.dateOfBirth)), Integer
+        )
+        lastViralLoad = summary.c.lastViralLoad
+
+    else:
+        age = cast(func.age(PatientModel.dateOfBirth), Unicode)
+        lastViralLoad = case(
+            [(summary.c.lastViralLoad == -1, "Undetectable")],
+            else_=cast(summary.c.lastViralLoad, Unicode),
+        )
+
+    # construct data_dict
+    data_dict = (
+        db.session.query(
+            cast(PatientModel.id, Unicode).label("System ID"),
+            PatientModel.clinicID.label("Clinic ID"),
+            PatientModel.hn.label("HN"),
+            PatientModel.governmentID.label("ID"),
+            PatientModel.napID.label("NAP"),
+            PatientModel.name.label("Name"),
+            asDate(PatientModel.dateOfBirth).label("Date of birth"),
+            age.label("Age"),
+            PatientModel.sex.label("Sex"),
+            PatientModel.gender.label("Gender"),
+            PatientModel.maritalStatus.label("Marital status"),
+            PatientModel.nationality.label("Nationality"),
+            PatientModel.address.label("Address"),
+            PatientModel.healthInsurance.label("Healthcare scheme"),
+            PatientModel.cares.label("PCU/SMC/Frequent clinic"),
+            asText(PatientModel.phoneNumbers).label("Phone number"),
+            asText(PatientModel.relativePhoneNumbers).label(
+                "Relative's phone number"
+            ),
+            PatientModel.referralStatus.label("Referral status"),
+            PatientModel.referredFrom.label("Referred from"),
+            asText(PatientModel.riskBehaviors).label("Risk behaviors"),
+            PatientModel.patientStatus.label("Patient status"),
+            PatientModel.referredOutTo.label("Referred out to"),
+            summary.c.numberOfPartners.label("Number of partners"),
+            asDate(summary.c.registerDate).label("Register date"),
+            asDate(summary.c.lastClinicVisit).label("Last visit date"),
+            cast(
+                (summary.c.lastClinicVisit - summary.c.registerDate) / 30,
+                Float,
+            ).label("Retention period (months)"),
+            asDate(summary.c.firstAntiHIV).label(
+                "First anti-HIV testing date"
+            ),
+            summary.c.firstAntiHIVResult.label(
+                "First anti-HIV testing result"
+            ),
+            asDate(summary.c.firstPosAntiHIV).label(
+                "First anti-HIV positive date"
+            ),
+            asDate(summary.c.arvInitiationDate).label("ARV initiation date"),
+            asText(summary.c.initialARV).label("First ARV regimen"),
+            summary.c.timeToStartARV.label("# of days to start ARV"),
+            asDate(summary.c.lastARVPrescriptionDate).label(
+                "Last ARV prescription date"
+            ),
+            asText(summary.c.currentARV).label("Last ARV regimen"),
+            asDate(summary.c.lastViralLoadDate).label("Last viral load date"),
+            lastViralLoad.label("Last viral load result"),
+            asDate(summary.c.firstCD4LabDate).label("First CD4 date"),
+            summary.c.firstCD4Result.label("First CD4 result"),
+            summary.c.firstPercentCD4Result.label("First %CD4 result"),
+            asDate(summary.c.lastCD4LabDate).label("Last CD4 date"),
+            summary.c.lastCD4Result.label("Last CD4 result"),
+            summary.c.lastPercentCD4Result.label("Last %CD4 result"),
+            asText(summary.c.DxBeforeARV).label(
+                "Other diagnosis before ARV initiation"
+            ),
+        )
+        .join(summary, summary.c.patientID == PatientModel.id)
         .filter(
             and_(
-                or_(
-                    PatientModel.clinicID.isnot(None),
-                    subquery_firstPosAntiHIV.c.firstPosAntiHIV.isnot(None),
-                    subquery_initialARV.c.arvInitiationDate.isnot(None),
-                    subquery_currentARV.c.lastARVPrescriptionDate.isnot(None),
-                    subquery_lastVLResults.c.lastViralLoadDate.isnot(None),
-                    subquery_lastCD4Results.c.lastCD4LabDate.isnot(None),
-                    subquery_firstCD4Results.c.firstCD4LabDate.isnot(None),
-                ),
-                subquery_registerDate.c.registerDate.between(
-                    startDate, endDate
-                ),
+                inDataDict(summary),
+                summary.c.registerDate.between(startDate, endDate),
             )
         )
         .order_by(PatientModel.clinicID)
         .order_by(PatientModel.dateOfBirth)
-        .order_by(subquery_firstPosAntiHIV.c.firstPosAntiHIV)
+        .order_by(summary.c.firstPosAntiHIV)
         .statement
     )
 
+    return data_dict
+
+
+def dataDictMaker(
+    dateFormat: str = None,
+    joinArrayBy: str = ",",
+    calculateAgeAsStr: bool = False,
+    convertUUID: bool = False,
+    startDate: date = date.min,
+    endDate: date = date.max,
+    asArray: bool = False,
+    useSummaryTable: bool = True,
+    engine: str = None,
+):
+    data_dict = dataDictQuery(
+        joinArrayBy=joinArrayBy,
+        startDate=startDate,
+        endDate=endDate,
+        useSummaryTable=useSummaryTable,
+        engine=engine,
+    )
+
     df = pd.read_sql(data_dict, db.session.bind)
 
     # replace missing values to None
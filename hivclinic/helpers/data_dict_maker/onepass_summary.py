@@ -0,0 +1,252 @@
+from datetime import date
+
+from sqlalchemy import and_, case, func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
+
+from hivclinic import db
+from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.models.partner_model import PartnerModel
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.visit_model import VisitModel
+
+
+def firstValue(column, criteria, *order_by):
+    """Value of the first row (by order_by) that satisfies criteria.
+
+    Compiles to (array_agg(column ORDER BY ...) FILTER (WHERE ...))[1],
+    so every first/last value of a table is found in the same GROUP BY
+    pass and exactly one row is picked when several share a date.
+    """
+    return func.array_agg(aggregate_order_by(column, *order_by)).filter(
+        criteria
+    )[1]
+
+
+def onePassSummaryQuery(
+    startDate: date = date.min, endDate: date = date.max, patientIDs=None
+):
+    """Build the same per-patient summary as patientSummaryQuery.
+
+    Instead of a min/max subquery joined back on the date for every
+    column, each of the investigation and visit tables is aggregated
+    once with FILTER clauses and ordered array_agg. Ties on the date
+    are broken by the row id.
+    """
+
+    def inScope(Model):
+        criteria = Model.date.between(startDate, endDate)
+
+        if patientIDs is not None:
+            criteria = and_(criteria, Model.patientID.in_(patientIDs))
+
+        return criteria
+
+    # investigations
+    hasAntiHIV = InvestigationModel.antiHIV.isnot(None)
+    isPosAntiHIV = and_(
+        InvestigationModel.antiHIV != "Negative",
+        ~InvestigationModel.antiHIV.contains("Incon"),
+    )
+    hasVL = InvestigationModel.viralLoad.isnot(None)
+    hasCD4 = InvestigationModel.absoluteCD4.isnot(None)
+
+    firstIxOrder = (InvestigationModel.date, InvestigationModel.id)
+    lastIxOrder = (InvestigationModel.date.desc(), InvestigationModel.id)
+
+    subquery_ix = (
+        db.session.query(
+            InvestigationModel.patientID,
+            func.min(InvestigationModel.date).label("firstLab"),
+            func.max(InvestigationModel.date).label("lastIx"),
+            func.min(InvestigationModel.date)
+            .filter(hasAntiHIV)
+            .label("firstAntiHIV"),
+            firstValue(
+                InvestigationModel.antiHIV, hasAntiHIV, *firstIxOrder
+            ).label("firstAntiHIVResult"),
+            func.min(InvestigationModel.date)
+            .filter(isPosAntiHIV)
+            .label("firstPosAntiHIV"),
+            func.max(InvestigationModel.date)
+            .filter(hasVL)
+            .label("lastViralLoadDate"),
+            firstValue(
+                InvestigationModel.viralLoad, hasVL, *lastIxOrder
+            ).label("lastViralLoad"),
+            func.min(InvestigationModel.date)
+            .filter(hasCD4)
+            .label("firstCD4LabDate"),
+            firstValue(
+                InvestigationModel.absoluteCD4, hasCD4, *firstIxOrder
+            ).label("firstCD4Result"),
+            firstValue(
+                InvestigationModel.percentCD4, hasCD4, *firstIxOrder
+            ).label("firstPercentCD4Result"),
+            func.max(InvestigationModel.date)
+            .filter(hasCD4)
+            .label("lastCD4LabDate"),
+            firstValue(
+                InvestigationModel.absoluteCD4, hasCD4, *lastIxOrder
+            ).label("lastCD4Result"),
+            firstValue(
+                InvestigationModel.percentCD4, hasCD4, *lastIxOrder
+            ).label("lastPercentCD4Result"),
+        )
+        .filter(inScope(InvestigationModel))
+        .group_by(InvestigationModel.patientID)
+        .subquery()
+    )
+
+    # visits, ARV regimens are arrays so the visit id is picked instead
+    hasARV = func.array_length(VisitModel.arvMedications, 1) != 0
+
+    subquery_visit = (
+        db.session.query(
+            VisitModel.patientID,
+            func.min(VisitModel.date).label("firstVisit"),
+            func.max(VisitModel.date).label("lastVisit"),
+            func.min(VisitModel.date)
+            .filter(hasARV)
+            .label("arvInitiationDate"),
+            firstValue(
+                VisitModel.id, hasARV, VisitModel.date, VisitModel.id
+            ).label("initialARVVisitID"),
+            func.max(VisitModel.date)
+            .filter(hasARV)
+            .label("lastARVPrescriptionDate"),
+            firstValue(
+                VisitModel.id, hasARV, VisitModel.date.desc(), VisitModel.id
+            ).label("currentARVVisitID"),
+        )
+        .filter(inScope(VisitModel))
+        .group_by(VisitModel.patientID)
+        .subquery()
+    )
+
+    initialARVVisit = aliased(VisitModel)
+    currentARVVisit = aliased(VisitModel)
+
+    # find number of partners
+    query_numberOfPartners = db.session.query(
+        PartnerModel.patientID,
+        func.count(PartnerModel.id).label("numberOfPartners"),
+    )
+
+    if patientIDs is not None:
+        query_numberOfPartners = query_numberOfPartners.filter(
+            PartnerModel.patientID.in_(patientIDs)
+        )
+
+    subquery_numberOfPartners = query_numberOfPartners.group_by(
+        PartnerModel.patientID
+    ).subquery()
+
+    # diagnoses up to the ARV initiation date of the same patient
+    subquery_unnestDxBeforeARV = (
+        db.session.query(
+            VisitModel.patientID,
+            func.unnest(VisitModel.impression).label("unnestDxBeforeARV"),
+        )
+        .join(
+            subquery_visit, subquery_visit.c.patientID == VisitModel.patientID
+        )
+        .join(subquery_ix, subquery_ix.c.patientID == VisitModel.patientID)
+        .filter(
+            and_(
+                subquery_ix.c.firstPosAntiHIV.isnot(None),
+                VisitModel.date <= subquery_visit.c.arvInitiationDate,
+                inScope(VisitModel),
+            )
+        )
+        .subquery()
+    )
+
+    subquery_DxBeforeARV = (
+        db.session.query(
+            subquery_unnestDxBeforeARV.c.patientID,
+            func.array_agg(
+                func.distinct(subquery_unnestDxBeforeARV.c.unnestDxBeforeARV)
+            ).label("DxBeforeARV"),
+        )
+        .filter(~subquery_unnestDxBeforeARV.c.unnestDxBeforeARV.ilike("%B20%"))
+        .group_by(subquery_unnestDxBeforeARV.c.patientID)
+        .subquery()
+    )
+
+    timeToStartARV = (
+        subquery_visit.c.arvInitiationDate - subquery_ix.c.firstPosAntiHIV
+    )
+    hasSecondCD4 = (
+        subquery_ix.c.lastCD4LabDate != subquery_ix.c.firstCD4LabDate
+    )
+
+    # construct summary
+    summary = (
+        db.session.query(
+            PatientModel.id.label("patientID"),
+            subquery_numberOfPartners.c.numberOfPartners,
+            func.nullif(
+                func.least(
+                    func.coalesce(subquery_visit.c.firstVisit, date.max),
+                    func.coalesce(subquery_ix.c.firstLab, date.max),
+                ),
+                date.max,
+            ).label("registerDate"),
+            func.greatest(
+                func.coalesce(subquery_visit.c.lastVisit, date.min),
+                func.coalesce(subquery_ix.c.lastIx, date.min),
+            ).label("lastClinicVisit"),
+            subquery_visit.c.lastVisit.label("lastVisitDate"),
+            subquery_ix.c.firstAntiHIV,
+            subquery_ix.c.firstAntiHIVResult,
+            subquery_ix.c.firstPosAntiHIV,
+            subquery_visit.c.arvInitiationDate,
+            initialARVVisit.arvMedications.label("initialARV"),
+            case([(timeToStartARV < 0, 0)], else_=timeToStartARV).label(
+                "timeToStartARV"
+            ),
+            subquery_visit.c.lastARVPrescriptionDate,
+            currentARVVisit.arvMedications.label("currentARV"),
+            subquery_ix.c.lastViralLoadDate,
+            subquery_ix.c.lastViralLoad,
+            subquery_ix.c.firstCD4LabDate,
+            subquery_ix.c.firstCD4Result,
+            subquery_ix.c.firstPercentCD4Result,
+            case([(hasSecondCD4, subquery_ix.c.lastCD4LabDate)]).label(
+                "lastCD4LabDate"
+            ),
+            case([(hasSecondCD4, subquery_ix.c.lastCD4Result)]).label(
+                "lastCD4Result"
+            ),
+            case([(hasSecondCD4, subquery_ix.c.lastPercentCD4Result)]).label(
+                "lastPercentCD4Result"
+            ),
+            subquery_DxBeforeARV.c.DxBeforeARV,
+        )
+        .outerjoin(subquery_ix, subquery_ix.c.patientID == PatientModel.id)
+        .outerjoin(
+            subquery_visit, subquery_visit.c.patientID == PatientModel.id
+        )
+        .outerjoin(
+            initialARVVisit,
+            initialARVVisit.id == subquery_visit.c.initialARVVisitID,
+        )
+        .outerjoin(
+            currentARVVisit,
+            currentARVVisit.id == subquery_visit.c.currentARVVisitID,
+        )
+        .outerjoin(
+            subquery_numberOfPartners,
+            subquery_numberOfPartners.c.patientID == PatientModel.id,
+        )
+        .outerjoin(
+            subquery_DxBeforeARV,
+            subquery_DxBeforeARV.c.patientID == PatientModel.id,
+        )
+    )
+
+    if patientIDs is not None:
+        summary = summary.filter(PatientModel.id.in_(patientIDs))
+
+    return summary
@@ -0,0 +1,226 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app
+from sqlalchemy import event, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from hivclinic import db
+from hivclinic.models.icd10_model import ICD10Model
+
+NGRAM_SIZE = 3
+
+_index = None
+_lock = threading.Lock()
+
+
+def normalize(text: str):
+    return text.strip().casefold()
+
+
+def ngrams(text: str, size: int = NGRAM_SIZE):
+    return {
+        text[start : start + size]  # noqa
+        for start in range(len(text) - size + 1)
+    }
+
+
+class ICD10Index(object):
+    """In-memory autocomplete index of the ICD-10 entries.
+
+    Codes are kept in a prefix trie, description words in a sorted list
+    with their postings and the 1 to NGRAM_SIZE-grams of codes and
+    descriptions in an inverted index. Entries are numbered in code
+    order and every posting list is sorted, so matches are ranked by
+    code and found lazily, stopping once enough have been collected.
+    """
+
+    def __init__(self, entries, watermark=None):
+        self.entries = sorted(entries)
+        self.watermark = watermark
+        self.checked_on = time.monotonic()
+
+        # code and description, apart so no n-gram spans both
+        self.texts = [
+            f"{normalize(code)}\n{normalize(description)}"
+            for code, description in self.entries
+        ]
+
+        self.trie = {}
+        word_postings = {}
+        self.postings = {}
+
+        for n, (code, description) in enumerate(self.entries):
+            node = self.trie
+
+            for char in normalize(code):
+                node = node.setdefault(char, {})
+                node.setdefault("", []).append(n)
+
+            for word in set(re.findall(r"\w+", normalize(description))):
+                word_postings.setdefault(word, []).append(n)
+
+            for size in range(1, NGRAM_SIZE + 1):
+                for ngram in ngrams(self.texts[n], size):
+                    self.postings.setdefault(ngram, []).append(n)
+
+        self.words = sorted(word_postings)
+        self.word_postings = [word_postings[word] for word in self.words]
+
+    def codePrefix(self, keyword):
+        node = self.trie
+
+        for char in keyword:
+            node = node.get(char)
+
+            if node is None:
+                return []
+
+        return node.get("", [])
+
+    def wordPrefix(self, keyword):
+        start = bisect_left(self.words, keyword)
+        end = bisect_left(self.words, keyword + "\U0010ffff")
+
+        return heapq.merge(*self.word_postings[start:end])
+
+    def substring(self, keyword):
+        if len(keyword) <= NGRAM_SIZE:
+            return self.postings.get(keyword, [])
+
+        # entries holding the rarest n-gram of the keyword
+        candidates = min(
+            (self.postings.get(ngram, []) for ngram in ngrams(keyword)),
+            key=len,
+        )
+
+        return (n for n in candidates if keyword in self.texts[n])
+
+    def search(self, keyword: str, limit: int = 10):
+        """Entries matching the keyword as (code, description) tuples.
+
+        Code prefix matches come first, then description word prefix
+        matches, then any other code or description substring match.
+        """
+        keyword = normalize(keyword)
+        results = []
+        seen = set()
+
+        if not keyword:
+            return results
+
+        for matcher in (self.codePrefix, self.wordPrefix, self.substring):
+            for n in matcher(keyword):
+                if n not in seen:
+                    seen.add(n)
+                    results.append(self.entries[n])
+
+                    if len(results) == limit:
+                        return results
+
+        return results
+
+
+def icd10Watermark():
+    # changes whenever a code is added, removed or described differently
+    entry = ICD10Model.icd10 + "\n" + ICD10Model.description
+    separator = literal_column("'\n'")
+
+    return db.session.query(
+        func.md5(
+            func.string_agg(
+                entry, aggregate_order_by(separator, ICD10Model.icd10, entry)
+            )
+        )
+    ).scalar()
+
+
+def buildICD10Index():
+    entries = db.session.query(ICD10Model.icd10, ICD10Model.description)
+
+    return ICD10Index(
+        [tuple(entry) for entry in entries], watermark=icd10Watermark()
+    )
+
+
+def icd10Index():
+    """The ICD-10 index of this process, built by warmICD10Index.
+
+    The table is checksummed every ICD10_INDEX_CHECK_SECONDS, so a table
+    reseeded or refreshed by another process is picked up without a
+    restart.
+    """
+    global _index
+
+    index = _index
+    check_seconds = current_app.config["ICD10_INDEX_CHECK_SECONDS"]
+
+    if index is not None:
+        if time.monotonic() - index.checked_on < check_seconds:
+            return index
+
+        if icd10Watermark() == index.watermark:
+            index.checked_on = time.monotonic()
+
+            return index
+
+    with _lock:
+        # another thread may have rebuilt it in the meantime
+        if _index is None or _index is index:
+            _index = buildICD10Index()
+
+        return _index
+
+
+def warmICD10Index(app):
+    """Build the ICD-10 index in the background when the app starts.
+
+    The first search waits for the build if it is still running, instead
+    of starting one.
+    """
+
+    def build():
+        with app.app_context():
+            try:
+                icd10Index()
+
+            except SQLAlchemyError:
+                # e.g. the icd10 table is not created yet,
+                # the first search builds the index then
+                app.logger.warning(
+                    "Could not build the ICD-10 index.", exc_info=True
+                )
+
+    threading.Thread(target=build, daemon=True).start()
+
+
+def clearICD10Index():
+    global _index
+
+    with _lock:
+        _index = None
+
+
+@event.listens_for(Session, "before_flush")
+def markICD10Writes(session, flush_context, instances):
+    if any(
+        isinstance(instance, ICD10Model)
+        for instance in (*session.new, *session.dirty, *session.deleted)
+    ):
+        session.info["icd10_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def clearICD10OnCommit(session):
+    if session.info.pop("icd10_changed", False):
+        clearICD10Index()
+
+
+@event.listens_for(Session, "after_rollback")
+def forgetICD10Writes(session):
+    session.info.pop("icd10_changed", None)
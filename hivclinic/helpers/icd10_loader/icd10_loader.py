@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+
+from sqlalchemy import text
+
+from hivclinic import db
+from hivclinic.models.icd10_model import ICD10Model
+
+ICD10_FILE = "./hivclinic/data/icd10.json"
+
+
+def readICD10File(path: str = ICD10_FILE):
+    """(code, description) pairs of an ICD-10 JSON list, one per code."""
+    with open(path) as file:
+        icd10_dict = json.load(file)
+
+    # a code listed twice keeps its last description
+    entries = {
+        icd10_entry["icd10"]: icd10_entry["description"]
+        for icd10_entry in icd10_dict
+    }
+
+    return list(entries.items())
+
+
+def copyRows(table: str, entries):
+    """COPY the entries into the icd10 and description columns of table.
+
+    Runs on the connection of the session, so the rows are committed or
+    rolled back with it.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(entries)
+    buffer.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table} (icd10, description) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+    return cursor.rowcount
+
+
+def loadICD10(entries):
+    """Insert the entries into the icd10 table, returns the rows added."""
+    return copyRows(ICD10Model.__tablename__, entries)
+
+
+def syncICD10(entries):
+    """Sync the icd10 table to the entries without dropping it.
+
+    Descriptions of listed codes are updated, new codes inserted and
+    codes missing from the entries deleted. Returns the number of rows
+    updated, inserted and deleted.
+    """
+    db.session.execute(
+        text(
+            "CREATE TEMP TABLE icd10_staging "
+            "(icd10 text PRIMARY KEY, description text)"
+        )
+    )
+    copyRows("icd10_staging", entries)
+
+    updated = db.session.execute(
+        text(
+            "UPDATE icd10 SET description = staging.description "
+            "FROM icd10_staging AS staging "
+            "WHERE icd10.icd10 = staging.icd10 "
+            "AND icd10.description IS DISTINCT FROM staging.description"
+        )
+    ).rowcount
+
+    inserted = db.session.execute(
+        text(
+            "INSERT INTO icd10 (icd10, description) "
+            "SELECT icd10, description FROM icd10_staging AS staging "
+            "WHERE NOT EXISTS "
+            "(SELECT 1 FROM icd10 WHERE icd10.icd10 = staging.icd10)"
+        )
+    ).rowcount
+
+    deleted = db.session.execute(
+        text(
+            "DELETE FROM icd10 WHERE NOT EXISTS "
+            "(SELECT 1 FROM icd10_staging AS staging "
+            "WHERE staging.icd10 = icd10.icd10)"
+        )
+    ).rowcount
+
+    db.session.execute(text("DROP TABLE icd10_staging"))
+
+    return {"updated": updated, "inserted": inserted, "deleted": deleted}
@@ -0,0 +1,25 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+
+def encodeCursor(*values):
+    """Opaque cursor holding the sort key of the last row of a page."""
+    cursor = json.dumps([str(value) for value in values]).encode("utf-8")
+
+    return urlsafe_b64encode(cursor).decode("ascii").rstrip("=")
+
+
+def decodeCursor(cursor: str):
+    """Values of an encodeCursor cursor as strings.
+
+    Raises ValueError if the cursor was not made by encodeCursor.
+    """
+    cursor = cursor + "=" * (-len(cursor) % 4)
+    values = json.loads(urlsafe_b64decode(cursor.encode("ascii")))
+
+    if not isinstance(values, list) or not all(
+        isinstance(value, str) for value in values
+    ):
+        raise ValueError("Invalid cursor.")
+
+    return values
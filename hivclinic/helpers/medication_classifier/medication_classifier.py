@@ -0,0 +1,178 @@
+import re
+
+ARV_MED_REGEX = [
+    ["Teevir", r"TEEVIR"],
+    ["TENO-EM", r"(?<!\(PEP\))TENO-EM"],
+    ["Efavirenz (600)", r"Efavirenz.600"],
+    ["Efavirenz (200/400mg)", r"Efavirenz.200"],
+    ["Tenofovir", r"TENOFOVIR"],
+    ["Lamivudine", r"Lamivudine"],
+    ["Abacavir", r"Abacavir"],
+    ["Raltegravir", r"Raltegravir"],
+    ["Zidovudine", r"Zidovudine|zidovudine"],
+    ["Zilarvir [AZT(300)/3TC(150)]", r"ZILARVIR|Zilavir"],
+    ["Combivir [AZT(300)/3TC(150)]", r"Combivir"],
+    ["Nevirapine", r"Nevirapine"],
+    ["Lopinavir", r"Lopinavir"],
+    ["GPO-VIR Z250", r"GPO-VIR.Z250"],
+    ["GPO-VIR S30", r"GPO-VIR.S30"],
+    ["Rilpivirine", r"(?<!\(PEP\))Rilpivirine"],
+    ["TDF300+FTC200", r"(?<!PrEP)\(TDF300\+FTC200\)"],
+    ["TDF300+3TC300+EFV600", r"TDF300\+3TC300\+EFV600"],
+    ["Lamivudine", r"LAMIVIR"],
+]
+
+OI_MED_REGEX = [
+    ["Azithromycin", r"Azithromycin"],
+    ["Fluconazole", r"Fluconazole"],
+    ["Bactrim", r"Co-Trimoxazole"],
+]
+
+TB_MED_REGEX = [
+    ["Rifampicin", r"Rifampicin"],
+    ["Ethambutol", r"Ethambutol"],
+    ["Isoniazid", r"(?:Isoniazid|i\.n\.h)"],
+    ["Pyrazinamide", r"Pyrazinamide"],
+    ["Kanamycin", r"Kanamycin"],
+    ["Gentamicin", r"Gentamicin"],
+    ["Ethionamide", r"Ethionamide"],
+    ["Cycloserine", r"Cycloserine"],
+    ["Levofloxacin", r"Levofloxacin"],
+]
+
+STD_MED_REGEX = [["Benzathine Penicillin", r"Benzathine Penicillin"]]
+
+MEDICATION_REGEX = {
+    "arv": ARV_MED_REGEX,
+    "tb": TB_MED_REGEX,
+    "oi": OI_MED_REGEX,
+    "std": STD_MED_REGEX,
+}
+
+HIV_IMPRESSION = "B20: Human immunodeficiency virus [HIV] disease"
+LATENT_TB_IMPRESSION = (
+    "R7611: Nonspecific reaction to tuberculin skin "
+    + "test without active tuberculosis"
+)
+TB_IMPRESSION = "A159: Respiratory tuberculosis unspecified"
+SYPHILIS_IMPRESSION = "A539: Syphilis, unspecified"
+
+# a full regimen on their own
+SINGLE_TABLET_REGIMENS = {
+    "Teevir",
+    "GPO-VIR Z250",
+    "GPO-VIR S30",
+    "TDF300+3TC300+EFV600",
+}
+
+# a full regimen with one more ARV
+FIXED_DOSE_BACKBONES = {
+    "TENO-EM",
+    "Zilarvir [AZT(300)/3TC(150)]",
+    "Combivir [AZT(300)/3TC(150)]",
+}
+
+
+def medicationString(medications: list):
+    return "::".join(medications).lower()
+
+
+def inferImpressions(found: dict):
+    """Impressions implied by the medications found of each category."""
+    arv = found["arv"]
+    tb = found["tb"]
+    impression = []
+
+    if (
+        arv & SINGLE_TABLET_REGIMENS
+        or len(arv) >= 3
+        or (len(arv) >= 2 and arv & FIXED_DOSE_BACKBONES)
+    ):
+        impression.append(HIV_IMPRESSION)
+
+    if tb == {"Isoniazid"}:
+        impression.append(LATENT_TB_IMPRESSION)
+
+    if len(tb) >= 2:
+        impression.append(TB_IMPRESSION)
+
+    if found["std"]:
+        impression.append(SYPHILIS_IMPRESSION)
+
+    return impression
+
+
+def classification(found: dict):
+    impression = inferImpressions(found)
+
+    # oi medications, must have HIV first
+    oiMedications = found["oi"] if HIV_IMPRESSION in impression else set()
+
+    return {
+        "arvMedications": sorted(found["arv"]),
+        "tbMedications": sorted(found["tb"]),
+        "oiMedications": sorted(oiMedications),
+        "impression": sorted(impression),
+    }
+
+
+class MedicationClassifier(object):
+    """Classifier of the medication lists scraped from HCIS.
+
+    Every pattern is compiled once, lowercased as the medication string
+    is, so the searches run without IGNORECASE and use the fast literal
+    prefix scan of re. Patterns must therefore not rely on the case of
+    an escape, such as \\S or \\W.
+    """
+
+    def __init__(self, regex_tables: dict = MEDICATION_REGEX):
+        self.matchers = [
+            (category, name, re.compile(regex.lower()))
+            for category, regex_table in regex_tables.items()
+            for name, regex in regex_table
+        ]
+        self.categories = list(regex_tables)
+
+    def find(self, medications: list):
+        """The medication names found of each category, as sets."""
+        found = {category: set() for category in self.categories}
+        all_medication_string = medicationString(medications)
+
+        for category, name, matcher in self.matchers:
+            if matcher.search(all_medication_string):
+                found[category].add(name)
+
+        return found
+
+    def classify(self, medications: list):
+        """ARV, TB and OI medications and the impressions they imply."""
+        return classification(self.find(medications))
+
+
+_classifier = MedicationClassifier()
+
+
+def classifyMedications(medications: list):
+    return _classifier.classify(medications)
+
+
+def legacyClassifyMedications(medications: list):
+    # one search per pattern, kept to benchmark and check the classifier
+    all_medication_string = medicationString(medications)
+
+    found = {
+        category: {
+            name
+            for name, regex in regex_table
+            if re.search(regex, all_medication_string, re.IGNORECASE)
+        }
+        for category, regex_table in MEDICATION_REGEX.items()
+    }
+
+    return classification(found)
+
+
+MEDICATION_CLASSIFIERS = {
+    "legacy": legacyClassifyMedications,
+    "compiled": classifyMedications,
+}
@@ -0,0 +1,264 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+def getNationalityStats(df):
+    df = df.loc[:, ["ID", "Nationality", "Healthcare scheme"]]
+
+    count_data = (
+        df.groupby([df.loc[:, "Nationality"], df.loc[:, "Healthcare scheme"]])
+        .agg({"count"})
+        .sort_index()
+    )
+
+    count_data.columns = ["Cases"]
+
+    return count_data
+
+
+def calculate_age(born):
+    if isinstance(born, date):
+        today = date.today()
+        age = (
+            today.year
+            - born.year
+            - ((today.month, today.day) < (born.month, born.day))
+        )
+
+        return age
+
+    else:
+        return None
+
+
+def getAgeCrossedTable(df, column_names=[], no_data_as="No Data"):
+    bins = np.arange(0, 1000, 10)
+    groupby_columns = [pd.cut(df.Age, bins)] + column_names
+
+    df.drop(["Age"], axis=1, inplace=True)
+    df.fillna(no_data_as, inplace=True)
+
+    count_data = df.groupby(groupby_columns).agg({"count"}).sort_index()
+
+    # rename columns
+    count_data.columns = ["#"]
+
+    return count_data
+
+
+def grouppedTable(df, column_names=[], no_data_as="No Data"):
+    df.fillna(no_data_as, inplace=True)
+    count_data = df.groupby(column_names).agg({"count"}).sort_index()
+
+    # rename columns
+    count_data.columns = ["#"]
+
+    count_data.sort_index(inplace=True)
+
+    return count_data
+
+
+def getCD4CrossedTable(
+    df, column_names=[], cd4_column_name=None, no_data_as="No Data"
+):
+    df.dropna(axis="index", subset=[cd4_column_name], inplace=True)
+
+    bins = [-1, 200, 350, 5000]
+    labels = ["[0, 200]", "(200, 350]", "(350, ∞)"]
+
+    groupby_columns = [
+        pd.cut(df.loc[:, cd4_column_name], bins=bins, labels=labels)
+    ] + column_names
+
+    df.drop([cd4_column_name], axis=1, inplace=True)
+    df.fillna(no_data_as, inplace=True)
+
+    count_data = df.groupby(groupby_columns).agg({"count"}).sort_index()
+
+    # rename columns
+    count_data.columns = ["#"]
+
+    return count_data
+
+
+def getVLTable(df, column_names=[], vl_column_name=None, no_data_as="No Data"):
+    df.dropna(axis="index", subset=[vl_column_name], inplace=True)
+    df.replace("Undetectable", -1, inplace=True)
+    df[vl_column_name] = df[vl_column_name].astype(int)
+
+    bins = [-2, 0, 200, 1000, 9999999]
+    labels = ["Undetectable", "VL ≤ 200", "VL ≤ 1000", "VL > 1000"]
+
+    groupby_columns = [
+        pd.cut(df.loc[:, vl_column_name], bins=bins, labels=labels)
+    ] + column_names
+
+    df.drop([vl_column_name], axis=1, inplace=True)
+    df.fillna(no_data_as, inplace=True)
+
+    count_data = df.groupby(groupby_columns).agg({"count"}).sort_index()
+
+    # rename columns
+    count_data.columns = ["#"]
+
+    return count_data
+
+
+def legacyOverviewTables(patientDataDict_df, joinArrayBy=","):
+    """Overview crosstabs, one sliced copy and groupby per table.
+
+    This is the original implementation, kept as the "legacy" engine so
+    `flask benchmark overview` can compare it with the vectorized one.
+    """
+    # recalculate age as relative time
+    patientDataDict_df["Date of birth"] = pd.to_datetime(
+        patientDataDict_df["Date of birth"], errors="ignore", format="%d-%m-%Y"
+    )
+
+    # calculate age
+    patientDataDict_df["Age"] = patientDataDict_df["Date of birth"].apply(
+        calculate_age
+    )
+
+    # thais and nonthais
+    thais_df = patientDataDict_df.where(
+        patientDataDict_df["Nationality"] == "ไทย"
+    )
+
+    nonthais_df = patientDataDict_df.where(
+        patientDataDict_df["Nationality"] != "ไทย"
+    )
+
+    # count nationality
+    patient_nationality = getNationalityStats(patientDataDict_df)
+
+    # patient_age_sex_gender
+    patient_age_sex_gender = getAgeCrossedTable(
+        df=patientDataDict_df.loc[:, ["ID", "Age", "Sex", "Gender"]],
+        column_names=["Sex", "Gender"],
+    )
+
+    # Age/Nationality/Referral Status/Referred From
+    patient_age_nat_referral = getAgeCrossedTable(
+        df=patientDataDict_df.loc[
+            :, ["ID", "Age", "Nationality", "Referral status", "Referred from"]
+        ],
+        column_names=["Nationality", "Referral status", "Referred from"],
+        no_data_as="N/A",
+    )
+
+    # Age/Nationality/Patient Status/Referred Out To
+    patient_age_nat_referral_out = getAgeCrossedTable(
+        df=patientDataDict_df.loc[
+            :,
+            ["ID", "Age", "Nationality", "Patient status", "Referred out to"],
+        ],
+        column_names=["Nationality", "Patient status", "Referred out to"],
+        no_data_as="N/A",
+    )
+
+    # Age/Sex/Gender/Risk Behaviors
+    patient_age_sex_gender_risk = getAgeCrossedTable(
+        df=patientDataDict_df.loc[
+            :, ["ID", "Age", "Sex", "Gender", "Risk behaviors"]
+        ],
+        column_names=["Sex", "Gender", "Risk behaviors"],
+    )
+
+    # Other diagnosis before ARV initiation
+    column_name = "Other diagnosis before ARV initiation"
+
+    dx_df = patientDataDict_df.loc[:, ["ID", column_name]]
+
+    dx_df[column_name] = dx_df[column_name].apply(
+        lambda data_string: data_string.split(joinArrayBy)
+        if isinstance(data_string, str)
+        else data_string
+    )
+
+    dx_df = dx_df.explode(column_name)
+
+    patient_other_dx = grouppedTable(
+        df=dx_df.loc[:, ["ID", column_name]],
+        column_names=[column_name],
+        no_data_as="N/A",
+    )
+
+    # Current ARV Regimen
+    patient_current_arv = grouppedTable(
+        df=patientDataDict_df.loc[:, ["ID", "Last ARV regimen"]],
+        column_names=["Last ARV regimen"],
+        no_data_as="N/A",
+    )
+
+    # initial cd4 by sex & gender
+    init_cd4_sex_gender = getCD4CrossedTable(
+        df=patientDataDict_df.loc[
+            :, ["ID", "First CD4 result", "Sex", "Gender"]
+        ],
+        cd4_column_name="First CD4 result",
+        column_names=["Sex", "Gender"],
+    )
+
+    # last cd4 by sex & gender
+    last_cd4_sex_gender = getCD4CrossedTable(
+        df=patientDataDict_df.loc[
+            :, ["ID", "Last CD4 result", "Sex", "Gender"]
+        ],
+        cd4_column_name="Last CD4 result",
+        column_names=["Sex", "Gender"],
+    )
+
+    # initial cd4 by sex & gender for Thais
+    init_cd4_sex_gender_thais = getCD4CrossedTable(
+        df=thais_df.loc[:, ["ID", "First CD4 result", "Sex", "Gender"]],
+        cd4_column_name="First CD4 result",
+        column_names=["Sex", "Gender"],
+    )
+
+    # last cd4 by sex & gender for Thais
+    last_cd4_sex_gender_thais = getCD4CrossedTable(
+        df=thais_df.loc[:, ["ID", "Last CD4 result", "Sex", "Gender"]],
+        cd4_column_name="Last CD4 result",
+        column_names=["Sex", "Gender"],
+    )
+
+    # initial cd4 by sex & gender for non-thais
+    init_cd4_sex_gender_nonthais = getCD4CrossedTable(
+        df=nonthais_df.loc[:, ["ID", "First CD4 result", "Sex", "Gender"]],
+        cd4_column_name="First CD4 result",
+        column_names=["Sex", "Gender"],
+    )
+
+    # last cd4 by sex & gender for non-thais
+    last_cd4_sex_gender_nonthais = getCD4CrossedTable(
+        df=nonthais_df.loc[:, ["ID", "Last CD4 result", "Sex", "Gender"]],
+        cd4_column_name="Last CD4 result",
+        column_names=["Sex", "Gender"],
+    )
+
+    # last VL
+    last_vl = getVLTable(
+        df=patientDataDict_df.loc[:, ["ID", "Last viral load result"]],
+        vl_column_name="Last viral load result",
+        column_names=[],
+    )
+
+    return {
+        "patientNationality": patient_nationality,
+        "patientAgeSexGender": patient_age_sex_gender,
+        "patientAgeNatRefferIn": patient_age_nat_referral,
+        "patientAgeNatRefferOut": patient_age_nat_referral_out,
+        "patientAgeSexGenderRisk": patient_age_sex_gender_risk,
+        "patienOtherDx": patient_other_dx,
+        "patientCurrentARV": patient_current_arv,
+        "initCD4SexGender": init_cd4_sex_gender,
+        "lastCD4SexGender": last_cd4_sex_gender,
+        "initCD4SexGenderThais": init_cd4_sex_gender_thais,
+        "lastCD4SexGenderThais": last_cd4_sex_gender_thais,
+        "initCD4SexGenderNonThais": init_cd4_sex_gender_nonthais,
+        "lastCD4SexGenderNonThais": last_cd4_sex_gender_nonthais,
+        "lastVL": last_vl,
+    }
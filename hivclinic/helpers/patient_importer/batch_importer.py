@@ -0,0 +1,441 @@
+import json
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import text
+
+from hivclinic import db
+from hivclinic.helpers.medication_classifier.medication_classifier import (
+    classifyMedications,
+)
+from hivclinic.helpers.statistics_rollup.statistics_rollup import (
+    refreshPatientStatistics,
+)
+from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.visit_model import VisitModel
+from hivclinic.schemas.investigation_schema import InvestigationSchema
+from hivclinic.schemas.patient_schema import PatientSchema
+from hivclinic.schemas.visit_schema import VisitSchema
+
+# patients per transaction, rows per INSERT statement
+PATIENT_BATCH_SIZE = 500
+ROW_BATCH_SIZE = 1000
+
+
+def convertToDate(date_str: str):
+    date_str = date_str.split(" ")[0]
+
+    thai_date_regex = r"(\d+)\/(\d+)\/(\d+)"
+    match = re.search(thai_date_regex, date_str)
+
+    if match:
+        day, month, year = match.groups()
+        year = int(year)
+
+        if year >= 2100:
+            year = year - 543
+
+        date_str = f"{year}-{month}-{day}"
+
+    return date_str
+
+
+class ImportPatientSchema(PatientSchema):
+    # the HN is the conflict target of the upsert, no lookup per patient
+    def validate_unique_ids(self, data):
+        pass
+
+
+def dataColumns(Model):
+    """Columns an imported row may set, the HCIS entry picks which."""
+    skip_keys = (
+        set(Model.do_not_update_keys)
+        | set(Model.relationship_keys)
+        | set(["modified_on"])
+    )
+
+    return [
+        column.key
+        for column in Model.__table__.columns
+        if column.key not in skip_keys
+    ]
+
+
+def upsertRows(Model, rows, index_elements, update_keys, index_where=""):
+    """INSERT ... ON CONFLICT DO UPDATE the rows, ROW_BATCH_SIZE at once.
+
+    Every batch is sent as one JSON array and expanded to the row type of
+    the table by json_populate_recordset, which also casts the values.
+    All rows must have the same keys. Returns the id, the index_elements
+    and whether it was inserted of every row.
+    """
+    table = Model.__tablename__
+    results = []
+
+    if not rows:
+        return results
+
+    columns = ", ".join(f'"{key}"' for key in rows[0])
+    conflict = ", ".join(f'"{key}"' for key in index_elements)
+    updates = ", ".join(f'"{key}" = excluded."{key}"' for key in update_keys)
+
+    statement = text(
+        f"INSERT INTO {table} ({columns}) "
+        f"SELECT {columns} FROM json_populate_recordset(NULL::{table}, "
+        f"CAST(:rows AS json)) "
+        f"ON CONFLICT ({conflict}) {index_where} "
+        f"DO UPDATE SET {updates} "
+        # xmax is only set on the rows that were updated
+        f"RETURNING id, {conflict}, xmax = 0 AS inserted"
+    )
+
+    for start in range(0, len(rows), ROW_BATCH_SIZE):
+        batch = rows[start : start + ROW_BATCH_SIZE]  # noqa
+
+        results.extend(
+            db.session.execute(
+                statement, {"rows": json.dumps(batch, default=str)}
+            )
+        )
+
+    return results
+
+
+def loadRow(schema, data, keys):
+    model = schema.load(data)
+
+    return {key: getattr(model, key) for key in keys}
+
+
+class BatchImporter(object):
+    """Upsert HCIS patient records, one transaction per batch_size.
+
+    Every batch is written with a few multi row upserts, conflicting on
+    the patient HN and on the (patientID, date) of the imported
+    investigations and visits, so nothing is looked up row by row.
+    """
+
+    def __init__(self, batch_size: int = PATIENT_BATCH_SIZE):
+        self.batch_size = batch_size
+
+        self.patient_schema = ImportPatientSchema(
+            many=False, unknown="EXCLUDE"
+        )
+        self.ix_schema = InvestigationSchema(many=False)
+        self.visit_schema = VisitSchema(many=False)
+
+        self.ix_keys = dataColumns(InvestigationModel)
+        self.visit_keys = dataColumns(VisitModel)
+
+    def stageRecord(self, record):
+        """Patient, investigation and visit rows of an HCIS record.
+
+        The investigations and visits are keyed by their loaded date, so
+        "05/01/2562" and "5/1/2562" are one row, and a date listed twice
+        keeps its last entry. Visits without a prescription only add the
+        dates missing from the prescriptions. A row only has the keys its
+        entry has, so a re-import leaves the other columns as they are.
+        """
+        dermographic = dict(record["dermographic"])
+        dermographic["dateOfBirth"] = convertToDate(
+            dermographic["dateOfBirth"]
+        )
+
+        patient_model = self.patient_schema.load(dermographic, transient=True)
+        patient = {
+            key: getattr(patient_model, key)
+            for key in dermographic
+            if key in PatientModel.__table__.c
+        }
+
+        hn = patient["hn"]
+        investigations = {}
+        visits = {}
+
+        for ix in record.get("ix", []):
+            ix = dict(ix, date=convertToDate(ix["date"]))
+
+            try:
+                ix_row = loadRow(
+                    self.ix_schema,
+                    ix,
+                    [key for key in self.ix_keys if key in ix],
+                )
+                investigations[ix_row["date"]] = ix_row
+
+            except Exception as e:
+                current_app.logger.warn(
+                    f"Unable to import investigation of "
+                    f"patient HN {hn} "
+                    f"on {ix['date']}"
+                    f" with this error {e}, skipping."
+                )
+
+        visit_entries = []
+        for date, medications in record.get("med", []):
+            medications = medications or []
+
+            visit_entries.append(
+                {
+                    "date": convertToDate(date),
+                    "medications": sorted(medications),
+                    **classifyMedications(medications),
+                }
+            )
+
+        visit_entries.extend(
+            {"date": convertToDate(date)} for date in record.get("visits", [])
+        )
+
+        for visit_entry in visit_entries:
+            try:
+                visit_row = loadRow(
+                    self.visit_schema,
+                    visit_entry,
+                    [key for key in self.visit_keys if key in visit_entry],
+                )
+
+                # the prescriptions come first
+                if "medications" in visit_entry or (
+                    visit_row["date"] not in visits
+                ):
+                    visits[visit_row["date"]] = visit_row
+
+            except Exception as e:
+                current_app.logger.warn(
+                    f"Unable to import visit of "
+                    f"patient HN {hn} "
+                    f"on {visit_entry['date']}"
+                    f" with this error {e}, skipping."
+                )
+
+        return patient, investigations, visits
+
+    def upsertPatients(self, patients):
+        """Upsert the patients on their HN, returns the HN to ID map."""
+        counts = Counter()
+        patientIDs = {}
+
+        # the rows of one statement need the same keys
+        groups = {}
+        for patient in patients:
+            groups.setdefault(tuple(sorted(patient)), []).append(patient)
+
+        for keys, rows in groups.items():
+            update_keys = [
+                key for key in keys if key not in ("hn", "created_on")
+            ]
+
+            for row in upsertRows(PatientModel, rows, ["hn"], update_keys):
+                patientIDs[row.hn] = row.id
+                counts["inserted" if row.inserted else "updated"] += 1
+
+        return patientIDs, counts
+
+    def upsertImported(self, Model, rows):
+        """Upsert imported rows on their (patientID, date).
+
+        Only the columns a row has are updated, e.g. a visit without a
+        prescription keeps the medications and impression filled in by
+        hand.
+        """
+        counts = Counter()
+        data_columns = dataColumns(Model)
+
+        # the rows of one statement need the same keys
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        for keys, group in groups.items():
+            update_keys = [
+                key for key in keys if key in data_columns and key != "date"
+            ] + ["modified_on"]
+
+            for row in upsertRows(
+                Model,
+                group,
+                ["patientID", "date"],
+                update_keys,
+                index_where="WHERE imported",
+            ):
+                counts["inserted" if row.inserted else "updated"] += 1
+
+        return counts
+
+    def importBatch(self, records):
+        """Upsert a batch of records, returns the rows written."""
+        now = datetime.utcnow()
+        timestamps = {"created_on": now, "modified_on": now}
+        staged = {}
+
+        for record in records:
+            try:
+                patient, investigations, visits = self.stageRecord(record)
+
+            except Exception as e:
+                current_app.logger.warn(
+                    f"Unable to import patient HN "
+                    f"{record['dermographic'].get('hn')}"
+                    f" with this error {e}, skipping."
+                )
+                continue
+
+            # a patient listed twice keeps the last record
+            staged[patient["hn"]] = (patient, investigations, visits)
+
+        patientIDs, patient_counts = self.upsertPatients(
+            [
+                dict(patient, imported=True, **timestamps)
+                for patient, _, _ in staged.values()
+            ]
+        )
+
+        ix_rows = []
+        visit_rows = []
+
+        for hn, (_, investigations, visits) in staged.items():
+            imported = dict(
+                patientID=patientIDs[hn], imported=True, **timestamps
+            )
+
+            ix_rows.extend(
+                dict(ix, **imported) for ix in investigations.values()
+            )
+            visit_rows.extend(
+                dict(visit, **imported) for visit in visits.values()
+            )
+
+        counts = {
+            "patients": patient_counts,
+            "investigations": self.upsertImported(InvestigationModel, ix_rows),
+            "visits": self.upsertImported(VisitModel, visit_rows),
+        }
+
+        refreshPatientStatistics(patientIDs.values())
+
+        return counts
+
+    def importRecords(self, records):
+        """Import the records, returns the rows inserted and updated.
+
+        records may be any iterable, e.g. a store read line by line, only
+        batch_size records are held at once.
+        """
+        totals = {
+            key: Counter() for key in ("patients", "investigations", "visits")
+        }
+        records = iter(records)
+        imported = 0
+        start = time.perf_counter()
+
+        while True:
+            batch = list(islice(records, self.batch_size))
+
+            if not batch:
+                break
+
+            counts = self.importBatch(batch)
+            db.session.commit()
+
+            for key, count in counts.items():
+                totals[key].update(count)
+
+            imported += len(batch)
+            rows = sum(sum(count.values()) for count in totals.values())
+            elapsed = time.perf_counter() - start
+
+            current_app.logger.info(
+                "Imported {} patients, {} rows in {:.1f} s "
+                "({:.0f} rows/s).".format(
+                    imported, rows, elapsed, rows / elapsed
+                )
+            )
+
+        return totals
+
+
+def parseViralLoads(results):
+    """VL results as numbers, "< x" as undetectable (-1), FAILED as NaN."""
+    results = results.astype(str)
+    viral_loads = pd.to_numeric(results, errors="coerce")
+
+    viral_loads[results.str.contains("< ", regex=False)] = -1
+    viral_loads[results.str.contains("FAILED", regex=False)] = np.nan
+
+    return viral_loads
+
+
+def convertHNs(hns):
+    """Convert lab HNs to clinic HNs, e.g. 18-612802282 to 2282/61-28."""
+    parts = hns.astype(str).str.extract(r"18-(\d{2})(\d{2})(\d*)")
+
+    return parts[2].str.lstrip("0") + "/" + parts[0] + "-" + parts[1]
+
+
+def importViralLoads(excel_df):
+    """Upsert the VL results of a lab spreadsheet as imported labs.
+
+    The results are matched to the patients by HN with one query and
+    written with one upsert on the (patientID, date) of the imported
+    investigations, which only sets their viral load. Returns the rows
+    inserted and updated and the HNs not found.
+    """
+    vl_df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(excel_df["Requested Date"]).dt.date,
+            "hn": convertHNs(excel_df["HN"]),
+            "viralLoad": parseViralLoads(excel_df["VL Result"]),
+        }
+    ).dropna(how="any")
+
+    hns = vl_df["hn"].unique().tolist()
+    patientIDs = dict(
+        db.session.query(PatientModel.hn, PatientModel.id).filter(
+            PatientModel.hn.in_(hns)
+        )
+    )
+
+    vl_df["patientID"] = vl_df["hn"].map(patientIDs)
+    unmatched = sorted(set(hns) - set(patientIDs))
+
+    # a result listed twice keeps the last one
+    vl_df = vl_df.dropna(subset=["patientID"]).drop_duplicates(
+        subset=["patientID", "date"], keep="last"
+    )
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "date": row.date,
+            "patientID": row.patientID,
+            "viralLoad": row.viralLoad,
+            "imported": True,
+            "created_on": now,
+            "modified_on": now,
+        }
+        for row in vl_df.itertuples(index=False)
+    ]
+
+    results = upsertRows(
+        InvestigationModel,
+        rows,
+        ["patientID", "date"],
+        ["viralLoad", "modified_on"],
+        index_where="WHERE imported",
+    )
+
+    counts = Counter(
+        "inserted" if row.inserted else "updated" for row in results
+    )
+
+    refreshPatientStatistics(vl_df["patientID"].unique().tolist())
+
+    return counts, unmatched
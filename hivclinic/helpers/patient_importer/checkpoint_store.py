@@ -0,0 +1,61 @@
+import json
+import sqlite3
+
+
+class CheckpointStore(object):
+    """SQLite staging store of the sections scraped for each HN.
+
+    A section (ix, med, dermographic or visits) is committed as soon as
+    it is scraped, so a worker that gives up on an HN, or a scraper that
+    is killed, resumes from the sections already stored. Every process
+    opens its own store, WAL lets them read while one of them writes.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS section ("
+                "hn TEXT NOT NULL, "
+                "name TEXT NOT NULL, "
+                "data TEXT NOT NULL, "
+                "PRIMARY KEY (hn, name))"
+            )
+
+    def save(self, hn, **sections):
+        """Store the sections of an HN in one transaction."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO section (hn, name, data) "
+                "VALUES (?, ?, ?)",
+                [
+                    (hn, name, json.dumps(data))
+                    for name, data in sections.items()
+                ],
+            )
+
+    def sections(self, hn):
+        """The sections stored for an HN, by name."""
+        rows = self.connection.execute(
+            "SELECT name, data FROM section WHERE hn = ?", (hn,)
+        )
+
+        return {name: json.loads(data) for name, data in rows}
+
+    def hns(self):
+        """The HNs with at least one section stored."""
+        rows = self.connection.execute("SELECT DISTINCT hn FROM section")
+
+        return [hn for hn, in rows]
+
+    def discard(self, hns):
+        """Drop the sections of the HNs, e.g. once their record is saved."""
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM section WHERE hn = ?", [(hn,) for hn in hns]
+            )
+
+    def close(self):
+        self.connection.close()
@@ -1,3 +1,4 @@
+import json
 import re
 
 from bs4 import BeautifulSoup
@@ -7,6 +8,8 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 
+from .hcis_waits import markPage, waitForPage
+
 LABS_REGEX = [
     ["viralLoad", r"(?:VL|Viral.*):::(<\s*\d+|\d+)"],
     ["percentCD4", r"(?:%CD4):::(\d+.\d+|\d+)"],
@@ -46,12 +49,60 @@ LABS_REGEX = [
     ["lpa", r"(?:LPA.+):::([\w:,\ ]+)"],
 ]
 
+# Runs in IE, ES5 only. For each [css, property, name regex] spec, reads
+# the class of the first element whose name matches and the text or
+# value of all of them, returned as one JSON string. IE7/8 document
+# modes have no textContent and may have no JSON, the text falls back
+# to innerText and the results are returned as an array.
+EXTRACT_ELEMENTS_SCRIPT = """
+var specs = arguments[0];
+var results = [];
+
+for (var i = 0; i < specs.length; i++) {
+    var elements = document.querySelectorAll(specs[i][0]);
+    var name = new RegExp(specs[i][2]);
+    var hcisClass = null;
+    var values = [];
+
+    for (var j = 0; j < elements.length; j++) {
+        if (!name.test(elements[j].getAttribute("name") || "")) {
+            continue;
+        }
+
+        if (hcisClass === null) {
+            hcisClass = elements[j].className;
+        }
+
+        values.push(
+            specs[i][1] === "text"
+                ? elements[j].textContent || elements[j].innerText
+                : elements[j].value
+        );
+    }
+
+    results.push([hcisClass, values]);
+}
+
+return window.JSON ? JSON.stringify(results) : results;
+"""
+
+DISPLAYED_HN_SCRIPT = """
+var hn = document.querySelector("span[name=t_hndsp_0]");
+return hn ? hn.textContent || hn.innerText : null;
+"""
+
+MEDICATION_SPEC = ["span[name^='meditem_name_']", "text", r"^meditem_name_\d+"]
+LAB_NAME_SPEC = [
+    "input[name^='labexm_labexmnm_']",
+    "value",
+    r"^labexm_labexmnm_\d+",
+]
+LAB_RESULT_SPEC = ["input[name^='compute_2_']", "value", r"^compute_2_\d+"]
+HN_SPEC = ["input[name*='c_hn_']", "value", r"c_hn_\d+"]
+
 
 def waitForPageReady(wait):
-    loading_css = "#AWMOD"
-    wait.until(
-        EC.invisibility_of_element_located((By.CSS_SELECTOR, loading_css))
-    )
+    waitForPage(wait)
 
 
 def convertToDate(date_str: str):
@@ -77,8 +128,16 @@ def readHN(page_source):
     return hn
 
 
-def waitForHNToLoaded(wait, hn):
-    wait.until(lambda d: (readHN(d.page_source) == hn))
+def readDisplayedHN(driver):
+    return driver.execute_script(DISPLAYED_HN_SCRIPT)
+
+
+def waitForHNToLoaded(wait, hn, in_browser=False, hnReader=readHN):
+    if in_browser:
+        waitForPage(wait, lambda d: readDisplayedHN(d) == hn)
+
+    else:
+        waitForPage(wait, lambda d: hnReader(d.page_source) == hn)
 
 
 def searchHN(wait, text_box_css: str, hn: str):
@@ -96,8 +155,9 @@ def searchHN(wait, text_box_css: str, hn: str):
 def isNextPageLinkExists(driver, wait):
     next_page_link_css = "td > a[href*='PageNext']"
 
-    soup = BeautifulSoup(driver.page_source, "lxml")
-    is_next_page_link = bool(soup.select_one(next_page_link_css))
+    is_next_page_link = bool(
+        driver.find_elements_by_css_selector(next_page_link_css)
+    )
 
     if is_next_page_link:
         return wait.until(
@@ -113,8 +173,7 @@ def isNextPageLinkExists(driver, wait):
 def isDisplayPatientInfo(driver, wait):
     hn_css = "span[name='t_hndsp_0']"
 
-    soup = BeautifulSoup(driver.page_source, "lxml")
-    return bool(soup.select_one(hn_css))
+    return bool(driver.find_elements_by_css_selector(hn_css))
 
 
 def clickNew(wait, click_new_button=True):
@@ -182,18 +241,13 @@ def praseTwoTablePage(
     elementsPraser: object,
 ) -> list:
     results = []
+    hcis_class = None
     is_first_element = True
 
     while True:
         elements = driver.find_elements_by_css_selector(date_element_css)
 
         for element in elements:
-            # read subelements
-            first_page_source = driver.page_source
-            first_hcis_class, _ = elementsPraser(
-                page_source=driver.page_source, wait=wait
-            )
-
             # read dates
             date_str = element.text.split(element_text_split_by)[0]
             date_str = convertToDate(date_str)
@@ -203,28 +257,30 @@ def praseTwoTablePage(
                 "return arguments[0].scrollIntoView();", element
             )
 
+            page = markPage(wait)
+
             actions = ActionChains(driver)
             actions.move_to_element(element).perform()
             actions.double_click(element).perform()
 
-            # wait
-            waitForPageReady(wait=wait)
+            # wait, parsing the page only when the page marker changed
+            if is_first_element:
+                is_first_element = False
+                waitForPageReady(wait=wait)
 
-            if not is_first_element:
-                wait.until(
-                    lambda d: first_page_source != d.page_source
-                    and isTwoTableGridLoaded(
+            else:
+                waitForPage(
+                    wait,
+                    lambda d: isTwoTableGridLoaded(
                         elementsPraser(page_source=d.page_source, wait=wait)[
                             0
                         ],
-                        first_hcis_class,
-                    )
+                        hcis_class,
+                    ),
+                    since=page,
                 )
 
-            else:
-                is_first_element = False
-
-            _, results_grid = elementsPraser(
+            hcis_class, results_grid = elementsPraser(
                 page_source=driver.page_source, wait=wait
             )
             results.append([date_str, results_grid])
@@ -234,7 +290,9 @@ def praseTwoTablePage(
 
         if next_page:
             is_first_element = True
+            page = markPage(wait)
             next_page.click()
+            waitForPage(wait, since=page)
 
         else:
             break
@@ -253,6 +311,94 @@ def isTwoTableGridLoaded(a_class: str, b_class: str) -> bool:
         return False
 
 
+def readTwoTablePage(
+    driver,
+    wait,
+    date_element_css: str,
+    element_text_split_by: str,
+    elementsReader: object,
+) -> list:
+    """praseTwoTablePage, reading the grids in the browser.
+
+    elementsReader returns the class fingerprint and the values of the
+    grid, as the prase* parsers do, without fetching the page source.
+    HCIS changes the class of the grid when it loads another row, the
+    class read after a row is the one to wait to change on the next.
+    """
+    results = []
+    hcis_class = None
+    is_first_element = True
+
+    while True:
+        elements = driver.find_elements_by_css_selector(date_element_css)
+
+        for element in elements:
+            # read dates
+            date_str = element.text.split(element_text_split_by)[0]
+            date_str = convertToDate(date_str)
+
+            # scrolls items into view
+            driver.execute_script(
+                "return arguments[0].scrollIntoView();", element
+            )
+
+            page = markPage(wait)
+
+            actions = ActionChains(driver)
+            actions.move_to_element(element).perform()
+            actions.double_click(element).perform()
+
+            # wait, reading the grids only when the page marker changed
+            if is_first_element:
+                is_first_element = False
+
+                # nothing to compare with, wait for a grid to show
+                try:
+                    waitForPage(wait, lambda d: elementsReader(d)[1])
+
+                except TimeoutException:
+                    # no elements found
+                    pass
+
+            else:
+                # a timeout would save the grid of the last row again
+                waitForPage(
+                    wait,
+                    lambda d: isTwoTableGridLoaded(
+                        elementsReader(d)[0], hcis_class
+                    ),
+                    since=page,
+                )
+
+            hcis_class, results_grid = elementsReader(driver)
+            results.append([date_str, results_grid])
+
+        # if there is a next page
+        next_page = isNextPageLinkExists(driver, wait)
+
+        if next_page:
+            is_first_element = True
+            page = markPage(wait)
+            next_page.click()
+            waitForPage(wait, since=page)
+
+        else:
+            break
+
+    return results
+
+
+def extractElements(driver, *specs):
+    """[class, values] of the elements of each spec, read in the browser."""
+    results = driver.execute_script(EXTRACT_ELEMENTS_SCRIPT, list(specs))
+
+    # a browser without JSON returns the array itself
+    if isinstance(results, str):
+        results = json.loads(results)
+
+    return results
+
+
 def praseMedication(page_source, wait) -> list:
     read_from_name_regex = r"^meditem_name_\d+"
     read_from_name_css = "span[name^='meditem_name_']"
@@ -294,9 +440,14 @@ def praseMedication(page_source, wait) -> list:
     return hcis_class, medications
 
 
-def praseInvestigation(page_source, wait) -> str:
-    lab_string = ""
+def readMedication(driver) -> list:
+    """praseMedication, read in the browser."""
+    hcis_class, medications = extractElements(driver, MEDICATION_SPEC)[0]
+
+    return hcis_class, sorted(medications)
 
+
+def praseInvestigation(page_source, wait) -> str:
     ix_name_regex = r"^labexm_labexmnm_\d+"
     ix_result_regex = r"^compute_2_\d+"
 
@@ -338,6 +489,20 @@ def praseInvestigation(page_source, wait) -> str:
     lab_names = [name.get("value") for name in lab_names]
     lab_results = [result.get("value") for result in lab_results]
 
+    return hcis_class, labString(lab_names, lab_results)
+
+
+def readInvestigation(driver) -> str:
+    """praseInvestigation, read in the browser."""
+    (hcis_class, lab_names), (_, lab_results) = extractElements(
+        driver, LAB_NAME_SPEC, LAB_RESULT_SPEC
+    )
+
+    return hcis_class, labString(lab_names, lab_results)
+
+
+def labString(lab_names: list, lab_results: list) -> str:
+    lab_string = ""
     labs = list(zip(lab_names, lab_results))
 
     # sort result for later comparision
@@ -354,7 +519,7 @@ def praseInvestigation(page_source, wait) -> str:
         else:
             lab_string = lab_string + "{}:::{}\n".format(lab[0], lab[1])
 
-    return hcis_class, lab_string
+    return lab_string
 
 
 def praseHN(page_source):
@@ -373,6 +538,11 @@ def praseHN(page_source):
     return hcis_class, HNs
 
 
+def readHNs(driver):
+    """praseHN, read in the browser."""
+    return tuple(extractElements(driver, HN_SPEC)[0])
+
+
 def matchLabs(allLabs: list):
     labs = []
     for rawLab in allLabs:
@@ -5,31 +5,33 @@ from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.select import Select
-from selenium.webdriver.support.wait import WebDriverWait
 
+from . import hcis_helpers, hcis_xpath_helpers
 from .hcis_helpers import encodeStr  # isElementPresent,; convertToDate,
 from .hcis_helpers import (
     clickNew,
     isNextPageLinkExists,
     isDisplayPatientInfo,
     matchLabs,
-    praseDermographic,
-    praseDermographicTab2,
-    praseHN,
-    praseInvestigation,
-    praseMedication,
     praseTwoTablePage,
-    praseVisits,
+    readHNs,
+    readInvestigation,
+    readMedication,
+    readTwoTablePage,
     searchHN,
     setInputDate,
     waitForPageReady,
     waitForHNToLoaded,
 )
+from .hcis_waits import PageWait, markPage, waitForPage
 from .importer import Importer
 
 CLINIC_IDS = [["111", "วัณโรค"], ["121", "นิรนาม"]]
 EXPLICIT_WAIT = 15
 
+# parsers of the page source, by name
+PARSER_BACKENDS = {"bs4": hcis_helpers, "lxml": hcis_xpath_helpers}
+
 
 class HCISImporter(Importer):
     def __init__(
@@ -44,6 +46,12 @@ class HCISImporter(Importer):
         hcis_client_mac: str = "6D:53:85:EF:85:53",
         desired_capabilities: DesiredCapabilities = None,
         set_page_load_timeout: int = 30,
+        extract_with_script: bool = False,
+        parser_backend: str = "bs4",
+        wait_poll: float = 0.1,
+        wait_backoff: float = 1.5,
+        wait_max_poll: float = 1.0,
+        wait_with_marker: bool = False,
     ):
 
         # IE DesiredCapabilities
@@ -66,7 +74,22 @@ class HCISImporter(Importer):
         self.client_name = hcis_client_name
         self.client_ip = hcis_client_ip
         self.client_mac = hcis_client_mac
-        self.wait = WebDriverWait(self.driver, EXPLICIT_WAIT)
+        self.wait = PageWait(
+            self.driver,
+            EXPLICIT_WAIT,
+            poll_frequency=wait_poll,
+            backoff=wait_backoff,
+            max_poll_frequency=wait_max_poll,
+            page_marker=wait_with_marker,
+        )
+
+        # read the grids in the browser, or parse the page source
+        self.extract_with_script = extract_with_script
+
+        if parser_backend not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown parser backend: {parser_backend}")
+
+        self.parsers = PARSER_BACKENDS[parser_backend]
 
     def getDermographic(self, hn: str, nhso_username, nhso_password) -> dict:
         url = (
@@ -106,9 +129,9 @@ class HCISImporter(Importer):
         details_botton.click()
 
         # wait
-        waitForHNToLoaded(self.wait, hn)
+        self.waitForHN(hn)
 
-        dermographic = praseDermographic(
+        dermographic = self.parsers.praseDermographic(
             page_source=self.driver.page_source, hn=hn
         )
 
@@ -124,7 +147,7 @@ class HCISImporter(Importer):
             EC.presence_of_element_located((By.ID, "objdw_ex_addr_0_0"))
         )
 
-        dermographicTab2 = praseDermographicTab2(
+        dermographicTab2 = self.parsers.praseDermographicTab2(
             page_source=self.driver.page_source
         )
 
@@ -159,30 +182,24 @@ class HCISImporter(Importer):
         searchHN(wait=self.wait, text_box_css="#objdw_lupt_0_2", hn=hn)
 
         # wait
-        waitForHNToLoaded(self.wait, hn)
+        self.waitForHN(hn)
 
         # prase visits
-        cares, visits = praseVisits(self.driver.page_source)
+        cares, visits = self.parsers.praseVisits(self.driver.page_source)
 
         while True:
             link = isNextPageLinkExists(driver=self.driver, wait=self.wait)
-            old_source = self.driver.page_source
 
             if link:
+                page = markPage(self.wait)
                 link.click()
 
                 # wait
-                self.wait.until(
-                    (
-                        lambda d: d.execute_script(
-                            "return document.readyState"
-                        )
-                        == "complete"
-                        and (d.page_source != old_source)
-                    )
-                )
+                waitForPage(self.wait, since=page)
 
-                _, new_page_visits = praseVisits(self.driver.page_source)
+                _, new_page_visits = self.parsers.praseVisits(
+                    self.driver.page_source
+                )
 
                 visits = visits + new_page_visits
 
@@ -205,7 +222,6 @@ class HCISImporter(Importer):
 
         # wait
         waitForPageReady(wait=self.wait)
-        old_source = self.driver.page_source
 
         while isDisplayPatientInfo(driver=self.driver, wait=self.wait):
             clickNew(self.wait)
@@ -218,7 +234,7 @@ class HCISImporter(Importer):
         searchHN(wait=self.wait, text_box_css=text_box_css, hn=hn)
 
         # wait
-        waitForHNToLoaded(self.wait, hn)
+        self.waitForHN(hn)
 
         # set start date
         med_start_date = "01/01/2500"
@@ -234,29 +250,21 @@ class HCISImporter(Importer):
         search_button = self.wait.until(
             EC.element_to_be_clickable((By.ID, "WW_0_C_cb_1"))
         )
-        old_source = self.driver.page_source
+        page = markPage(self.wait)
         search_button.click()
 
         # get medication list
         date_element_css = "span[name^='compute_2_']"
         element_text_split_by = " "
-        fnc = praseMedication
 
         # wait
-        self.wait.until(
-            (
-                lambda d: d.execute_script("return document.readyState")
-                == "complete"
-                and (d.page_source != old_source)
-            )
-        )
+        waitForPage(self.wait, since=page)
 
-        results = praseTwoTablePage(
-            driver=self.driver,
-            wait=self.wait,
+        results = self.twoTablePage(
             date_element_css=date_element_css,
             element_text_split_by=element_text_split_by,
-            elementsPraser=fnc,
+            elementsReader=readMedication,
+            elementsPraser=self.parsers.praseMedication,
         )
 
         return results
@@ -289,17 +297,15 @@ class HCISImporter(Importer):
         # get lab list
         date_element_css = "span[name^='compute_1_']"
         element_text_split_by = "::"
-        fnc = praseInvestigation
 
         # wait again
-        waitForHNToLoaded(self.wait, hn)
+        self.waitForHN(hn)
 
-        results = praseTwoTablePage(
-            driver=self.driver,
-            wait=self.wait,
+        results = self.twoTablePage(
             date_element_css=date_element_css,
             element_text_split_by=element_text_split_by,
-            elementsPraser=fnc,
+            elementsReader=readInvestigation,
+            elementsPraser=self.parsers.praseInvestigation,
         )
 
         prasedLabs = matchLabs(results)
@@ -339,7 +345,7 @@ class HCISImporter(Importer):
                 if not clinic_id:
                     break
 
-            first_hcis_class = praseHN(self.driver.page_source)[0]
+            first_hcis_class = self.patientListHNs(self.driver)[0]
 
             # set start date
             start_date = "01/01/2500"
@@ -377,15 +383,18 @@ class HCISImporter(Importer):
             search_icon = self.wait.until(
                 EC.element_to_be_clickable((By.CSS_SELECTOR, search_icon_css))
             )
+            page = markPage(self.wait)
             search_icon.click()
 
-            # wait
-            self.wait.until(
-                lambda d: praseHN(d.page_source)[0] != first_hcis_class
+            # wait, reading the HNs only when the page marker changed
+            waitForPage(
+                self.wait,
+                lambda d: self.patientListHNs(d)[0] != first_hcis_class,
+                since=page,
             )
 
             # read hn
-            hcis_class, page_hns = praseHN(self.driver.page_source)
+            hcis_class, page_hns = self.patientListHNs(self.driver)
 
             HNs = HNs + page_hns
 
@@ -393,19 +402,60 @@ class HCISImporter(Importer):
                 link = isNextPageLinkExists(driver=self.driver, wait=self.wait)
 
                 if link:
+                    page = markPage(self.wait)
                     link.click()
 
-                    self.wait.until(
-                        lambda d: praseHN(d.page_source)[0] != hcis_class
+                    waitForPage(
+                        self.wait,
+                        lambda d: self.patientListHNs(d)[0] != hcis_class,
+                        since=page,
                     )
 
-                    HNs = HNs + praseHN(self.driver.page_source)[1]
+                    HNs = HNs + self.patientListHNs(self.driver)[1]
 
                 else:
                     break
 
         return list(set(HNs))
 
+    def twoTablePage(
+        self,
+        date_element_css: str,
+        element_text_split_by: str,
+        elementsReader: object,
+        elementsPraser: object,
+    ) -> list:
+        if self.extract_with_script:
+            return readTwoTablePage(
+                driver=self.driver,
+                wait=self.wait,
+                date_element_css=date_element_css,
+                element_text_split_by=element_text_split_by,
+                elementsReader=elementsReader,
+            )
+
+        return praseTwoTablePage(
+            driver=self.driver,
+            wait=self.wait,
+            date_element_css=date_element_css,
+            element_text_split_by=element_text_split_by,
+            elementsPraser=elementsPraser,
+        )
+
+    def patientListHNs(self, driver):
+        if self.extract_with_script:
+            return readHNs(driver)
+
+        return self.parsers.praseHN(driver.page_source)
+
+    def waitForHN(self, hn):
+        waitForHNToLoaded(
+            self.wait,
+            hn,
+            in_browser=self.extract_with_script,
+            hnReader=self.parsers.readHN,
+        )
+
     def quit(self):
         self.driver.quit()
 
@@ -0,0 +1,218 @@
+import time
+
+from selenium.common.exceptions import JavascriptException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+# the HCIS loading overlay
+LOADING_CSS = "#AWMOD"
+
+# Runs in IE, ES5 only. Installs a marker on the page, once per page
+# load, counting the DOM mutations and the XMLHttpRequests in flight,
+# and returns [page, version, settled, observing]. page changes when the
+# browser loads another page, version when the DOM changes or a request
+# starts or ends. The page is settled once it is loaded, nothing is in
+# flight and the HCIS loading overlay (#AWMOD) is hidden. Mutations do
+# not hold the page back, an element ticking on the page would never let
+# it settle, they only tell the waits when to check their condition.
+# observing is false when the browser has no DOM mutation events, e.g.
+# the IE7/8 document modes, the version never changes there.
+PAGE_MARKER_SCRIPT = """
+var marker = window.hcisPageMarker;
+
+if (!marker) {
+    marker = window.hcisPageMarker = {
+        page: String(Math.random()).slice(2),
+        version: 0,
+        pendingRequests: 0,
+        observing: true
+    };
+
+    var changed = function () {
+        marker.version++;
+    };
+
+    if (window.MutationObserver) {
+        new MutationObserver(changed).observe(document.documentElement, {
+            attributes: true,
+            characterData: true,
+            childList: true,
+            subtree: true
+        });
+    } else if (document.addEventListener) {
+        document.addEventListener("DOMSubtreeModified", changed, false);
+    } else {
+        marker.observing = false;
+    }
+
+    if (window.XMLHttpRequest && XMLHttpRequest.prototype.addEventListener) {
+        var send = XMLHttpRequest.prototype.send;
+
+        XMLHttpRequest.prototype.send = function () {
+            var request = this;
+            var pending = true;
+            var finished = function () {
+                if (pending && request.readyState === 4) {
+                    pending = false;
+                    marker.pendingRequests--;
+                    changed();
+                }
+            };
+
+            marker.pendingRequests++;
+            changed();
+            request.addEventListener("readystatechange", finished, false);
+
+            try {
+                return send.apply(request, arguments);
+            } catch (error) {
+                if (pending) {
+                    pending = false;
+                    marker.pendingRequests--;
+                }
+
+                throw error;
+            }
+        };
+    }
+}
+
+var loading = document.getElementById("AWMOD");
+var isLoading = false;
+
+if (loading) {
+    var style = window.getComputedStyle
+        ? window.getComputedStyle(loading, null)
+        : loading.currentStyle;
+
+    isLoading = style.display !== "none"
+        && style.visibility !== "hidden"
+        && (loading.offsetWidth > 0 || loading.offsetHeight > 0);
+}
+
+return [
+    marker.page,
+    marker.version,
+    document.readyState === "complete"
+        && !isLoading
+        && marker.pendingRequests === 0,
+    marker.observing
+];
+"""
+
+
+class PageWait(WebDriverWait):
+    """WebDriverWait polling with a backoff.
+
+    The first poll comes after poll_frequency seconds, each next one
+    backoff times later, up to max_poll_frequency. page_marker turns on
+    the page marker waits, off the pages are compared by their source.
+    """
+
+    def __init__(
+        self,
+        driver,
+        timeout,
+        poll_frequency=0.1,
+        backoff=1.5,
+        max_poll_frequency=1.0,
+        ignored_exceptions=None,
+        page_marker=False,
+    ):
+        super().__init__(
+            driver,
+            timeout,
+            poll_frequency=poll_frequency,
+            ignored_exceptions=ignored_exceptions,
+        )
+
+        self.backoff = backoff
+        self.max_poll_frequency = max_poll_frequency
+        self.page_marker = page_marker
+
+    def until(self, method, message=""):
+        screen = None
+        stacktrace = None
+        poll = self._poll
+
+        end_time = time.time() + self._timeout
+
+        while True:
+            try:
+                value = method(self._driver)
+
+                if value:
+                    return value
+
+            except self._ignored_exceptions as exc:
+                screen = getattr(exc, "screen", None)
+                stacktrace = getattr(exc, "stacktrace", None)
+
+            time.sleep(poll)
+            poll = min(poll * self.backoff, self.max_poll_frequency)
+
+            if time.time() > end_time:
+                break
+
+        raise TimeoutException(message, screen, stacktrace)
+
+
+def readMarker(wait):
+    """[page, version, settled, observing] of the page, None while loading.
+
+    Without the page marker only settled is read, from the readyState and
+    the loading overlay, as the waits did before the marker.
+    """
+    driver = wait._driver
+
+    if not wait.page_marker:
+        ready_state = driver.execute_script("return document.readyState")
+        overlay_hidden = EC.invisibility_of_element_located(
+            (By.CSS_SELECTOR, LOADING_CSS)
+        )
+        settled = ready_state == "complete" and bool(overlay_hidden(driver))
+
+        return [None, None, settled, False]
+
+    try:
+        return driver.execute_script(PAGE_MARKER_SCRIPT)
+
+    except JavascriptException:
+        # the page is being replaced
+        return None
+
+
+def pageVersion(wait, marker):
+    """Version of the page, its source when the marker cannot observe it."""
+    return marker[:2] if marker[3] else wait._driver.page_source
+
+
+def markPage(wait):
+    """Version of the page to wait to change from, before an action."""
+    marker = readMarker(wait)
+
+    return pageVersion(wait, marker) if marker else None
+
+
+def waitForPage(wait, condition=None, since=None):
+    """Wait for the page to settle, after changing since a markPage.
+
+    Only the marker is polled, or the page source without it. Once the
+    page changed, condition(driver), e.g. a parse of the grids, decides
+    when the page is the one waited for. It is checked again on every
+    poll it fails, the backoff of the wait keeps that cheap.
+    """
+
+    def isReady(driver):
+        marker = readMarker(wait)
+
+        if not marker or not marker[2]:
+            return False
+
+        if since is not None and pageVersion(wait, marker) == since:
+            return False
+
+        return condition is None or bool(condition(driver))
+
+    return wait.until(isReady)
@@ -0,0 +1,197 @@
+from lxml import etree, html
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+
+from .hcis_helpers import convertToDate, labString
+
+# The page parsers of hcis_helpers on an lxml.html tree with precompiled
+# XPath, name filters use the EXSLT regular expressions of lxml (Python
+# re). They return the same values, an HCIS class is a list of classes
+# as BeautifulSoup gives.
+NAMESPACES = {"re": "http://exslt.org/regular-expressions"}
+
+
+def xpath(path: str):
+    return etree.XPath(path, namespaces=NAMESPACES)
+
+
+def byID(tag: str, element_id: str):
+    return xpath(f"//{tag}[@id='{element_id}']")
+
+
+HN_SPAN = xpath("//span[@name='t_hndsp_0']")
+
+VISIT_DATES = xpath(
+    "//span[contains(@id, 'objdw_cnifcn_grd_ovst_detail_0')]"
+    "/input[contains(@name, 'compute_1_')]"
+)
+PRIMARY_CARE = byID("input", "objdw_cnifcn_ext_ovst_0_28")
+SECONDARY_CARE = byID("input", "objdw_cnifcn_ext_ovst_0_27")
+REGULAR_CARE = byID("input", "objdw_cnifcn_ext_ovst_0_29")
+
+MEDICATIONS = xpath(r"//span[re:test(@name, '^meditem_name_\d+')]")
+LAB_NAMES = xpath(r"//input[re:test(@name, '^labexm_labexmnm_\d+')]")
+LAB_RESULTS = xpath(r"//input[re:test(@name, '^compute_2_\d+')]")
+HNS = xpath(r"//input[re:test(@name, 'c_hn_\d+')]")
+
+FIRSTNAME = byID("input", "objdw_ex_crd_0_13")
+LASTNAME = byID("input", "objdw_ex_crd_0_14")
+DATE_OF_BIRTH = byID("input", "objdw_ex_crd_0_22")
+GOVERNMENT_ID = byID("input", "objdw_ex_crd_0_19")
+SEX = xpath(
+    "//input[@name='objdw_ex_crd_pt_sex_0' and @type='radio' and @checked]"
+    "/following-sibling::*[1][self::span]"
+)
+MARITAL_STATUS = xpath("//select[@id='objdw_ex_crd_0_35']/option[@selected]")
+NATIONALITY = xpath("//select[@id='objdw_ex_crd_0_27']/option[@selected]")
+HEALTH_INSURANCE = xpath(
+    "//select[@id='objdw_pt_newcp_0_44']/option[@selected]"
+)
+
+ADDRESS = byID("input", "objdw_ex_addr_0_9")
+PHONES = [byID("input", f"objdw_ex_addr_0_{x}") for x in range(14, 16)]
+
+
+def pageTree(page_source):
+    return html.fromstring(page_source)
+
+
+def first(tree, path):
+    elements = path(tree)
+
+    return elements[0] if elements else None
+
+
+def hcisClass(element):
+    hcis_class = element.get("class")
+
+    return hcis_class.split() if hcis_class is not None else None
+
+
+def readHN(page_source):
+    hn = first(pageTree(page_source), HN_SPAN)
+
+    return hn.text_content() if hn is not None else None
+
+
+def praseVisits(page_source):
+    tree = pageTree(page_source)
+
+    visit_dates = [
+        convertToDate(element.get("value").split(" ")[0])
+        for element in VISIT_DATES(tree)
+    ]
+
+    primary_care = first(tree, PRIMARY_CARE).get("value") or "-"
+    secondary_care = first(tree, SECONDARY_CARE).get("value") or "-"
+    regular_care = first(tree, REGULAR_CARE).get("value") or "-"
+
+    cares = f"{primary_care}/{secondary_care}/{regular_care}"
+
+    return cares, visit_dates
+
+
+def praseMedication(page_source, wait) -> list:
+    read_from_name_css = "span[name^='meditem_name_']"
+
+    try:
+        wait.until(
+            EC.presence_of_element_located(
+                (By.CSS_SELECTOR, read_from_name_css)
+            )
+        )
+
+    except TimeoutException:
+        # no elements found
+        pass
+
+    medications = MEDICATIONS(pageTree(page_source))
+
+    # get unique class from first result
+    hcis_class = hcisClass(medications[0]) if medications else None
+
+    # sort result for later comparision
+    medications = sorted(med.text_content() for med in medications)
+
+    return hcis_class, medications
+
+
+def praseInvestigation(page_source, wait) -> str:
+    ix_result_css = "input[name^='compute_2_']"
+
+    try:
+        wait.until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ix_result_css))
+        )
+
+    except TimeoutException:
+        pass
+
+    tree = pageTree(page_source)
+    lab_names = LAB_NAMES(tree)
+    lab_results = LAB_RESULTS(tree)
+
+    # get unique class from first result
+    hcis_class = hcisClass(lab_names[0]) if lab_names else None
+
+    lab_names = [name.get("value") for name in lab_names]
+    lab_results = [result.get("value") for result in lab_results]
+
+    return hcis_class, labString(lab_names, lab_results)
+
+
+def praseHN(page_source):
+    HNs = HNS(pageTree(page_source))
+
+    # get hcis class
+    hcis_class = hcisClass(HNs[0]) if HNs else None
+
+    HNs = [element.get("value") for element in HNs]
+
+    return hcis_class, HNs
+
+
+def praseDermographic(page_source, hn):
+    tree = pageTree(page_source)
+
+    firstname = first(tree, FIRSTNAME).get("value")
+    lastname = first(tree, LASTNAME).get("value")
+
+    dateOfBirth = first(tree, DATE_OF_BIRTH).get("value") or None
+    dateOfBirth = convertToDate(dateOfBirth)
+
+    sex = first(tree, SEX).text_content() or None
+    maritalStatus = first(tree, MARITAL_STATUS).text_content() or None
+    nationality = first(tree, NATIONALITY).text_content() or None
+
+    governmentID = first(tree, GOVERNMENT_ID).get("value") or None
+
+    healthInsurance = first(tree, HEALTH_INSURANCE).text_content() or None
+
+    return {
+        "hn": hn,
+        "name": f"{firstname} {lastname}",
+        "dateOfBirth": dateOfBirth,
+        "sex": sex,
+        "maritalStatus": maritalStatus,
+        "nationality": nationality,
+        "governmentID": governmentID,
+        "healthInsurance": healthInsurance,
+    }
+
+
+def praseDermographicTab2(page_source):
+    tree = pageTree(page_source)
+    phoneNumbers = []
+
+    address = first(tree, ADDRESS).get("value") or ""
+
+    # phones
+    for path in PHONES:
+        phone = first(tree, path).get("value")
+
+        if phone:
+            phoneNumbers.append(phone)
+
+    return {"phoneNumbers": phoneNumbers, "address": address}
@@ -0,0 +1,77 @@
+import json
+import os
+
+
+def recordHN(record):
+    return record["dermographic"]["hn"]
+
+
+def appendRecord(path, record):
+    """Append a patient record to a JSON Lines store and fsync it.
+
+    A record is written as one line, so a scraper that dies can only
+    leave the last line truncated and never has to rewrite the store.
+    """
+    with open(path, "a") as file:
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def readRecords(path):
+    """Yield the patient records of a store, one at a time.
+
+    A JSON array, as written by older versions of the scraper, is read
+    whole. A truncated last line is skipped, an invalid line anywhere
+    else raises.
+    """
+    with open(path, "r") as file:
+        head = file.read(1)
+
+        while head.isspace():
+            head = file.read(1)
+
+        file.seek(0)
+
+        if head == "[":
+            yield from json.load(file)
+            return
+
+        error = None
+        for line in file:
+            if not line.strip():
+                continue
+
+            if error is not None:
+                raise error
+
+            try:
+                yield json.loads(line)
+
+            except ValueError as e:
+                error = e
+
+
+def compactRecords(paths, output):
+    """Merge stores into output, keeping the last record of every HN.
+
+    The merged store is written next to output and moved over it, so
+    output may be one of the paths. Returns the HNs of the records.
+    """
+    records = {}
+
+    for path in paths:
+        for record in readRecords(path):
+            records[recordHN(record)] = record
+
+    temporary = f"{output}.tmp"
+    with open(temporary, "w") as file:
+        for record in records.values():
+            file.write(json.dumps(record) + "\n")
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary, output)
+
+    return list(records)
@@ -0,0 +1,57 @@
+import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+
+from hivclinic import db
+from hivclinic.helpers.data_dict_maker.data_dict_maker import summaryQuery
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.patient_summary_model import PatientSummaryModel
+
+
+def upsertPatientSummary(summary):
+    # tied dates may yield more than one row per patient,
+    # keep only one as a row can be upserted once per statement
+    summary = summary.distinct(PatientModel.id).order_by(PatientModel.id)
+    columns = [column["name"] for column in summary.column_descriptions]
+
+    statement = insert(PatientSummaryModel.__table__).from_select(
+        columns, summary.statement
+    )
+
+    updated_columns = {
+        column: statement.excluded[column]
+        for column in columns
+        if column != "patientID"
+    }
+    updated_columns["modified_on"] = datetime.datetime.utcnow()
+
+    statement = statement.on_conflict_do_update(
+        index_elements=[PatientSummaryModel.patientID], set_=updated_columns
+    )
+
+    db.session.execute(statement)
+
+
+def refreshPatientSummary(patientIDs):
+    """Recompute the summary rows of the given patients.
+
+    Call it after visits, investigations or partners of the patients have
+    been added, modified or deleted, before the session is committed.
+    """
+    patientIDs = list({patientID for patientID in patientIDs if patientID})
+
+    if not patientIDs:
+        return
+
+    # make pending changes visible to the summary query
+    db.session.flush()
+
+    upsertPatientSummary(summaryQuery(patientIDs=patientIDs))
+
+
+def rebuildPatientSummary():
+    """Recompute the summary rows of every patient."""
+    db.session.flush()
+
+    db.session.query(PatientSummaryModel).delete()
+    upsertPatientSummary(summaryQuery())
@@ -0,0 +1,83 @@
+import os
+import time
+
+from flask import current_app
+from rq import get_current_job
+from rq.job import Job
+
+from hivclinic.helpers.data_dict_maker.data_dict_export import (
+    EXPORT_FORMATS,
+    exportQuery,
+    writeDataDict,
+)
+
+
+def enqueueJob(fnc, *args):
+    """Put a report job on the task queue and return it."""
+    return current_app.task_queue.enqueue(
+        fnc,
+        *args,
+        job_timeout=current_app.config["JOB_TIMEOUT"],
+        result_ttl=current_app.config["JOB_RESULT_TTL"],
+    )
+
+
+def fetchJob(job_id: str):
+    """Fetch a job by its id, raises NoSuchJobError if it has expired."""
+    return Job.fetch(job_id, connection=current_app.task_queue.connection)
+
+
+def removeExpiredResults(folder: str):
+    """Delete the result files of jobs older than JOB_RESULT_TTL."""
+    ttl = current_app.config["JOB_RESULT_TTL"]
+
+    if ttl < 0:
+        return
+
+    expired = time.time() - ttl
+
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.stat().st_mtime < expired:
+            os.remove(entry.path)
+
+
+def dataDictJob(asFile: bool, fileFormat: str):
+    """Build the data dict in a worker.
+
+    Files are written to JOB_RESULT_FOLDER, named by the job id, and the
+    job returns their path, name and mimetype. The API sends them from
+    there, redis only keeps the small result.
+    """
+    # imported here, the resource module enqueues this job
+    from hivclinic.namespaces.statistics.statistics_resource import (
+        DataDictResource,
+    )
+
+    if not asFile:
+        return {"data": DataDictResource.make_table()}
+
+    folder = current_app.config["JOB_RESULT_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+    removeExpiredResults(folder)
+
+    path = os.path.join(folder, get_current_job().get_id())
+
+    with open(path, "wb") as output:
+        writeDataDict(exportQuery(fileFormat), fileFormat, output)
+
+    filename, mimetype = EXPORT_FORMATS[fileFormat]
+
+    return {"path": path, "filename": filename, "mimetype": mimetype}
+
+
+def overviewJob(startDate, endDate, outputFormat="html"):
+    """Build the overview statistics in a worker."""
+    from hivclinic.namespaces.statistics.statistics_resource import (
+        OverviewResource,
+    )
+
+    return {
+        "data": OverviewResource.make_overview(
+            startDate, endDate, outputFormat
+        )
+    }
@@ -0,0 +1,172 @@
+from sqlalchemy import (
+    and_,
+    exists,
+    func,
+    literal,
+    select,
+    text,
+    union,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import insert
+
+from hivclinic import db
+from hivclinic.helpers.data_dict_maker.data_dict_maker import inDataDict
+from hivclinic.helpers.patient_summary.patient_summary import (
+    refreshPatientSummary,
+)
+from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.patient_summary_model import PatientSummaryModel
+from hivclinic.models.statistics_rollup_model import StatisticsRollupModel
+from hivclinic.models.visit_model import VisitModel
+
+# first key of the advisory locks taken on the dates being recomputed
+ROLLUP_LOCK = 7001
+
+
+def rollupQuery(dates=None):
+    """Daily (date, metric, count) rows, for the given dates or all."""
+
+    def onDates(column):
+        criteria = column.isnot(None)
+
+        if dates is not None:
+            criteria = and_(criteria, column.in_(dates))
+
+        return criteria
+
+    summary = PatientSummaryModel.__table__
+
+    # registrations are counted for the patients listed in the data dict
+    new_patients = (
+        db.session.query(
+            summary.c.registerDate.label("date"),
+            literal("newPatients").label("metric"),
+            func.count().label("count"),
+        )
+        .join(PatientModel, PatientModel.id == summary.c.patientID)
+        .filter(inDataDict(summary))
+        .filter(onDates(summary.c.registerDate))
+        .group_by(summary.c.registerDate)
+    )
+
+    visits = (
+        db.session.query(VisitModel.date, literal("visits"), func.count())
+        .filter(onDates(VisitModel.date))
+        .group_by(VisitModel.date)
+    )
+
+    investigations = (
+        db.session.query(
+            InvestigationModel.date, literal("investigations"), func.count()
+        )
+        .filter(onDates(InvestigationModel.date))
+        .group_by(InvestigationModel.date)
+    )
+
+    return union_all(
+        new_patients.statement, visits.statement, investigations.statement
+    )
+
+
+def refreshStatisticsRollup(dates=None):
+    """Recompute the rollup rows of the given dates, all rows by default.
+
+    Call it with the dates touched by a write before the session is
+    committed, the patient summary has to be refreshed first. The dates
+    are locked until the commit, a concurrent write on the same date
+    waits and then counts the committed rows.
+    """
+    if dates is not None:
+        dates = {date for date in dates if date}
+
+        if not dates:
+            return
+
+    # make pending changes visible to the rollup query
+    db.session.flush()
+
+    if dates is not None:
+        # in date order, so two writes cannot wait on each other
+        db.session.execute(
+            text(
+                "SELECT pg_advisory_xact_lock(:lock, day) "
+                "FROM unnest(:days) AS day ORDER BY day"
+            ),
+            {
+                "lock": ROLLUP_LOCK,
+                "days": sorted(date.toordinal() for date in dates),
+            },
+        )
+
+    table = StatisticsRollupModel.__table__
+    rollup = rollupQuery(dates).alias("rollup")
+
+    statement = insert(table).from_select(
+        ["date", "metric", "count"], select([rollup])
+    )
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.date, table.c.metric],
+            set_={"count": statement.excluded["count"]},
+        )
+    )
+
+    # drop the counts of the dates and metrics left with no rows
+    stale = db.session.query(StatisticsRollupModel).filter(
+        ~exists().where(
+            and_(
+                rollup.c.date == StatisticsRollupModel.date,
+                rollup.c.metric == StatisticsRollupModel.metric,
+            )
+        )
+    )
+
+    if dates is not None:
+        stale = stale.filter(StatisticsRollupModel.date.in_(dates))
+
+    stale.delete(synchronize_session=False)
+
+
+def patientDates(patientIDs):
+    """Dates of the visits, investigations and registration of patients.
+
+    Pending changes are not flushed, so called before a write it returns
+    the dates as they are stored in the database.
+    """
+    dates = union(
+        *[
+            db.session.query(column)
+            .filter(patientID.in_(patientIDs))
+            .statement
+            for column, patientID in (
+                (VisitModel.date, VisitModel.patientID),
+                (InvestigationModel.date, InvestigationModel.patientID),
+                (
+                    PatientSummaryModel.registerDate,
+                    PatientSummaryModel.patientID,
+                ),
+            )
+        ]
+    )
+
+    with db.session.no_autoflush:
+        return {row[0] for row in db.session.execute(dates)}
+
+
+def refreshPatientStatistics(patientIDs):
+    """Refresh the summary rows and daily counts touched by the patients.
+
+    The dates are collected before and after the pending changes are
+    flushed, so moved and deleted visits are counted again as well.
+    """
+    patientIDs = list({patientID for patientID in patientIDs if patientID})
+
+    if not patientIDs:
+        return
+
+    dates = patientDates(patientIDs)
+
+    refreshPatientSummary(patientIDs)
+    refreshStatisticsRollup(dates | patientDates(patientIDs))
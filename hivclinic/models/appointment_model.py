@@ -5,6 +5,10 @@ from sqlalchemy.dialects.postgresql import UUID
 
 class AppointmentModel(BaseModel):
     __tablename__ = "appointment"
+    __table_args__ = (
+        db.Index("ix_appointment_patientID_date", "patientID", "date"),
+        db.Index("ix_appointment_date", "date"),
+    )
     relationship_keys = {"patientID"}
 
     date = db.Column(db.Date(), nullable=False)
@@ -1,10 +1,43 @@
 from hivclinic import db
 from hivclinic.models import BaseModel
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import UUID
 
 
 class InvestigationModel(BaseModel):
     __tablename__ = "investigation"
+    __table_args__ = (
+        db.Index("ix_investigation_patientID_date", "patientID", "date"),
+        # first and last results of the patient summary
+        db.Index(
+            "ix_investigation_viralLoad",
+            "patientID",
+            "date",
+            postgresql_where=text('"viralLoad" IS NOT NULL'),
+        ),
+        db.Index(
+            "ix_investigation_absoluteCD4",
+            "patientID",
+            "date",
+            postgresql_where=text('"absoluteCD4" IS NOT NULL'),
+        ),
+        db.Index(
+            "ix_investigation_antiHIV",
+            "patientID",
+            "date",
+            postgresql_where=text('"antiHIV" IS NOT NULL'),
+        ),
+        # conflict target of the patient_import upserts
+        db.Index(
+            "ix_investigation_imported",
+            "patientID",
+            "date",
+            unique=True,
+            postgresql_where=text("imported"),
+        ),
+        # data dict cache watermark
+        db.Index("ix_investigation_modified_on", "modified_on"),
+    )
     relationship_keys = {"patientID"}
 
     date = db.Column(db.Date(), nullable=False)
@@ -7,6 +7,11 @@ from sqlalchemy.dialects.postgresql import UUID
 
 class PartnerModel(BaseModel):
     __tablename__ = "partner"
+    __table_args__ = (
+        db.Index("ix_partner_patientID", "patientID"),
+        # data dict cache watermark
+        db.Index("ix_partner_modified_on", "modified_on"),
+    )
     relationship_keys = {"patientID"}
 
     deceased = db.Column(db.Unicode())
@@ -17,6 +17,20 @@ class PatientModel(BaseModel):
         "appointments",
     ]
 
+    # trigram indexes of the patient search, need the pg_trgm extension
+    __table_args__ = tuple(
+        db.Index(
+            f"ix_patient_{column}_trgm",
+            column,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+        for column in ("hn", "clinicID", "napID", "name")
+    ) + (
+        # data dict cache watermark
+        db.Index("ix_patient_modified_on", "modified_on"),
+    )
+
     clinicID = db.Column(db.Unicode(), unique=True, nullable=True)
     hn = db.Column(db.Unicode(), nullable=False, unique=True)
     governmentID = db.Column(db.Unicode())
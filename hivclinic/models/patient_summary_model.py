@@ -0,0 +1,72 @@
+import datetime
+
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+
+from hivclinic import db
+
+
+class PatientSummaryModel(db.Model):
+    """Per-patient aggregates used by the data dict, kept up to date on write.
+
+    Rows are rebuilt by
+    hivclinic.helpers.patient_summary.patient_summary.refreshPatientSummary
+    whenever a visit, investigation or partner of the patient changes.
+    """
+
+    __tablename__ = "patient_summary"
+
+    # overdue worklists are paged on (date, patientID)
+    __table_args__ = (
+        db.Index(
+            "ix_patient_summary_lastViralLoadDate",
+            "lastViralLoadDate",
+            "patientID",
+        ),
+        db.Index(
+            "ix_patient_summary_lastVisitDate", "lastVisitDate", "patientID"
+        ),
+        # data dict cache watermark
+        db.Index("ix_patient_summary_modified_on", "modified_on"),
+    )
+
+    patientID = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("patient.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    numberOfPartners = db.Column(db.Integer())
+
+    registerDate = db.Column(db.Date(), index=True)
+    lastClinicVisit = db.Column(db.Date())
+    lastVisitDate = db.Column(db.Date())
+
+    firstAntiHIV = db.Column(db.Date())
+    firstAntiHIVResult = db.Column(db.Unicode())
+    firstPosAntiHIV = db.Column(db.Date())
+
+    arvInitiationDate = db.Column(db.Date())
+    initialARV = db.Column(ARRAY(db.Unicode()))
+    timeToStartARV = db.Column(db.Integer())
+
+    lastARVPrescriptionDate = db.Column(db.Date())
+    currentARV = db.Column(ARRAY(db.Unicode()))
+
+    lastViralLoadDate = db.Column(db.Date())
+    lastViralLoad = db.Column(db.Float())
+
+    firstCD4LabDate = db.Column(db.Date())
+    firstCD4Result = db.Column(db.Float())
+    firstPercentCD4Result = db.Column(db.Float())
+
+    lastCD4LabDate = db.Column(db.Date())
+    lastCD4Result = db.Column(db.Float())
+    lastPercentCD4Result = db.Column(db.Float())
+
+    DxBeforeARV = db.Column(ARRAY(db.Unicode()))
+
+    modified_on = db.Column(
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
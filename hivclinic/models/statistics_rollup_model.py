@@ -0,0 +1,17 @@
+from hivclinic import db
+
+
+class StatisticsRollupModel(db.Model):
+    """Daily counts behind the overview charts, kept up to date on write.
+
+    metric is one of "newPatients", "visits" or "investigations". Rows
+    are recomputed by
+    hivclinic.helpers.statistics_rollup.statistics_rollup
+    .refreshStatisticsRollup for the dates touched by a write.
+    """
+
+    __tablename__ = "statistics_rollup"
+
+    date = db.Column(db.Date(), primary_key=True)
+    metric = db.Column(db.Unicode(), primary_key=True)
+    count = db.Column(db.Integer(), nullable=False)
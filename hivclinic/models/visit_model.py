@@ -1,10 +1,25 @@
 from hivclinic import db
 from hivclinic.models import BaseModel
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import ARRAY, UUID
 
 
 class VisitModel(BaseModel):
     __tablename__ = "visit"
+    __table_args__ = (
+        db.Index("ix_visit_patientID_date", "patientID", "date"),
+        db.Index("ix_visit_date", "date"),
+        # conflict target of the patient_import upserts
+        db.Index(
+            "ix_visit_imported",
+            "patientID",
+            "date",
+            unique=True,
+            postgresql_where=text("imported"),
+        ),
+        # data dict cache watermark
+        db.Index("ix_visit_modified_on", "modified_on"),
+    )
     relationship_keys = {"patientID"}
     # protected_keys = {"medications"}
 
@@ -2,8 +2,7 @@ from flask_restplus import Resource
 from webargs import fields
 from webargs.flaskparser import use_args
 
-from hivclinic.models.icd10_model import ICD10Model
-from hivclinic.schemas.icd10_schema import ICD10Schema
+from hivclinic.helpers.icd10_index.icd10_index import icd10Index
 
 from . import api
 
@@ -16,26 +15,12 @@ class ICD10Resource(Resource):
     )
     def get(self, args):
         """Check if the field is unique"""
-        icd10_schema = ICD10Schema(many=True)
-
-        icd10s_query = (
-            ICD10Model.query.order_by(ICD10Model.id)
-            .filter(
-                ICD10Model.icd10.ilike("%{}%".format(args["keyword"]))
-                | ICD10Model.description.ilike("%{}%".format(args["keyword"]))
-            )
-            .limit(10)
-            .all()
-        )
-
-        icd10s = icd10_schema.dump(icd10s_query)
+        icd10s = icd10Index().search(args["keyword"], limit=10)
 
         # format icd10
         icd10s_with_description = []
 
-        for item in icd10s:
-            icd10s_with_description.append(
-                f"{item['icd10']}: {item['description']}"
-            )
+        for icd10, description in icd10s:
+            icd10s_with_description.append(f"{icd10}: {description}")
 
         return icd10s_with_description, 200
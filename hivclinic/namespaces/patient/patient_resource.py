@@ -1,46 +1,166 @@
+from uuid import UUID
+
 from flask import abort, request, current_app
 
 from flask_restplus import Resource
+from sqlalchemy import case, func, tuple_
+from werkzeug.http import http_date, is_resource_modified, quote_etag
 from hivclinic import db
+from hivclinic.helpers.keyset_pagination.keyset_pagination import (
+    decodeCursor,
+    encodeCursor,
+)
+from hivclinic.helpers.statistics_rollup.statistics_rollup import (
+    refreshPatientStatistics,
+)
 from hivclinic.models.patient_model import PatientModel
 from hivclinic.schemas.patient_schema import PatientSchema
 from webargs.flaskparser import parser, use_args
 from webargs import fields
-from marshmallow.validate import OneOf
+from marshmallow.validate import OneOf, Range
 
 from . import api
 
+PATIENT_PAGE_SIZE = 100
+
+patient_list_args = {
+    "after": fields.Str(missing=None),
+    "limit": fields.Int(missing=None, validate=Range(min=1, max=1000)),
+}
+
 
 @api.route("/")
 class AllPatientResource(Resource):
+    """Patients in clinic ID order, then those without one in ID order.
+
+    Without after or limit the whole list is returned, as it always was.
+    With either, a page of {"data", "next"} is returned, continuing after
+    the (clinicID, id) of the cursor, read from the clinic ID index of
+    the patient table.
+    """
+
+    only = [
+        "id",
+        "hn",
+        "clinicID",
+        "governmentID",
+        "napID",
+        "name",
+        "sex",
+        "gender",
+        "nationality",
+        "healthInsurance",
+        "dateOfBirth",
+        "phoneNumbers",
+    ]
+
+    @classmethod
+    def all_patients(cls):
+        patient_schema = PatientSchema(
+            many=True, exclude=PatientModel.relationship_keys, only=cls.only
+        )
+
+        patients = PatientModel.query.order_by(
+            PatientModel.clinicID, PatientModel.id
+        ).all()
+
+        return patient_schema.dump(patients)
+
+    @classmethod
+    def patient_page(cls, after=None, limit=PATIENT_PAGE_SIZE):
+        clinicID = PatientModel.clinicID
+        with_clinicID = PatientModel.query.filter(clinicID.isnot(None))
+        without_clinicID = PatientModel.query.filter(clinicID.is_(None))
+
+        if after is not None:
+            try:
+                values = decodeCursor(after)
+
+                if len(values) not in (1, 2):
+                    raise ValueError("Invalid cursor.")
+
+                last_id = UUID(values[-1])
+
+            except ValueError:
+                abort(400, "Invalid cursor.")
+
+            # the cursor of a patient without clinic ID only holds the ID
+            if len(values) == 1:
+                with_clinicID = None
+                without_clinicID = without_clinicID.filter(
+                    PatientModel.id > last_id
+                )
+
+            else:
+                with_clinicID = with_clinicID.filter(
+                    tuple_(clinicID, PatientModel.id)
+                    > tuple_(values[0], last_id)
+                )
+
+        patients = []
+        if with_clinicID is not None:
+            patients = (
+                with_clinicID.order_by(clinicID, PatientModel.id)
+                .limit(limit + 1)
+                .all()
+            )
+
+        if len(patients) <= limit:
+            patients += (
+                without_clinicID.order_by(PatientModel.id)
+                .limit(limit + 1 - len(patients))
+                .all()
+            )
+
+        patient_schema = PatientSchema(
+            many=True, exclude=PatientModel.relationship_keys, only=cls.only
+        )
+
+        next_cursor = None
+        if len(patients) > limit:
+            last = patients[limit - 1]
+
+            if last.clinicID is None:
+                next_cursor = encodeCursor(last.id)
+
+            else:
+                next_cursor = encodeCursor(last.clinicID, last.id)
+
+        return {
+            "data": patient_schema.dump(patients[:limit]),
+            "next": next_cursor,
+        }
+
     @api.doc("list_all_patients")
-    def get(self):
+    @use_args(patient_list_args, locations=("querystring",))
+    def get(self, args):
         """List all patients"""
-        only = [
-            "id",
-            "hn",
-            "clinicID",
-            "governmentID",
-            "napID",
-            "name",
-            "sex",
-            "gender",
-            "nationality",
-            "healthInsurance",
-            "dateOfBirth",
-            "phoneNumbers",
-        ]
+        count, last_modified = db.session.query(
+            func.count(PatientModel.id), func.max(PatientModel.modified_on)
+        ).one()
 
-        patient_schema = PatientSchema(
-            many=True, exclude=PatientModel.relationship_keys, only=only
+        # the registry changes when a patient is added, edited or removed
+        etag = "{}-{}".format(
+            count, last_modified.timestamp() if last_modified else 0
         )
+        headers = {"ETag": quote_etag(etag)}
 
-        patients_query = PatientModel.query.order_by(
-            PatientModel.clinicID
-        ).all()
-        patients = patient_schema.dump(patients_query)
+        if last_modified is not None:
+            headers["Last-Modified"] = http_date(last_modified)
 
-        return patients, 200
+        if not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified
+        ):
+            return None, 304, headers
+
+        if args["after"] is None and args["limit"] is None:
+            return self.all_patients(), 200, headers
+
+        page = self.patient_page(
+            args["after"], args["limit"] or PATIENT_PAGE_SIZE
+        )
+
+        return page, 200, headers
 
     @api.doc("add_new_patient")
     def post(self):
@@ -76,15 +196,39 @@ class SearchPatientResource(Resource):
                 many=True, exclude=PatientModel.relationship_keys, only=only
             )
 
+            keyword = args["keyword"]
+
+            # exact, then prefix HN and clinic ID hits, then fuzzy names
+            rank = case(
+                [
+                    (
+                        PatientModel.hn.ilike(keyword)
+                        | PatientModel.clinicID.ilike(keyword),
+                        0,
+                    ),
+                    (
+                        PatientModel.hn.ilike("{}%".format(keyword))
+                        | PatientModel.clinicID.ilike("{}%".format(keyword)),
+                        1,
+                    ),
+                ],
+                else_=2,
+            )
+
+            # served by the trigram indexes of the patient table
             patients_query = (
-                PatientModel.query.order_by(PatientModel.clinicID)
-                .filter(
-                    PatientModel.hn.ilike("%{}%".format(args["keyword"]))
-                    | PatientModel.clinicID.ilike(
-                        "%{}%".format(args["keyword"])
-                    )
-                    | PatientModel.napID.ilike("%{}%".format(args["keyword"]))
-                    | PatientModel.name.ilike("%{}%".format(args["keyword"]))
+                PatientModel.query.filter(
+                    PatientModel.hn.ilike("%{}%".format(keyword))
+                    | PatientModel.clinicID.ilike("%{}%".format(keyword))
+                    | PatientModel.napID.ilike("%{}%".format(keyword))
+                    | PatientModel.name.ilike("%{}%".format(keyword))
+                    # the pg_trgm similarity operator, % escaped for psycopg2
+                    | PatientModel.name.op("%%")(keyword)
+                )
+                .order_by(
+                    rank,
+                    func.similarity(PatientModel.name, keyword).desc(),
+                    PatientModel.clinicID,
                 )
                 .limit(current_app.config["MAX_NUMBER_OF_PATIENT_IN_SEARCH"])
                 .all()
@@ -151,7 +295,9 @@ class PatientResource(Resource):
         if patient:
             patient.update(**patient_payload)
 
+            # clinic ID decides whether the patient is counted as new
             db.session.add(patient)
+            refreshPatientStatistics([patient.id])
             db.session.commit()
 
             return patient_schema.dump(patient), 200
@@ -2,6 +2,9 @@ from flask import abort, request
 
 from flask_restplus import Resource
 from hivclinic import db
+from hivclinic.helpers.statistics_rollup.statistics_rollup import (
+    refreshPatientStatistics,
+)
 
 # all models
 from hivclinic.models.visit_model import VisitModel
@@ -40,6 +43,12 @@ def getSubcollectionClasses(type):
         abort(400, "Invalid subcollection type.")
 
 
+def refreshSummaryIfNeeded(subcollection_type, patient_uuid):
+    # only these subcollections feed the patient summary and rollup
+    if subcollection_type in ("partners", "visits", "investigations"):
+        refreshPatientStatistics([patient_uuid])
+
+
 def convert_uuid_to_str(data):
     # Flas-Restplus's json encoder does not
     # seem to handle UUID as ForeignKey very well
@@ -85,6 +94,7 @@ class AllSubcollectionResource(Resource):
         subcollection_payload = parser.parse(Schema, request)
         subcollection = getattr(patient, subcollection_type)
         subcollection.append(subcollection_payload)
+        refreshSummaryIfNeeded(subcollection_type, patient_uuid)
         db.session.commit()
 
         subcollection = subcollection_schema.dump(subcollection_payload)
@@ -140,6 +150,7 @@ class SubcollectionResource(Resource):
         subcollection.update(**patient_payload)
 
         db.session.add(subcollection)
+        refreshSummaryIfNeeded(subcollection_type, patient_uuid)
         db.session.commit()
 
         subcollection = subcollection_schema.dump(subcollection)
@@ -162,6 +173,7 @@ class SubcollectionResource(Resource):
             subcollection.deleted = True
 
             db.session.add(subcollection)
+            refreshSummaryIfNeeded(subcollection_type, patient_uuid)
             db.session.commit()
 
         return None, 204
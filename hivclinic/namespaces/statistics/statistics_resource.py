@@ -1,19 +1,48 @@
+import os
+import tempfile
 from datetime import date, datetime
 from io import BytesIO
+from uuid import UUID
 
 from dateutil.relativedelta import relativedelta
-from flask import current_app, send_file
+from flask import Response, abort, current_app, send_file, stream_with_context
 from flask_restplus import Resource
-from sqlalchemy import func
-from webargs import fields
+from rq.exceptions import NoSuchJobError
+from sqlalchemy import Integer, and_, cast, func, tuple_
+from webargs import fields, validate
 from webargs.flaskparser import use_args
 
 import pandas as pd
-import numpy as np
 from hivclinic import db
-from hivclinic.helpers.data_dict_maker.data_dict_maker import dataDictMaker
-from hivclinic.models.investigation_model import InvestigationModel
+from hivclinic.helpers.dashboard_cache.dashboard_cache import cachedDashboard
+from hivclinic.helpers.data_dict_maker.data_dict_cache import (
+    cachedDataDictMaker,
+)
+from hivclinic.helpers.data_dict_maker.data_dict_export import (
+    EXPORT_FORMATS,
+    TYPED_FORMATS,
+    exportQuery,
+    iterDataDictArrow,
+    iterDataDictCSV,
+    writeDataDict,
+)
+from hivclinic.helpers.keyset_pagination.keyset_pagination import (
+    decodeCursor,
+    encodeCursor,
+)
+from hivclinic.helpers.overview_statistics.overview_statistics import (
+    OVERVIEW_FORMATS,
+    overviewStatistics,
+)
+from hivclinic.helpers.report_jobs.report_jobs import (
+    dataDictJob,
+    enqueueJob,
+    fetchJob,
+    overviewJob,
+)
 from hivclinic.models.patient_model import PatientModel
+from hivclinic.models.patient_summary_model import PatientSummaryModel
+from hivclinic.models.statistics_rollup_model import StatisticsRollupModel
 from hivclinic.models.visit_model import VisitModel
 
 from . import api
@@ -21,99 +50,110 @@ from . import api
 
 @api.route("/dashboard")
 class DashboardStatisticsResource(Resource):
-    @api.doc("generate_statistics_for_dashboard")
     @staticmethod
-    def count_patient():
-        # count total (registered patients)
-        patient_count_sql = (
-            db.session.query(PatientModel.id)
-            .filter(PatientModel.clinicID.isnot(None))
-            .statement.with_only_columns([func.count()])
-            .order_by(None)
+    def count_statistics():
+        # patient, healthcare scheme and today's visit counts in one query
+        scheme = PatientModel.healthInsurance
+        is_pay = scheme.in_(["ชำระเงินเอง", "สถานะคนต่างด้าว"])
+        is_gov = scheme.contains("สิทธิเบิกกรมบัญชีกลาง")
+        is_sss = scheme.contains("สิทธิประกันสังคม")
+
+        todays_visits = (
+            db.session.query(
+                VisitModel.patientID, func.count().label("visits")
+            )
+            .filter(VisitModel.date == date.today())
+            .group_by(VisitModel.patientID)
+            .subquery()
         )
-        patient_count = db.engine.execute(patient_count_sql).scalar() or 0
-
-        return patient_count
 
-    @staticmethod
-    def count_hc_scheme():
-        # count unique healthcare scheme
-        healthcare_scheme_count = (
+        counts = (
             db.session.query(
-                PatientModel.healthInsurance,
-                func.count(PatientModel.healthInsurance),
+                func.count().label("patients"),
+                func.count().filter(is_pay).label("pay"),
+                func.count().filter(and_(~is_pay, is_gov)).label("gov"),
+                func.count()
+                .filter(and_(~is_pay, ~is_gov, is_sss))
+                .label("sss"),
+                func.count()
+                .filter(and_(scheme.isnot(None), ~is_pay, ~is_gov, ~is_sss))
+                .label("uc"),
+                func.coalesce(func.sum(todays_visits.c.visits), 0).label(
+                    "examined"
+                ),
+                func.count()
+                .filter(todays_visits.c.visits > 1)
+                .label("new_patients"),
+            )
+            .select_from(PatientModel)
+            .outerjoin(
+                todays_visits, todays_visits.c.patientID == PatientModel.id
             )
             .filter(PatientModel.clinicID.isnot(None))
-            .group_by(PatientModel.healthInsurance)
-            .all()
+            .one()
         )
 
-        simplified_scheme_count = {"pay": 0, "uc": 0, "sss": 0, "gov": 0}
+        return {
+            "patientCount": counts.patients,
+            "healthcareSchemeCount": {
+                "pay": counts.pay,
+                "uc": counts.uc,
+                "sss": counts.sss,
+                "gov": counts.gov,
+            },
+            "examinedCount": int(counts.examined),
+            "newPatientCount": counts.new_patients,
+        }
 
-        for item in healthcare_scheme_count:
-            if item[0] == "ชำระเงินเอง" or item[0] == "สถานะคนต่างด้าว":
-                simplified_scheme_count["pay"] += int(item[1])
+    @classmethod
+    def make_dashboard(cls):
+        dashboard = cls.count_statistics()
 
-            elif "สิทธิเบิกกรมบัญชีกลาง" in item[0]:
-                simplified_scheme_count["gov"] += int(item[1])
+        # first pages only, the rest is listed by /statistics/overdue
+        overdue_vl = OverdueVLResource.worklist()
+        dashboard["overdueVL"] = overdue_vl["data"]
+        dashboard["overdueVLNext"] = overdue_vl["next"]
 
-            elif "สิทธิประกันสังคม" in item[0]:
-                simplified_scheme_count["sss"] += int(item[1])
+        overdue_fu = OverdueFUResource.worklist()
+        dashboard["overdueFU"] = overdue_fu["data"]
+        dashboard["overdueFUNext"] = overdue_fu["next"]
 
-            else:
-                simplified_scheme_count["uc"] += int(item[1])
+        return dashboard
 
-        return simplified_scheme_count
+    @api.doc("provide_dashboard_statistics")
+    def get(self):
+        """Provide Dashboard Statistics"""
 
-    @staticmethod
-    def count_examined_patient():
-        # examined patient count
-        examined_count_sql = (
-            db.session.query(VisitModel.id)
-            .join(PatientModel)
-            .filter(VisitModel.date == date.today())
-            .filter(PatientModel.clinicID.isnot(None))
-            .statement.with_only_columns([func.count()])
-            .order_by(None)
-        )
-        examined_count = db.engine.execute(examined_count_sql).scalar() or 0
+        return cachedDashboard(self.make_dashboard)
 
-        return examined_count
 
-    @staticmethod
-    def count_new_patient_that_examined():
-        # count new patients for today
-        new_patient_count_sql = (
-            db.session.query(VisitModel.patientID)
-            .join(PatientModel)
-            .filter(PatientModel.clinicID.isnot(None))
-            .filter(VisitModel.date == date.today())
-            .group_by(VisitModel.patientID)
-            .having(db.func.count(VisitModel.patientID) > 1)
-            .statement.with_only_columns([func.count()])
-            .order_by(None)
-        )
-        new_patient_count = (
-            db.engine.execute(new_patient_count_sql).scalar() or 0
-        )
+OVERDUE_PAGE_SIZE = 50
 
-        return new_patient_count
+overdue_args = {
+    "cursor": fields.Str(missing=None),
+    "limit": fields.Int(
+        missing=OVERDUE_PAGE_SIZE, validate=validate.Range(min=1, max=500)
+    ),
+}
 
-    @staticmethod
-    def overdue_vl():
-        overdue_date = date.today() - relativedelta(
-            months=current_app.config["OVERDUE_VL_MONTHS"]
-        )
 
-        last_lab_subquery = (
-            db.session.query(
-                InvestigationModel.patientID,
-                func.max(InvestigationModel.date).label("last_lab_date"),
-            )
-            .filter(InvestigationModel.viralLoad.isnot(None))
-            .group_by(InvestigationModel.patientID)
-            .subquery()
+class OverdueResource(Resource):
+    """Patients whose last date is older than the configured months.
+
+    Pages are read from the indexed patient summary pointers, newest
+    first, and continue after the (date, patientID) of the cursor.
+    """
+
+    date_column = None
+    date_key = None
+    months_config = None
+
+    @classmethod
+    def worklist(cls, cursor=None, limit=OVERDUE_PAGE_SIZE):
+        overdue_date = date.today() - relativedelta(
+            months=current_app.config[cls.months_config]
         )
+        patientID = PatientSummaryModel.patientID
 
         patients = (
             db.session.query(
@@ -121,72 +161,38 @@ class DashboardStatisticsResource(Resource):
                 PatientModel.name,
                 PatientModel.hn,
                 PatientModel.clinicID,
-                last_lab_subquery.c.last_lab_date,
-            )
-            .join(
-                last_lab_subquery,
-                last_lab_subquery.c.patientID == PatientModel.id,
+                cls.date_column.label("last_date"),
             )
+            .join(PatientSummaryModel, patientID == PatientModel.id)
             .filter(PatientModel.clinicID.isnot(None))
-            .filter(last_lab_subquery.c.last_lab_date <= overdue_date)
-            .order_by(last_lab_subquery.c.last_lab_date.desc())
-            .all()
+            .filter(cls.date_column <= overdue_date)
         )
 
-        # serialize query
-        overdue_vl = []
-        for item in patients:
-            overdue_vl.append(
-                {
-                    "last_lab_date": item.last_lab_date.strftime("%Y-%m-%d"),
-                    "id": str(item.id),
-                    "hn": item.hn,
-                    "name": item.name,
-                    "clinicID": item.clinicID,
-                }
-            )
-
-        return overdue_vl
+        if cursor is not None:
+            try:
+                last_date, last_id = decodeCursor(cursor)
+                last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
+                last_id = UUID(last_id)
 
-    @staticmethod
-    def overdue_fu():
-        overdue_date = date.today() - relativedelta(
-            months=current_app.config["OVERDUE_FU_MONTHS"]
-        )
+            except ValueError:
+                abort(400, "Invalid cursor.")
 
-        last_fu_subquery = (
-            db.session.query(
-                VisitModel.patientID,
-                func.max(VisitModel.date).label("last_fu_date"),
+            patients = patients.filter(
+                tuple_(cls.date_column, patientID) < tuple_(last_date, last_id)
             )
-            .group_by(VisitModel.patientID)
-            .subquery()
-        )
 
         patients = (
-            db.session.query(
-                PatientModel.id,
-                PatientModel.name,
-                PatientModel.hn,
-                PatientModel.clinicID,
-                last_fu_subquery.c.last_fu_date,
-            )
-            .join(
-                last_fu_subquery,
-                last_fu_subquery.c.patientID == PatientModel.id,
-            )
-            .filter(PatientModel.clinicID.isnot(None))
-            .filter(last_fu_subquery.c.last_fu_date <= overdue_date)
-            .order_by(last_fu_subquery.c.last_fu_date.desc())
+            patients.order_by(cls.date_column.desc(), patientID.desc())
+            .limit(limit + 1)
             .all()
         )
 
         # serialize query
-        overdue_fu = []
-        for item in patients:
-            overdue_fu.append(
+        overdue = []
+        for item in patients[:limit]:
+            overdue.append(
                 {
-                    "last_fu_date": item.last_fu_date.strftime("%Y-%m-%d"),
+                    cls.date_key: item.last_date.strftime("%Y-%m-%d"),
                     "id": str(item.id),
                     "hn": item.hn,
                     "name": item.name,
@@ -194,36 +200,136 @@ class DashboardStatisticsResource(Resource):
                 }
             )
 
-        return overdue_fu
+        next_cursor = None
+        if len(patients) > limit:
+            last = patients[limit - 1]
+            next_cursor = encodeCursor(last.last_date, last.id)
 
-    @api.doc("provide_dashboard_statistics")
-    def get(self):
-        """Provide Dashboard Statistics"""
+        return {"data": overdue, "next": next_cursor}
 
-        return {
-            "patientCount": self.count_patient(),
-            "healthcareSchemeCount": self.count_hc_scheme(),
-            "examinedCount": self.count_examined_patient(),
-            "newPatientCount": self.count_new_patient_that_examined(),
-            "overdueVL": self.overdue_vl(),
-            "overdueFU": self.overdue_fu(),
-        }
+    @use_args(overdue_args)
+    def get(self, args):
+        """List Overdue Patients"""
+        return self.worklist(args["cursor"], args["limit"]), 200
+
+
+@api.route("/overdue/vl")
+@api.doc("list_overdue_viral_load")
+class OverdueVLResource(OverdueResource):
+    date_column = PatientSummaryModel.lastViralLoadDate
+    date_key = "last_lab_date"
+    months_config = "OVERDUE_VL_MONTHS"
+
+
+@api.route("/overdue/fu")
+@api.doc("list_overdue_follow_up")
+class OverdueFUResource(OverdueResource):
+    date_column = PatientSummaryModel.lastVisitDate
+    date_key = "last_fu_date"
+    months_config = "OVERDUE_FU_MONTHS"
+
+
+data_dict_args = {
+    "as_file": fields.Boolean(missing=False),
+    "format": fields.Str(
+        missing="xlsx", validate=validate.OneOf(list(EXPORT_FORMATS))
+    ),
+    "stream": fields.Boolean(missing=False),
+}
+
+overview_args = {
+    "startDate": fields.Date(missing=date.min),
+    "endDate": fields.Date(missing=date.max),
+    "format": fields.Str(
+        missing="html", validate=validate.OneOf(list(OVERVIEW_FORMATS))
+    ),
+}
 
 
 @api.route("/data_dict")
 class DataDictResource(Resource):
+    @staticmethod
+    def stream_file(file_format):
+        data_dict = exportQuery(file_format)
+        filename, mimetype = EXPORT_FORMATS[file_format]
+
+        if file_format in ["csv", "arrow"]:
+            if file_format == "csv":
+                chunks = iterDataDictCSV(data_dict)
+
+            else:
+                chunks = iterDataDictArrow(data_dict)
+
+            return Response(
+                stream_with_context(chunks),
+                mimetype=mimetype,
+                headers={
+                    "Content-Disposition": f"attachment; filename={filename}"
+                },
+            )
+
+        # xlsx and parquet can only be sent once the file is closed,
+        # rows are spooled to a temporary file instead of memory
+        output = tempfile.TemporaryFile()
+        writeDataDict(data_dict, file_format, output)
+        output.seek(0)
+
+        return send_file(
+            output,
+            mimetype=mimetype,
+            attachment_filename=filename,
+            as_attachment=True,
+        )
+
+    @staticmethod
+    def make_table():
+        patientDataDict_df = cachedDataDictMaker(
+            dateFormat="%d-%m-%Y",
+            joinArrayBy=", ",
+            calculateAgeAsStr=True,
+            convertUUID=True,
+        )
+
+        table_data = {
+            "colHeaders": list(patientDataDict_df.columns),
+            "data": patientDataDict_df.values.tolist(),
+        }
+
+        return table_data
+
     @api.doc("generate_patient_data_dict")
-    @use_args({"as_file": fields.Boolean(missing=False)})
+    @use_args(data_dict_args)
     def get(self, args):
         """Provide Clinic Statistics"""
-        patientDataDict_df = dataDictMaker(
+        # typed columnar formats are always built from the cursor
+        if args["as_file"] and (
+            args["stream"] or args["format"] in TYPED_FORMATS
+        ):
+            return self.stream_file(args["format"])
+
+        if not args["as_file"]:
+            return self.make_table(), 200
+
+        patientDataDict_df = cachedDataDictMaker(
             dateFormat="%d-%m-%Y",
             joinArrayBy=", ",
             calculateAgeAsStr=True,
             convertUUID=True,
         )
 
-        if args["as_file"]:
+        if args["format"] == "csv":
+            output = BytesIO(
+                patientDataDict_df.to_csv(index=False).encode("utf-8-sig")
+            )
+
+            return send_file(
+                output,
+                mimetype="text/csv",
+                attachment_filename="data_dict.csv",
+                as_attachment=True,
+            )
+
+        else:
             # create an output stream
             output = BytesIO()
 
@@ -238,465 +344,192 @@ class DataDictResource(Resource):
                 as_attachment=True,
             )
 
-        else:
-            table_data = {
-                "colHeaders": list(patientDataDict_df.columns),
-                "data": patientDataDict_df.values.tolist(),
-            }
+    @api.doc("enqueue_patient_data_dict")
+    @use_args(data_dict_args)
+    def post(self, args):
+        """Generate the Data Dict in the Background"""
+        job = enqueueJob(dataDictJob, args["as_file"], args["format"])
 
-            return table_data, 200
+        return {"jobID": job.get_id()}, 202
 
 
 @api.route("/overview")
 class OverviewResource(Resource):
     @staticmethod
-    def getNumberOfNewPatientsStats(df, column_name):
-        df = df.loc[:, [column_name]]
-
-        count_data = (
-            df.groupby(
-                [
-                    df[column_name].dt.year.rename("Year"),
-                    df[column_name].dt.month.rename("Month"),
-                ]
+    def getMonthlyCounts(metric, startDate, endDate, count_column_name):
+        day = StatisticsRollupModel.date
+        year = cast(func.date_part("year", day), Integer).label("Year")
+        month = cast(func.date_part("month", day), Integer).label("Month")
+
+        count_sql = (
+            db.session.query(
+                year,
+                month,
+                func.sum(StatisticsRollupModel.count).label(count_column_name),
             )
-            .agg({"count"})
-            .sort_index()
+            .filter(StatisticsRollupModel.metric == metric)
+            .filter(day.between(startDate, endDate))
+            .group_by(year, month)
+            .order_by(year, month)
+            .statement
         )
 
-        count_data.columns = ["New"]
-        count_data["Total"] = count_data.cumsum()
-
-        return count_data.T
-
-    @staticmethod
-    def getNumberStats(df, db_column_name, count_column_name):
-        count_data = (
-            df.groupby(
-                [
-                    df[db_column_name].dt.year.rename("Year"),
-                    df[db_column_name].dt.month.rename("Month"),
-                ]
-            )
-            .agg({"count"})
-            .sort_index()
+        return pd.read_sql(
+            count_sql, db.session.bind, index_col=["Year", "Month"]
         )
 
-        count_data.columns = [count_column_name]
+    @classmethod
+    def getNumberOfNewPatientsStats(cls, startDate, endDate):
+        count_data = cls.getMonthlyCounts(
+            "newPatients", startDate, endDate, "New"
+        )
+        count_data["Total"] = count_data["New"].cumsum()
 
         return count_data.T
 
-    @staticmethod
-    def getWeeklyHeatmap(df, column_name, count_column_name):
-        df = df.loc[:, [column_name]]
-
-        count_data = (
-            df.groupby([df[column_name].dt.weekday.rename("Day")])
-            .agg({"count"})
-            .sort_index()
+    @classmethod
+    def getNumberStats(cls, metric, startDate, endDate, count_column_name):
+        count_data = cls.getMonthlyCounts(
+            metric, startDate, endDate, count_column_name
         )
 
-        count_data.columns = [count_column_name]
-        df[column_name] = df[column_name].dt.weekday_name
-
         return count_data.T
 
     @staticmethod
-    def getNationalityStats(df):
-        df = df.loc[:, ["ID", "Nationality", "Healthcare scheme"]]
+    def getWeeklyHeatmap(metric, startDate, endDate, count_column_name):
+        day = StatisticsRollupModel.date
+        weekday = cast(func.date_part("isodow", day) - 1, Integer).label("Day")
 
-        count_data = (
-            df.groupby(
-                [df.loc[:, "Nationality"], df.loc[:, "Healthcare scheme"]]
+        count_sql = (
+            db.session.query(
+                weekday,
+                func.sum(StatisticsRollupModel.count).label(count_column_name),
             )
-            .agg({"count"})
-            .sort_index()
+            .filter(StatisticsRollupModel.metric == metric)
+            .filter(day.between(startDate, endDate))
+            .group_by(weekday)
+            .order_by(weekday)
+            .statement
         )
 
-        count_data.columns = ["Cases"]
-
-        return count_data
-
-    @staticmethod
-    def calculate_age(born):
-        if isinstance(born, date):
-            today = date.today()
-            age = (
-                today.year
-                - born.year
-                - ((today.month, today.day) < (born.month, born.day))
-            )
-
-            return age
-
-        else:
-            return None
-
-    @staticmethod
-    def getAgeCrossedTable(df, column_names=[], no_data_as="No Data"):
-        bins = np.arange(0, 1000, 10)
-        groupby_columns = [pd.cut(df.Age, bins)] + column_names
-
-        df.drop(["Age"], axis=1, inplace=True)
-        df.fillna(no_data_as, inplace=True)
-
-        count_data = df.groupby(groupby_columns).agg({"count"}).sort_index()
-
-        # rename columns
-        count_data.columns = ["#"]
-
-        return count_data
-
-    @staticmethod
-    def grouppedTable(df, column_names=[], no_data_as="No Data"):
-        df.fillna(no_data_as, inplace=True)
-        count_data = df.groupby(column_names).agg({"count"}).sort_index()
-
-        # rename columns
-        count_data.columns = ["#"]
-
-        count_data.sort_index(inplace=True)
-
-        return count_data
-
-    @staticmethod
-    def getCD4CrossedTable(
-        df, column_names=[], cd4_column_name=None, no_data_as="No Data"
-    ):
-        df.dropna(axis="index", subset=[cd4_column_name], inplace=True)
-
-        bins = [-1, 200, 350, 5000]
-        labels = ["[0, 200]", "(200, 350]", "(350, ∞)"]
-
-        groupby_columns = [
-            pd.cut(df.loc[:, cd4_column_name], bins=bins, labels=labels)
-        ] + column_names
-
-        df.drop([cd4_column_name], axis=1, inplace=True)
-        df.fillna(no_data_as, inplace=True)
-
-        count_data = df.groupby(groupby_columns).agg({"count"}).sort_index()
-
-        # rename columns
-        count_data.columns = ["#"]
-
-        return count_data
-
-    @staticmethod
-    def getVLTable(
-        df, column_names=[], vl_column_name=None, no_data_as="No Data"
-    ):
-        df.dropna(axis="index", subset=[vl_column_name], inplace=True)
-        df.replace("Undetectable", -1, inplace=True)
-        df[vl_column_name] = df[vl_column_name].astype(int)
-
-        bins = [-2, 0, 200, 1000, 9999999]
-        labels = ["Undetectable", "VL ≤ 200", "VL ≤ 1000", "VL > 1000"]
-
-        groupby_columns = [
-            pd.cut(df.loc[:, vl_column_name], bins=bins, labels=labels)
-        ] + column_names
-
-        df.drop([vl_column_name], axis=1, inplace=True)
-        df.fillna(no_data_as, inplace=True)
-
-        count_data = df.groupby(groupby_columns).agg({"count"}).sort_index()
-
-        # rename columns
-        count_data.columns = ["#"]
+        count_data = pd.read_sql(count_sql, db.session.bind, index_col="Day")
 
-        return count_data
+        return count_data.T
 
-    @api.doc("generate_overview_statistics")
-    @use_args(
-        {
-            "startDate": fields.Date(missing=date.min),
-            "endDate": fields.Date(missing=date.max),
-        }
-    )
-    def get(self, args):
-        """Provide Clinic's Overview Statistics"""
+    @classmethod
+    def make_overview(cls, startDate, endDate, output_format="html"):
         joinArrayBy = ","
-        patientDataDict_df = dataDictMaker(
+        patientDataDict_df = cachedDataDictMaker(
             joinArrayBy=joinArrayBy,
             calculateAgeAsStr=True,
             convertUUID=True,
-            startDate=args["startDate"],
-            endDate=args["endDate"],
-        )
-
-        # recalculate age as relative time
-        patientDataDict_df["Date of birth"] = pd.to_datetime(
-            patientDataDict_df["Date of birth"], errors="ignore", format='%d-%m-%Y'
-        )
-
-        # calculate age
-        patientDataDict_df["Age"] = patientDataDict_df["Date of birth"].apply(
-            self.calculate_age
-        )
-
-        col_name = "Register date"
-        patientDataDict_df[col_name] = pd.to_datetime(
-            patientDataDict_df[col_name], errors="coerce", infer_datetime_format=True
-        )
-
-        # thais and nonthais
-        thais_df = patientDataDict_df.where(
-            patientDataDict_df["Nationality"] == "ไทย"
-        )
-
-        nonthais_df = patientDataDict_df.where(
-            patientDataDict_df["Nationality"] != "ไทย"
-        )
-
-        # visits df
-        patient_visit_df = pd.read_sql(
-            db.session.query(VisitModel.date)
-            .filter(
-                VisitModel.date.between(args["startDate"], args["endDate"])
-            )
-            .statement,
-            db.session.bind,
-        )
-
-        patient_visit_df["date"] = pd.to_datetime(
-            patient_visit_df["date"], errors="coerce", infer_datetime_format=True
-        )
-
-        # ix df
-        patient_ix_df = pd.read_sql(
-            db.session.query(InvestigationModel.date)
-            .filter(
-                InvestigationModel.date.between(
-                    args["startDate"], args["endDate"]
-                )
-            )
-            .statement,
-            db.session.bind,
-        )
-
-        patient_ix_df["date"] = pd.to_datetime(
-            patient_ix_df["date"], errors="coerce", infer_datetime_format=True
+            startDate=startDate,
+            endDate=endDate,
         )
 
+        # monthly and weekday counts come from the daily rollup
         # count new patients
-        patient_count = self.getNumberOfNewPatientsStats(
-            patientDataDict_df, "Register date"
-        )
+        patient_count = cls.getNumberOfNewPatientsStats(startDate, endDate)
 
         # count visits
-        visits_count = self.getNumberStats(
-            df=patient_visit_df,
-            db_column_name="date",
-            count_column_name="Visits",
+        visits_count = cls.getNumberStats(
+            "visits", startDate, endDate, count_column_name="Visits"
         )
 
         # count ix
-        ix_count = self.getNumberStats(
-            df=patient_ix_df,
-            db_column_name="date",
+        ix_count = cls.getNumberStats(
+            "investigations",
+            startDate,
+            endDate,
             count_column_name="Investigations",
         )
 
         # weekly new cases heatmap
-        weekly_new_cases_heatmap = self.getWeeklyHeatmap(
-            df=patientDataDict_df,
-            column_name=col_name,
-            count_column_name="New Cases",
+        weekly_new_cases_heatmap = cls.getWeeklyHeatmap(
+            "newPatients", startDate, endDate, count_column_name="New Cases"
         )
 
         # weekly visits heatmap
-        weekly_visits_heatmap = self.getWeeklyHeatmap(
-            df=patient_visit_df, column_name="date", count_column_name="Visits"
+        weekly_visits_heatmap = cls.getWeeklyHeatmap(
+            "visits", startDate, endDate, count_column_name="Visits"
         )
 
-        # count nationality
-        patient_nationality = self.getNationalityStats(patientDataDict_df)
+        overview = {
+            "patientCount": patient_count,
+            "visitsCount": visits_count,
+            "ixCount": ix_count,
+            "newCasesHeatMap": weekly_new_cases_heatmap,
+            "visitHeatMap": weekly_visits_heatmap,
+        }
+        overview.update(overviewStatistics(patientDataDict_df, joinArrayBy))
 
-        # patient_age_sex_gender
-        patient_age_sex_gender = self.getAgeCrossedTable(
-            df=patientDataDict_df.loc[:, ["ID", "Age", "Sex", "Gender"]],
-            column_names=["Sex", "Gender"],
-        )
+        render = OVERVIEW_FORMATS[output_format]
 
-        # Age/Nationality/Referral Status/Referred From
-        patient_age_nat_referral = self.getAgeCrossedTable(
-            df=patientDataDict_df.loc[
-                :,
-                [
-                    "ID",
-                    "Age",
-                    "Nationality",
-                    "Referral status",
-                    "Referred from",
-                ],
-            ],
-            column_names=["Nationality", "Referral status", "Referred from"],
-            no_data_as="N/A",
-        )
+        return {key: render(table) for key, table in overview.items()}
 
-        # Age/Nationality/Patient Status/Referred Out To
-        patient_age_nat_referral_out = self.getAgeCrossedTable(
-            df=patientDataDict_df.loc[
-                :,
-                [
-                    "ID",
-                    "Age",
-                    "Nationality",
-                    "Patient status",
-                    "Referred out to",
-                ],
-            ],
-            column_names=["Nationality", "Patient status", "Referred out to"],
-            no_data_as="N/A",
+    @api.doc("generate_overview_statistics")
+    @use_args(overview_args)
+    def get(self, args):
+        """Provide Clinic's Overview Statistics"""
+        return self.make_overview(
+            args["startDate"], args["endDate"], args["format"]
         )
 
-        # Age/Sex/Gender/Risk Behaviors
-        patient_age_sex_gender_risk = self.getAgeCrossedTable(
-            df=patientDataDict_df.loc[
-                :, ["ID", "Age", "Sex", "Gender", "Risk behaviors"]
-            ],
-            column_names=["Sex", "Gender", "Risk behaviors"],
+    @api.doc("enqueue_overview_statistics")
+    @use_args(overview_args)
+    def post(self, args):
+        """Generate the Overview Statistics in the Background"""
+        job = enqueueJob(
+            overviewJob, args["startDate"], args["endDate"], args["format"]
         )
 
-        # Other diagnosis before ARV initiation
-        column_name = "Other diagnosis before ARV initiation"
+        return {"jobID": job.get_id()}, 202
 
-        dx_df = patientDataDict_df.loc[
-            :, ["ID", column_name]
-        ]
-        
-        dx_df[column_name] = (
-            dx_df[column_name]
-            .apply(lambda data_string: data_string.split(joinArrayBy) if isinstance(data_string, str) else data_string)
-        )
 
-        dx_df = dx_df.explode(column_name)
+@api.route("/jobs/<string:job_id>")
+class JobResource(Resource):
+    @staticmethod
+    def get_job(job_id):
+        try:
+            return fetchJob(job_id)
 
-        patient_other_dx = self.grouppedTable(
-            df=dx_df.loc[
-                :, ["ID", column_name]
-            ],
-            column_names=[column_name],
-            no_data_as="N/A",
-        )
+        except NoSuchJobError:
+            abort(404, "Job not found.")
 
-        # Current ARV Regimen
-        patient_current_arv = self.grouppedTable(
-            df=patientDataDict_df.loc[
-                :, ["ID", "Last ARV regimen"]
-            ],
-            column_names=["Last ARV regimen"],
-            no_data_as="N/A",
-        )
+    @api.doc("get_job_status")
+    def get(self, job_id):
+        """Provide the Status of a Background Job"""
+        job = self.get_job(job_id)
 
-        # initial cd4 by sex & gender
-        init_cd4_sex_gender = self.getCD4CrossedTable(
-            df=patientDataDict_df.loc[
-                :, ["ID", "First CD4 result", "Sex", "Gender"]
-            ],
-            cd4_column_name="First CD4 result",
-            column_names=["Sex", "Gender"],
-        )
+        return {"jobID": job.get_id(), "status": job.get_status()}, 200
 
-        # last cd4 by sex & gender
-        last_cd4_sex_gender = self.getCD4CrossedTable(
-            df=patientDataDict_df.loc[
-                :, ["ID", "Last CD4 result", "Sex", "Gender"]
-            ],
-            cd4_column_name="Last CD4 result",
-            column_names=["Sex", "Gender"],
-        )
 
-        # initial cd4 by sex & gender for Thais
-        init_cd4_sex_gender_thais = self.getCD4CrossedTable(
-            df=thais_df.loc[:, ["ID", "First CD4 result", "Sex", "Gender"]],
-            cd4_column_name="First CD4 result",
-            column_names=["Sex", "Gender"],
-        )
+@api.route("/jobs/<string:job_id>/result")
+class JobResultResource(Resource):
+    @api.doc("get_job_result")
+    def get(self, job_id):
+        """Provide the Result of a Finished Background Job"""
+        job = JobResource.get_job(job_id)
 
-        # last cd4 by sex & gender for Thais
-        last_cd4_sex_gender_thais = self.getCD4CrossedTable(
-            df=thais_df.loc[:, ["ID", "Last CD4 result", "Sex", "Gender"]],
-            cd4_column_name="Last CD4 result",
-            column_names=["Sex", "Gender"],
-        )
+        if job.is_failed:
+            # the last line of the traceback names the error
+            error = (job.exc_info or "").strip().splitlines()[-1:]
+            abort(500, "Job failed: %s" % "".join(error))
 
-        # initial cd4 by sex & gender for non-thais
-        init_cd4_sex_gender_nonthais = self.getCD4CrossedTable(
-            df=nonthais_df.loc[:, ["ID", "First CD4 result", "Sex", "Gender"]],
-            cd4_column_name="First CD4 result",
-            column_names=["Sex", "Gender"],
-        )
+        if not job.is_finished:
+            abort(409, "Job is not finished.")
 
-        # last cd4 by sex & gender for non-thais
-        last_cd4_sex_gender_nonthais = self.getCD4CrossedTable(
-            df=nonthais_df.loc[:, ["ID", "Last CD4 result", "Sex", "Gender"]],
-            cd4_column_name="Last CD4 result",
-            column_names=["Sex", "Gender"],
-        )
+        result = job.result
 
-        # last VL
-        last_vl = self.getVLTable(
-            df=patientDataDict_df.loc[:, ["ID", "Last viral load result"]],
-            vl_column_name="Last viral load result",
-            column_names=[],
-        )
+        if "path" in result:
+            if not os.path.isfile(result["path"]):
+                abort(404, "Job result has expired.")
 
-        return {
-            "patientCount": patient_count.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "visitsCount": visits_count.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "ixCount": ix_count.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "newCasesHeatMap": weekly_new_cases_heatmap.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "visitHeatMap": weekly_visits_heatmap.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patientNationality": patient_nationality.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patientAgeSexGender": patient_age_sex_gender.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patientAgeNatRefferIn": patient_age_nat_referral.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patientAgeNatRefferOut": patient_age_nat_referral_out.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patientAgeSexGenderRisk": patient_age_sex_gender_risk.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patienOtherDx": patient_other_dx.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "patientCurrentARV": patient_current_arv.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "initCD4SexGender": init_cd4_sex_gender.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "lastCD4SexGender": last_cd4_sex_gender.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "initCD4SexGenderThais": init_cd4_sex_gender_thais.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "lastCD4SexGenderThais": last_cd4_sex_gender_thais.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "initCD4SexGenderNonThais": init_cd4_sex_gender_nonthais.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "lastCD4SexGenderNonThais": last_cd4_sex_gender_nonthais.to_html(
-                escape=True, bold_rows=False, border=0
-            ),
-            "lastVL": last_vl.to_html(escape=True, bold_rows=False, border=0),
-        }
+            return send_file(
+                result["path"],
+                mimetype=result["mimetype"],
+                attachment_filename=result["filename"],
+                as_attachment=True,
+            )
+
+        return result["data"], 200
@@ -0,0 +1,36 @@
+"""add trigram indexes for the patient search
+
+Revision ID: 08fc21ba6385
+Revises: a944c64d8423
+Create Date: 2026-10-18 10:21:09.271846
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "08fc21ba6385"
+down_revision = "a944c64d8423"
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ["hn", "clinicID", "napID", "name"]
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for column in SEARCH_COLUMNS:
+        op.create_index(
+            f"ix_patient_{column}_trgm",
+            "patient",
+            [column],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade():
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f"ix_patient_{column}_trgm", table_name="patient")
@@ -0,0 +1,73 @@
+"""make imported visits and investigations unique per patient and date
+
+Revision ID: 3c81f0e2d7a5
+Revises: 08fc21ba6385
+Create Date: 2026-10-18 10:58:12.604719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3c81f0e2d7a5"
+down_revision = "08fc21ba6385"
+branch_labels = None
+depends_on = None
+
+IMPORTED_TABLES = ["visit", "investigation"]
+
+
+def duplicateImportedRows(table):
+    return (
+        op.get_bind()
+        .execute(
+            f"""
+            SELECT "patientID", date, array_agg(id::text ORDER BY id) AS ids
+            FROM {table}
+            WHERE imported
+            GROUP BY "patientID", date
+            HAVING count(*) > 1
+            ORDER BY "patientID", date
+            """
+        )
+        .fetchall()
+    )
+
+
+def upgrade():
+    duplicates = [
+        f"{table} {row.patientID} {row.date}: {', '.join(row.ids)}"
+        for table in IMPORTED_TABLES
+        for row in duplicateImportedRows(table)
+    ]
+
+    # these are clinical rows, which to keep is left to the clinic
+    if duplicates:
+        raise RuntimeError(
+            "Imported rows share a patient and date. Keep one row of each "
+            "and delete the others or set their imported to false, then "
+            "upgrade again:\n" + "\n".join(duplicates)
+        )
+
+    for table in IMPORTED_TABLES:
+        op.drop_index(f"ix_{table}_imported", table_name=table)
+        op.create_index(
+            f"ix_{table}_imported",
+            table,
+            ["patientID", "date"],
+            unique=True,
+            postgresql_where=sa.text("imported"),
+        )
+
+
+def downgrade():
+    for table in IMPORTED_TABLES:
+        op.drop_index(f"ix_{table}_imported", table_name=table)
+        op.create_index(
+            f"ix_{table}_imported",
+            table,
+            ["patientID", "date"],
+            unique=False,
+            postgresql_where=sa.text("imported"),
+        )
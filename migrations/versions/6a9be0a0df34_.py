@@ -0,0 +1,59 @@
+"""add overdue worklist pointers to patient summary
+
+Revision ID: 6a9be0a0df34
+Revises: 71667e5ba2e3
+Create Date: 2026-10-18 10:05:43.118264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6a9be0a0df34"
+down_revision = "71667e5ba2e3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "patient_summary", sa.Column("lastVisitDate", sa.Date(), nullable=True)
+    )
+
+    # fill the new column for the existing summary rows
+    op.execute(
+        """
+        UPDATE patient_summary
+        SET "lastVisitDate" = last_visit."lastVisitDate"
+        FROM (
+            SELECT "patientID", max(date) AS "lastVisitDate"
+            FROM visit
+            GROUP BY "patientID"
+        ) AS last_visit
+        WHERE last_visit."patientID" = patient_summary."patientID"
+        """
+    )
+
+    op.create_index(
+        "ix_patient_summary_lastViralLoadDate",
+        "patient_summary",
+        ["lastViralLoadDate", "patientID"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_patient_summary_lastVisitDate",
+        "patient_summary",
+        ["lastVisitDate", "patientID"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_patient_summary_lastVisitDate", table_name="patient_summary"
+    )
+    op.drop_index(
+        "ix_patient_summary_lastViralLoadDate", table_name="patient_summary"
+    )
+    op.drop_column("patient_summary", "lastVisitDate")
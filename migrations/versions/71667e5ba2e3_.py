@@ -0,0 +1,61 @@
+"""add statistics rollup table
+
+Revision ID: 71667e5ba2e3
+Revises: c0f86a87ca50
+Create Date: 2026-10-18 10:02:17.318842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "71667e5ba2e3"
+down_revision = "c0f86a87ca50"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "statistics_rollup",
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("metric", sa.Unicode(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("date", "metric"),
+    )
+
+    # count the existing rows, the overview reads only this table
+    op.execute(
+        """
+        INSERT INTO statistics_rollup (date, metric, count)
+        SELECT patient_summary."registerDate", 'newPatients', count(*)
+        FROM patient_summary
+        JOIN patient ON patient.id = patient_summary."patientID"
+        WHERE patient_summary."registerDate" IS NOT NULL
+            AND (
+                patient."clinicID" IS NOT NULL
+                OR patient_summary."firstPosAntiHIV" IS NOT NULL
+                OR patient_summary."arvInitiationDate" IS NOT NULL
+                OR patient_summary."lastARVPrescriptionDate" IS NOT NULL
+                OR patient_summary."lastViralLoadDate" IS NOT NULL
+                OR patient_summary."lastCD4LabDate" IS NOT NULL
+                OR patient_summary."firstCD4LabDate" IS NOT NULL
+            )
+        GROUP BY patient_summary."registerDate"
+        UNION ALL
+        SELECT date, 'visits', count(*)
+        FROM visit
+        WHERE date IS NOT NULL
+        GROUP BY date
+        UNION ALL
+        SELECT date, 'investigations', count(*)
+        FROM investigation
+        WHERE date IS NOT NULL
+        GROUP BY date
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("statistics_rollup")
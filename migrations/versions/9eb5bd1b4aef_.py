@@ -0,0 +1,35 @@
+"""index modified_on of the tables the data dict reads
+
+Revision ID: 9eb5bd1b4aef
+Revises: 3c81f0e2d7a5
+Create Date: 2026-10-18 11:58:40.118305
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9eb5bd1b4aef"
+down_revision = "3c81f0e2d7a5"
+branch_labels = None
+depends_on = None
+
+WATCHED_TABLES = [
+    "patient",
+    "visit",
+    "investigation",
+    "partner",
+    "patient_summary",
+]
+
+
+def upgrade():
+    for table in WATCHED_TABLES:
+        op.create_index(
+            f"ix_{table}_modified_on", table, ["modified_on"], unique=False
+        )
+
+
+def downgrade():
+    for table in WATCHED_TABLES:
+        op.drop_index(f"ix_{table}_modified_on", table_name=table)
@@ -0,0 +1,98 @@
+"""add indexes for the patient and date lookups
+
+Revision ID: a944c64d8423
+Revises: 6a9be0a0df34
+Create Date: 2026-10-18 10:14:26.540372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a944c64d8423"
+down_revision = "6a9be0a0df34"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_visit_patientID_date", "visit", ["patientID", "date"], unique=False
+    )
+    op.create_index("ix_visit_date", "visit", ["date"], unique=False)
+    op.create_index(
+        "ix_visit_imported",
+        "visit",
+        ["patientID", "date"],
+        unique=False,
+        postgresql_where=sa.text("imported"),
+    )
+
+    op.create_index(
+        "ix_investigation_patientID_date",
+        "investigation",
+        ["patientID", "date"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_investigation_viralLoad",
+        "investigation",
+        ["patientID", "date"],
+        unique=False,
+        postgresql_where=sa.text('"viralLoad" IS NOT NULL'),
+    )
+    op.create_index(
+        "ix_investigation_absoluteCD4",
+        "investigation",
+        ["patientID", "date"],
+        unique=False,
+        postgresql_where=sa.text('"absoluteCD4" IS NOT NULL'),
+    )
+    op.create_index(
+        "ix_investigation_antiHIV",
+        "investigation",
+        ["patientID", "date"],
+        unique=False,
+        postgresql_where=sa.text('"antiHIV" IS NOT NULL'),
+    )
+    op.create_index(
+        "ix_investigation_imported",
+        "investigation",
+        ["patientID", "date"],
+        unique=False,
+        postgresql_where=sa.text("imported"),
+    )
+
+    op.create_index(
+        "ix_appointment_patientID_date",
+        "appointment",
+        ["patientID", "date"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_appointment_date", "appointment", ["date"], unique=False
+    )
+
+    op.create_index(
+        "ix_partner_patientID", "partner", ["patientID"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_partner_patientID", table_name="partner")
+
+    op.drop_index("ix_appointment_date", table_name="appointment")
+    op.drop_index("ix_appointment_patientID_date", table_name="appointment")
+
+    op.drop_index("ix_investigation_imported", table_name="investigation")
+    op.drop_index("ix_investigation_antiHIV", table_name="investigation")
+    op.drop_index("ix_investigation_absoluteCD4", table_name="investigation")
+    op.drop_index("ix_investigation_viralLoad", table_name="investigation")
+    op.drop_index(
+        "ix_investigation_patientID_date", table_name="investigation"
+    )
+
+    op.drop_index("ix_visit_imported", table_name="visit")
+    op.drop_index("ix_visit_date", table_name="visit")
+    op.drop_index("ix_visit_patientID_date", table_name="visit")
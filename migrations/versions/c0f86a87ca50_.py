@@ -0,0 +1,203 @@
+"""add patient summary table
+
+Revision ID: c0f86a87ca50
+Revises: c6482e16faf5
+Create Date: 2026-10-18 09:12:41.503219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c0f86a87ca50"
+down_revision = "c6482e16faf5"
+branch_labels = None
+depends_on = None
+
+# the summary of every patient, frozen as it is computed at this revision
+FILL_PATIENT_SUMMARY = """
+WITH visits AS (
+    SELECT
+        "patientID",
+        min(date) AS "firstVisit",
+        max(date) AS "lastVisit",
+        min(date) FILTER (WHERE array_length("arvMedications", 1) != 0)
+            AS "arvInitiationDate",
+        (array_agg(id ORDER BY date, id)
+            FILTER (WHERE array_length("arvMedications", 1) != 0))[1]
+            AS "initialARVVisitID",
+        max(date) FILTER (WHERE array_length("arvMedications", 1) != 0)
+            AS "lastARVPrescriptionDate",
+        (array_agg(id ORDER BY date DESC, id)
+            FILTER (WHERE array_length("arvMedications", 1) != 0))[1]
+            AS "currentARVVisitID"
+    FROM visit
+    GROUP BY "patientID"
+), investigations AS (
+    SELECT
+        "patientID",
+        min(date) AS "firstLab",
+        max(date) AS "lastIx",
+        min(date) FILTER (WHERE "antiHIV" IS NOT NULL) AS "firstAntiHIV",
+        (array_agg("antiHIV" ORDER BY date, id)
+            FILTER (WHERE "antiHIV" IS NOT NULL))[1]
+            AS "firstAntiHIVResult",
+        min(date) FILTER (
+            WHERE "antiHIV" != 'Negative' AND "antiHIV" NOT LIKE '%Incon%'
+        ) AS "firstPosAntiHIV",
+        max(date) FILTER (WHERE "viralLoad" IS NOT NULL)
+            AS "lastViralLoadDate",
+        (array_agg("viralLoad" ORDER BY date DESC, id)
+            FILTER (WHERE "viralLoad" IS NOT NULL))[1] AS "lastViralLoad",
+        min(date) FILTER (WHERE "absoluteCD4" IS NOT NULL)
+            AS "firstCD4LabDate",
+        (array_agg("absoluteCD4" ORDER BY date, id)
+            FILTER (WHERE "absoluteCD4" IS NOT NULL))[1] AS "firstCD4Result",
+        (array_agg("percentCD4" ORDER BY date, id)
+            FILTER (WHERE "absoluteCD4" IS NOT NULL))[1]
+            AS "firstPercentCD4Result",
+        max(date) FILTER (WHERE "absoluteCD4" IS NOT NULL)
+            AS "lastCD4LabDate",
+        (array_agg("absoluteCD4" ORDER BY date DESC, id)
+            FILTER (WHERE "absoluteCD4" IS NOT NULL))[1] AS "lastCD4Result",
+        (array_agg("percentCD4" ORDER BY date DESC, id)
+            FILTER (WHERE "absoluteCD4" IS NOT NULL))[1]
+            AS "lastPercentCD4Result"
+    FROM investigation
+    GROUP BY "patientID"
+), partners AS (
+    SELECT "patientID", count(id) AS "numberOfPartners"
+    FROM partner
+    GROUP BY "patientID"
+), diagnoses AS (
+    SELECT visit."patientID", array_agg(DISTINCT dx) AS "DxBeforeARV"
+    FROM visit
+    JOIN visits ON visits."patientID" = visit."patientID"
+    JOIN investigations ON investigations."patientID" = visit."patientID"
+    CROSS JOIN unnest(visit.impression) AS dx
+    WHERE investigations."firstPosAntiHIV" IS NOT NULL
+        AND visit.date <= visits."arvInitiationDate"
+        AND dx NOT ILIKE '%B20%'
+    GROUP BY visit."patientID"
+)
+INSERT INTO patient_summary (
+    "patientID",
+    "numberOfPartners",
+    "registerDate",
+    "lastClinicVisit",
+    "firstAntiHIV",
+    "firstAntiHIVResult",
+    "firstPosAntiHIV",
+    "arvInitiationDate",
+    "initialARV",
+    "timeToStartARV",
+    "lastARVPrescriptionDate",
+    "currentARV",
+    "lastViralLoadDate",
+    "lastViralLoad",
+    "firstCD4LabDate",
+    "firstCD4Result",
+    "firstPercentCD4Result",
+    "lastCD4LabDate",
+    "lastCD4Result",
+    "lastPercentCD4Result",
+    "DxBeforeARV",
+    modified_on
+)
+SELECT
+    patient.id,
+    partners."numberOfPartners",
+    least(visits."firstVisit", investigations."firstLab"),
+    greatest(
+        coalesce(visits."lastVisit", '0001-01-01'),
+        coalesce(investigations."lastIx", '0001-01-01')
+    ),
+    investigations."firstAntiHIV",
+    investigations."firstAntiHIVResult",
+    investigations."firstPosAntiHIV",
+    visits."arvInitiationDate",
+    initial_visit."arvMedications",
+    CASE WHEN visits."arvInitiationDate"
+        - investigations."firstPosAntiHIV" < 0 THEN 0
+        ELSE visits."arvInitiationDate" - investigations."firstPosAntiHIV"
+        END,
+    visits."lastARVPrescriptionDate",
+    current_visit."arvMedications",
+    investigations."lastViralLoadDate",
+    investigations."lastViralLoad",
+    investigations."firstCD4LabDate",
+    investigations."firstCD4Result",
+    investigations."firstPercentCD4Result",
+    CASE WHEN investigations."lastCD4LabDate"
+        != investigations."firstCD4LabDate"
+        THEN investigations."lastCD4LabDate" END,
+    CASE WHEN investigations."lastCD4LabDate"
+        != investigations."firstCD4LabDate"
+        THEN investigations."lastCD4Result" END,
+    CASE WHEN investigations."lastCD4LabDate"
+        != investigations."firstCD4LabDate"
+        THEN investigations."lastPercentCD4Result" END,
+    diagnoses."DxBeforeARV",
+    timezone('utc', now())
+FROM patient
+LEFT JOIN visits ON visits."patientID" = patient.id
+LEFT JOIN investigations ON investigations."patientID" = patient.id
+LEFT JOIN visit AS initial_visit
+    ON initial_visit.id = visits."initialARVVisitID"
+LEFT JOIN visit AS current_visit
+    ON current_visit.id = visits."currentARVVisitID"
+LEFT JOIN partners ON partners."patientID" = patient.id
+LEFT JOIN diagnoses ON diagnoses."patientID" = patient.id
+"""
+
+
+def upgrade():
+    op.create_table(
+        "patient_summary",
+        sa.Column("patientID", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("numberOfPartners", sa.Integer(), nullable=True),
+        sa.Column("registerDate", sa.Date(), nullable=True),
+        sa.Column("lastClinicVisit", sa.Date(), nullable=True),
+        sa.Column("firstAntiHIV", sa.Date(), nullable=True),
+        sa.Column("firstAntiHIVResult", sa.Unicode(), nullable=True),
+        sa.Column("firstPosAntiHIV", sa.Date(), nullable=True),
+        sa.Column("arvInitiationDate", sa.Date(), nullable=True),
+        sa.Column("initialARV", postgresql.ARRAY(sa.Unicode()), nullable=True),
+        sa.Column("timeToStartARV", sa.Integer(), nullable=True),
+        sa.Column("lastARVPrescriptionDate", sa.Date(), nullable=True),
+        sa.Column("currentARV", postgresql.ARRAY(sa.Unicode()), nullable=True),
+        sa.Column("lastViralLoadDate", sa.Date(), nullable=True),
+        sa.Column("lastViralLoad", sa.Float(), nullable=True),
+        sa.Column("firstCD4LabDate", sa.Date(), nullable=True),
+        sa.Column("firstCD4Result", sa.Float(), nullable=True),
+        sa.Column("firstPercentCD4Result", sa.Float(), nullable=True),
+        sa.Column("lastCD4LabDate", sa.Date(), nullable=True),
+        sa.Column("lastCD4Result", sa.Float(), nullable=True),
+        sa.Column("lastPercentCD4Result", sa.Float(), nullable=True),
+        sa.Column(
+            "DxBeforeARV", postgresql.ARRAY(sa.Unicode()), nullable=True
+        ),
+        sa.Column("modified_on", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["patientID"], ["patient.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("patientID"),
+    )
+    op.create_index(
+        op.f("ix_patient_summary_registerDate"),
+        "patient_summary",
+        ["registerDate"],
+        unique=False,
+    )
+
+    # fill the summary of the existing patients, the data dict and the
+    # worklists read it instead of computing it
+    op.execute(FILL_PATIENT_SUMMARY)
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_patient_summary_registerDate"), table_name="patient_summary"
+    )
+    op.drop_table("patient_summary")
@@ -2,6 +2,7 @@ import json
 import logging
 import multiprocessing
 import os
+import signal
 import sys
 import traceback
 from pathlib import Path
@@ -17,7 +18,12 @@ from selenium.common.exceptions import (
 )
 
 # from patient_importer.hcis_importer import HCISImporter
+from hivclinic.helpers.patient_importer.checkpoint_store import CheckpointStore
 from hivclinic.helpers.patient_importer.hcis_importer import HCISImporter
+from hivclinic.helpers.patient_importer.jsonl_store import (
+    appendRecord,
+    compactRecords,
+)
 
 # Config
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -26,6 +32,9 @@ load_dotenv(os.path.join(basedir, ".env"))
 # Multiprocessing config
 ITERATION_COUNT = multiprocessing.cpu_count()
 
+# seconds the collector gets to save the results left after the workers
+COLLECTOR_TIMEOUT = 60
+
 # Selenium config
 MAX_RETRIES = os.getenv("SELENIUM_MAX_RETRIES")
 
@@ -35,13 +44,34 @@ HCIS_USERNAME = os.getenv("HCIS_USERNAME")
 HCIS_PASSWORD = os.getenv("HCIS_PASSWORD")
 HCIS_SID = os.getenv("HCIS_SID")
 
+# page_source parses the page, script reads the grids in the browser
+HCIS_EXTRACT_ENGINE = os.getenv("HCIS_EXTRACT_ENGINE") or "page_source"
+EXTRACT_WITH_SCRIPT = HCIS_EXTRACT_ENGINE == "script"
+
+# parser of the page sources, bs4 or lxml, lxml is to be checked with
+# flask benchmark hcisparsers on saved HCIS pages first
+HCIS_PARSER_ENGINE = os.getenv("HCIS_PARSER_ENGINE") or "bs4"
+
+# page_source compares the page sources, marker polls a marker injected
+# in the page, to be checked on HCIS before it is turned on
+HCIS_WAIT_ENGINE = os.getenv("HCIS_WAIT_ENGINE") or "page_source"
+WAIT_WITH_MARKER = HCIS_WAIT_ENGINE == "marker"
+
+# polling of the waits, seconds between polls growing by the backoff
+HCIS_WAIT_POLL = float(os.getenv("HCIS_WAIT_POLL") or 0.1)
+HCIS_WAIT_BACKOFF = float(os.getenv("HCIS_WAIT_BACKOFF") or 1.5)
+HCIS_WAIT_MAX_POLL = float(os.getenv("HCIS_WAIT_MAX_POLL") or 1.0)
+
 NHSO_USERNAME = os.getenv("NHSO_USERNAME")
 NHSO_PASSWORD = os.getenv("NHSO_PASSWORD")
 
 # File paths
 HN_LIST_FILE = "./hn_list.json"
-IMPORTED_HN_FILE = "./imported_hn.json"
-IMPORTED_INFORMATION = "./patient_details.json"
+IMPORTED_INFORMATION = "./patient_details.jsonl"
+CHECKPOINT_FILE = "./scrape_checkpoints.sqlite3"
+
+# written by older versions, merged into IMPORTED_INFORMATION on start
+LEGACY_IMPORTED_INFORMATION = "./patient_details.json"
 
 logger = logging.getLogger(__name__)
 out_hdlr = logging.StreamHandler(sys.stdout)
@@ -51,13 +81,10 @@ logger.setLevel(logging.DEBUG)
 
 
 def start_workers():
+    # workers requeue the HNs they fail on, results only flow one way
     manager = multiprocessing.Manager()
     queue = manager.Queue()
-    result_list = manager.list()
-    hn_imported = manager.list()
-    result_lock = manager.Lock()
-
-    pool = multiprocessing.Pool(processes=ITERATION_COUNT)
+    results = multiprocessing.Queue()
 
     # get hn list
     with open(HN_LIST_FILE, "r") as file:
@@ -70,55 +97,112 @@ def start_workers():
     if not hn_list:
         hn_list = hn_list_scraper()
 
-    # get imported hn
-    with open(IMPORTED_HN_FILE, "r") as file:
-        try:
-            imported_hn_list = json.load(file)
-
-        except Exception:
-            imported_hn_list = []
+    # get imported hn, dropping the duplicates and a truncated last record
+    stores = [
+        path
+        for path in (LEGACY_IMPORTED_INFORMATION, IMPORTED_INFORMATION)
+        if os.path.exists(path)
+    ]
+    imported_hn_list = compactRecords(stores, IMPORTED_INFORMATION)
+
+    if LEGACY_IMPORTED_INFORMATION in stores:
+        os.rename(
+            LEGACY_IMPORTED_INFORMATION, f"{LEGACY_IMPORTED_INFORMATION}.bak"
+        )
 
     hn_list = list(set(hn_list) - set(imported_hn_list))
 
-    # prepare queue
-    for hn in hn_list:
-        queue.put(hn)
-
-    # add list of imported hn
-    for hn in imported_hn_list:
-        hn_imported.append(hn)
+    # sections of the saved records are no longer needed
+    checkpoints = CheckpointStore(CHECKPOINT_FILE)
+    checkpoints.discard(imported_hn_list)
+    started_hn_list = set(checkpoints.hns())
+    checkpoints.close()
 
-    # add imported information into the list
-    with open(IMPORTED_INFORMATION, "r") as file:
-        try:
-            imported_patients = json.load(file)
+    # prepare queue, finishing the HNs with sections scraped first
+    hn_list.sort(key=lambda hn: hn not in started_hn_list)
 
-        except Exception:
-            imported_patients = []
+    for hn in hn_list:
+        queue.put(hn)
 
-    for imported_patient in imported_patients:
-        result_list.append(imported_patient)
+    collector = multiprocessing.Process(
+        target=collect_results,
+        args=(
+            results,
+            len(imported_hn_list),
+            len(imported_hn_list) + len(hn_list),
+        ),
+    )
+    collector.start()
 
-    for worker_id in range(ITERATION_COUNT):
-        pool.apply_async(
-            selenium_task,
-            args=(worker_id, queue, hn_imported, result_list, result_lock),
+    workers = [
+        multiprocessing.Process(
+            target=selenium_task, args=(worker_id, queue, results)
         )
+        for worker_id in range(ITERATION_COUNT)
+    ]
 
     # start workers
     try:
-        pool.close()
-        pool.join()
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
 
     except KeyboardInterrupt:
-        logger.warning("[Main] Caught KeyboardInterrupt, terminating workers")
-        pool.terminate()
-        pool.join()
+        logger.warning("[Main] Caught KeyboardInterrupt, waiting for workers")
+
+        # the workers got the SIGINT too, they leave their loop and quit
+        for worker in workers:
+            worker.join()
 
     finally:
+        # the collector saves the results left on the queue, then stops
+        results.put(None)
+        collector.join(COLLECTOR_TIMEOUT)
+
+        if collector.is_alive():
+            logger.error("[Main] Collector did not stop, terminating it")
+            collector.terminate()
+
         logger.info("[Main] Task finished, terminating")
 
 
+def collect_results(results, done_count, hn_count):
+    # keep saving on KeyboardInterrupt, main stops the collector
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    checkpoints = CheckpointStore(CHECKPOINT_FILE)
+
+    for current_hn, patient_details in iter(results.get, None):
+        appendRecord(IMPORTED_INFORMATION, patient_details)
+        checkpoints.discard([current_hn])
+
+        done_count = done_count + 1
+        logger.info(
+            f"[Collector] Saved HN {current_hn} "
+            f"(Done {done_count} of {hn_count})"
+        )
+
+    checkpoints.close()
+
+
+def hcis_importer():
+    return HCISImporter(
+        seleniumServerURI=SELENIUM_SERVER_URI,
+        hcis_server=HCIS_SERVER,
+        hcis_username=HCIS_USERNAME,
+        hcis_password=HCIS_PASSWORD,
+        hcis_sid=HCIS_SID,
+        extract_with_script=EXTRACT_WITH_SCRIPT,
+        parser_backend=HCIS_PARSER_ENGINE,
+        wait_poll=HCIS_WAIT_POLL,
+        wait_backoff=HCIS_WAIT_BACKOFF,
+        wait_max_poll=HCIS_WAIT_MAX_POLL,
+        wait_with_marker=WAIT_WITH_MARKER,
+    )
+
+
 def hn_list_scraper():
     logger.info("[Main] Scraping HN list.")
 
@@ -128,13 +212,7 @@ def hn_list_scraper():
         try:
             retries_count = retries_count + 1
 
-            hcis = HCISImporter(
-                seleniumServerURI=SELENIUM_SERVER_URI,
-                hcis_server=HCIS_SERVER,
-                hcis_username=HCIS_USERNAME,
-                hcis_password=HCIS_PASSWORD,
-                hcis_sid=HCIS_SID,
-            )
+            hcis = hcis_importer()
 
             hn_list = hcis.getPatientList()
 
@@ -161,148 +239,150 @@ def hn_list_scraper():
     return hn_list
 
 
-def selenium_task(worker_id, queue, hn_imported, result_list, result_lock):
+def selenium_task(worker_id, queue, results):
     logger.info(f"[{worker_id}] Starting...")
 
-    hcis = HCISImporter(
-        seleniumServerURI=SELENIUM_SERVER_URI,
-        hcis_server=HCIS_SERVER,
-        hcis_username=HCIS_USERNAME,
-        hcis_password=HCIS_PASSWORD,
-        hcis_sid=HCIS_SID,
-    )
+    checkpoints = CheckpointStore(CHECKPOINT_FILE)
 
-    while not queue.empty():
-        current_hn = queue.get()
+    hcis = hcis_importer()
 
-        patient_details = {
-            "visits": None,
-            "ix": None,
-            "med": None,
-            "dermographic": None,
-        }
-        retries_count = 1
+    try:
+        while not queue.empty():
+            current_hn = queue.get()
+
+            patient_details = {
+                "visits": None,
+                "ix": None,
+                "med": None,
+                "dermographic": None,
+            }
+            patient_details.update(checkpoints.sections(current_hn))
+            retries_count = 1
 
-        with result_lock:
             logger.info(
                 f"[{worker_id}] Importing HN {current_hn} "
-                f"(Done {len(list(hn_imported))} - "
-                f"Remaining {queue.qsize()})"
+                f"(Remaining {queue.qsize()})"
             )
 
-        while retries_count <= MAX_RETRIES:
-            retries_count = retries_count + 1
-
-            try:
-                if patient_details["ix"] is None:
-                    logger.info(
-                        f"[{worker_id}] Importing investigations of "
-                        f"HN {current_hn} from HCIS."
-                    )
-                    patient_details["ix"] = hcis.getInvestigations(current_hn)
-
-                if patient_details["med"] is None:
-                    logger.info(
-                        f"[{worker_id}] Importing medications of "
-                        f"HN {current_hn} from HCIS."
-                    )
-                    patient_details["med"] = hcis.getMedications(current_hn)
+            while retries_count <= MAX_RETRIES:
+                retries_count = retries_count + 1
 
-                if patient_details["dermographic"] is None:
-                    logger.info(
-                        f"[{worker_id}] Importing dermographics of "
-                        f"HN {current_hn} from HCIS."
-                    )
-                    patient_details["dermographic"] = hcis.getDermographic(
-                        hn=current_hn,
-                        nhso_username=NHSO_USERNAME,
-                        nhso_password=NHSO_PASSWORD,
-                    )
+                try:
+                    if patient_details["ix"] is None:
+                        logger.info(
+                            f"[{worker_id}] Importing investigations of "
+                            f"HN {current_hn} from HCIS."
+                        )
+                        patient_details["ix"] = hcis.getInvestigations(
+                            current_hn
+                        )
+                        checkpoints.save(current_hn, ix=patient_details["ix"])
+
+                    if patient_details["med"] is None:
+                        logger.info(
+                            f"[{worker_id}] Importing medications of "
+                            f"HN {current_hn} from HCIS."
+                        )
+                        patient_details["med"] = hcis.getMedications(
+                            current_hn
+                        )
+                        checkpoints.save(
+                            current_hn, med=patient_details["med"]
+                        )
+
+                    if patient_details["dermographic"] is None:
+                        logger.info(
+                            f"[{worker_id}] Importing dermographics of "
+                            f"HN {current_hn} from HCIS."
+                        )
+                        patient_details["dermographic"] = hcis.getDermographic(
+                            hn=current_hn,
+                            nhso_username=NHSO_USERNAME,
+                            nhso_password=NHSO_PASSWORD,
+                        )
+                        checkpoints.save(
+                            current_hn,
+                            dermographic=patient_details["dermographic"],
+                        )
+
+                    if patient_details["visits"] is None:
+                        logger.info(
+                            f"[{worker_id}] Importing visits of HN "
+                            f"{current_hn} from HCIS."
+                        )
+                        cares, patient_details["visits"] = hcis.getVisits(
+                            current_hn
+                        )
+
+                        # add hospitals names in dermographics
+                        patient_details["dermographic"]["cares"] = cares
+                        checkpoints.save(
+                            current_hn,
+                            visits=patient_details["visits"],
+                            dermographic=patient_details["dermographic"],
+                        )
 
-                if patient_details["visits"] is None:
                     logger.info(
-                        f"[{worker_id}] Importing visits of HN "
+                        f"[{worker_id}] Done importing patient HN "
                         f"{current_hn} from HCIS."
                     )
-                    cares, patient_details["visits"] = hcis.getVisits(
-                        current_hn
-                    )
 
-                    # add hospitals names in dermographics
-                    patient_details["dermographic"]["cares"] = cares
+                    # the collector saves the record
+                    results.put((current_hn, patient_details))
 
-                logger.info(
-                    f"[{worker_id}] Done importing patient HN "
-                    f"{current_hn} from HCIS."
-                )
+                    break
 
-                with result_lock:
-                    hn_imported.append(current_hn)
-                    result_list.append(patient_details)
+                except (
+                    ElementNotVisibleException,
+                    NoSuchElementException,
+                    StaleElementReferenceException,
+                    TimeoutException,
+                    JavascriptException,
+                ):
+                    logger.error(
+                        f"[{worker_id}] Error detected, see the traceback"
+                        " below, reloading the page."
+                    )
+                    traceback.print_exc()
 
-                    # write results to file
-                    with open(IMPORTED_HN_FILE, "w") as file:
-                        json.dump(list(hn_imported), file)
+                except Exception:
+                    logger.error(
+                        f"[{worker_id}] Error detected,"
+                        " see the traceback below."
+                    )
+                    traceback.print_exc()
 
-                    with open(IMPORTED_INFORMATION, "w") as file:
-                        json.dump(list(result_list), file)
+                    # the web driver is lost/dead
+                    logger.error(
+                        f"[{worker_id}] Dectected problems "
+                        "with IEWebDriver, restarting."
+                    )
 
-                break
+                    try:
+                        hcis.quit()
 
-            except (
-                ElementNotVisibleException,
-                NoSuchElementException,
-                StaleElementReferenceException,
-                TimeoutException,
-                JavascriptException,
-            ):
-                logger.error(
-                    f"[{worker_id}] Error detected, see the traceback"
-                    " below, reloading the page."
-                )
-                traceback.print_exc()
+                    except Exception:
+                        pass
 
-            except Exception:
-                logger.error(
-                    f"[{worker_id}] Error detected,"
-                    " see the traceback below."
-                )
-                traceback.print_exc()
+                    finally:
+                        hcis = hcis_importer()
 
-                # the web driver is lost/dead
+                    logger.info(f"[{worker_id}] Recovered from error.")
+
+            # only when every retry failed, a saved HN left the loop by break
+            else:
                 logger.error(
-                    f"[{worker_id}] Dectected problems "
-                    "with IEWebDriver, restarting."
+                    f"[{worker_id}] Unable to get information "
+                    f"for HN {current_hn}, putting the HN "
+                    "at the end of the queue."
                 )
 
-                try:
-                    hcis.quit()
+                queue.put(current_hn)
 
-                except Exception:
-                    pass
-
-                finally:
-                    hcis = HCISImporter(
-                        seleniumServerURI=SELENIUM_SERVER_URI,
-                        hcis_server=HCIS_SERVER,
-                        hcis_username=HCIS_USERNAME,
-                        hcis_password=HCIS_PASSWORD,
-                        hcis_sid=HCIS_SID,
-                    )
-
-                logger.info(f"[{worker_id}] Recovered from error.")
-
-            finally:
-                if retries_count > MAX_RETRIES:
-                    logger.error(
-                        f"[{worker_id}] Unable to get information "
-                        f"for HN {current_hn}, putting the HN "
-                        "at the end of the queue."
-                    )
+    except KeyboardInterrupt:
+        logger.warning(f"[{worker_id}] Caught KeyboardInterrupt, stopping")
 
-                    queue.put(current_hn)
-
-                    break
+    checkpoints.close()
 
     try:
         hcis.quit()
@@ -317,9 +397,6 @@ def create_files():
     hn_list_file = Path(HN_LIST_FILE)
     hn_list_file.touch()
 
-    imported_hn_file = Path(IMPORTED_HN_FILE)
-    imported_hn_file.touch()
-
     imported_information_file = Path(IMPORTED_INFORMATION)
     imported_information_file.touch()
 
@@ -0,0 +1,6 @@
+import os
+
+# hivclinic reads its config on import
+os.environ.setdefault("FLASK_ENV", "testing")
+os.environ.setdefault("OVERDUE_VL_MONTHS", "12")
+os.environ.setdefault("OVERDUE_FU_MONTHS", "12")
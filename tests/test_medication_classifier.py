@@ -0,0 +1,138 @@
+import pytest
+
+from hivclinic.helpers.medication_classifier.medication_classifier import (
+    HIV_IMPRESSION,
+    LATENT_TB_IMPRESSION,
+    MEDICATION_CLASSIFIERS,
+    SYPHILIS_IMPRESSION,
+    TB_IMPRESSION,
+)
+
+# HCIS medication lists and how they are classified
+CORPUS = [
+    ([], {"arv": [], "tb": [], "oi": [], "impression": []}),
+    # the TENO-EM and Rilpivirine of PEP are not ARVs of the patient,
+    # the (TDF300+FTC200) in the name still is
+    (
+        ["(PEP)TENO-EM (TDF300+FTC200) tab", "(PEP)Rilpivirine 25 mg tab"],
+        {"arv": ["TDF300+FTC200"], "tb": [], "oi": [], "impression": []},
+    ),
+    (
+        ["TENO-EM (TDF300+FTC200) tab", "Rilpivirine 25 mg tab"],
+        {
+            "arv": ["Rilpivirine", "TDF300+FTC200", "TENO-EM"],
+            "tb": [],
+            "oi": [],
+            "impression": [HIV_IMPRESSION],
+        },
+    ),
+    # PrEP is not a treatment
+    (
+        ["PrEP(TDF300+FTC200) tab"],
+        {"arv": [], "tb": [], "oi": [], "impression": []},
+    ),
+    # LAMIVIR is Lamivudine, listed and counted once
+    (
+        [
+            "LAMIVIR 150 mg tab",
+            "Lamivudine 150 mg tab",
+            "Nevirapine 200 mg tab",
+        ],
+        {
+            "arv": ["Lamivudine", "Nevirapine"],
+            "tb": [],
+            "oi": [],
+            "impression": [],
+        },
+    ),
+    (
+        [
+            "Lamivudine 150 mg tab",
+            "Nevirapine 200 mg tab",
+            "Zidovudine 300 mg cap",
+        ],
+        {
+            "arv": ["Lamivudine", "Nevirapine", "Zidovudine"],
+            "tb": [],
+            "oi": [],
+            "impression": [HIV_IMPRESSION],
+        },
+    ),
+    (
+        ["GPO-VIR S30 tab"],
+        {
+            "arv": ["GPO-VIR S30"],
+            "tb": [],
+            "oi": [],
+            "impression": [HIV_IMPRESSION],
+        },
+    ),
+    # isoniazid alone is the treatment of latent TB
+    (
+        ["Isoniazid 100 mg tab", "Vitamin B6 50 mg tab"],
+        {
+            "arv": [],
+            "tb": ["Isoniazid"],
+            "oi": [],
+            "impression": [LATENT_TB_IMPRESSION],
+        },
+    ),
+    (
+        ["I.N.H. 100 mg tab"],
+        {
+            "arv": [],
+            "tb": ["Isoniazid"],
+            "oi": [],
+            "impression": [LATENT_TB_IMPRESSION],
+        },
+    ),
+    (
+        [
+            "Ethambutol 400 mg tab",
+            "Isoniazid 100 mg tab",
+            "Pyrazinamide 500 mg tab",
+            "Rifampicin 300 mg cap",
+        ],
+        {
+            "arv": [],
+            "tb": ["Ethambutol", "Isoniazid", "Pyrazinamide", "Rifampicin"],
+            "oi": [],
+            "impression": [TB_IMPRESSION],
+        },
+    ),
+    # OI medications count only with B20
+    (
+        ["Co-Trimoxazole 80/400 mg tab", "Fluconazole 200 mg cap"],
+        {"arv": [], "tb": [], "oi": [], "impression": []},
+    ),
+    (
+        [
+            "Azithromycin 250 mg tab",
+            "Co-Trimoxazole 80/400 mg tab",
+            "TEEVIR (TDF300+FTC200+EFV600) tab",
+        ],
+        {
+            "arv": ["Teevir"],
+            "tb": [],
+            "oi": ["Azithromycin", "Bactrim"],
+            "impression": [HIV_IMPRESSION],
+        },
+    ),
+    (
+        ["Benzathine Penicillin G 1.2 MU inj"],
+        {"arv": [], "tb": [], "oi": [], "impression": [SYPHILIS_IMPRESSION]},
+    ),
+]
+
+
+@pytest.mark.parametrize("engine", sorted(MEDICATION_CLASSIFIERS))
+@pytest.mark.parametrize("medications, expected", CORPUS)
+def test_classify_medications(engine, medications, expected):
+    classified = MEDICATION_CLASSIFIERS[engine](medications)
+
+    assert classified == {
+        "arvMedications": expected["arv"],
+        "tbMedications": expected["tb"],
+        "oiMedications": expected["oi"],
+        "impression": sorted(expected["impression"]),
+    }